@@ -0,0 +1,21 @@
+import os
+
+from .base import SandboxBackend, SandboxNotFound, SandboxUnavailable, SANDBOX_PORT, hx, kernel_path
+
+# Where sandboxes run: kubernetes (pods), docker (containers on the local daemon) or
+# local (child processes of the API, for development, CI and single-node deployments)
+SANDBOX_BACKEND = os.environ.get("SANDBOX_BACKEND", "kubernetes")
+
+def get_backend(name=None):
+    """The configured backend; its client library is only imported when it is selected"""
+    name = name or SANDBOX_BACKEND
+    if name == "kubernetes":
+        from .kubernetes import KubernetesBackend, load_client
+        return KubernetesBackend(load_client() if os.environ.get("IS_SANDBOX") != "1" else None)
+    if name == "docker":
+        from .docker import DockerBackend, load_client
+        return DockerBackend(load_client() if os.environ.get("IS_SANDBOX") != "1" else None)
+    if name == "local":
+        from .local import LocalBackend
+        return LocalBackend()
+    raise ValueError(f"Unknown SANDBOX_BACKEND '{name}', expected kubernetes, docker or local")
@@ -0,0 +1,369 @@
+import os
+import re
+import hmac
+import time
+import uuid
+import asyncio
+import hashlib
+import secrets
+from abc import ABC, abstractmethod
+
+import httpx
+import websockets
+from fastapi import HTTPException
+
+from utils.channel import get_channel
+from utils.artifacts import artifact_token, ARTIFACT_TOKEN
+from utils.profiles import DEFAULT_PROFILE
+from utils.placement import SHARED_MAX_KERNELS, split_sandbox_id, tenant_id, pick_pod
+from utils.metrics import POD_READY_SECONDS
+from utils.tracing import traced, inject_traceparent
+from utils.log import get_logger
+
+log = get_logger("backends")
+
+SANDBOX_PREFIX = "sandbox-"
+SANDBOX_PORT = 8000
+LABEL_VALUE = re.compile(r"[A-Za-z0-9]([A-Za-z0-9._-]{0,61}[A-Za-z0-9])?")
+CHECKPOINT_ENV = ("KERNEL_CHECKPOINT", "KERNEL_CHECKPOINT_MAX_BYTES", "KERNEL_CHECKPOINT_IDLE", "KERNEL_CHECKPOINT_SKIP")
+RESULT_CACHE_ENV = ("KERNEL_RESULT_CACHE", "KERNEL_RESULT_CACHE_SIZE", "KERNEL_RESULT_CACHE_MAX_CHARS")
+# Shared hosts run as root to give every tenant kernel its own uid (utils/isolation.py), with only the
+# capabilities that takes: chown and chmod of tenant directories, setuid/setgid into the tenant,
+# writing uploads into tenant-owned directories and stopping tenant kernels
+SHARED_CAPABILITIES = ("CHOWN", "DAC_OVERRIDE", "FOWNER", "SETUID", "SETGID", "KILL")
+TRACE_ENV = ("TRACE_EXPORT", "TRACE_FILE", "TRACE_SAMPLE_RATE", "OTEL_EXPORTER_OTLP_ENDPOINT")
+# Sandbox servers only answer requests carrying their host's token (sandbox_app.py), derived from this
+# secret and the host name. Set it for sandboxes to stay reachable across API restarts and replicas.
+SANDBOX_SECRET = os.environ.get("SANDBOX_SECRET") or secrets.token_hex(32)
+
+hx = httpx.AsyncClient(timeout=10000.0, event_hooks={"request": [inject_traceparent]})
+
+class SandboxNotFound(HTTPException):
+    def __init__(self, name):
+        super().__init__(status_code=404, detail=f"Sandbox {name} not found")
+
+class SandboxUnavailable(HTTPException):
+    def __init__(self, detail="Sandbox not ready"):
+        super().__init__(status_code=503, detail=detail)
+
+def sandbox_record(name, status, ready=False, ip=None, labels=None, deleting=False):
+    """What every backend reports for one sandbox host (a pod, container or process)"""
+    labels = labels or {}
+    return {
+        "name": name,
+        # Pending | Running | Succeeded | Failed, as for pods
+        "status": status,
+        "ready": ready,
+        "ip": ip,
+        "shared": labels.get("sbx_shared") == "1",
+        "profile": labels.get("sbx_profile"),
+        "session_id": labels.get("sbx_session"),
+        "deleting": deleting
+    }
+
+def sandbox_token(name):
+    return hmac.new(SANDBOX_SECRET.encode(), name.encode(), hashlib.sha256).hexdigest()
+
+def kernel_path(sandbox_id, path):
+    # Tenant kernels in shared hosts are addressed under /kernels/{kernel_id}
+    _, kernel_id = split_sandbox_id(sandbox_id)
+    return f"/kernels/{kernel_id}{path}" if kernel_id else path
+
+class SandboxBackend(ABC):
+    """Where sandbox servers (sandbox_app.py) run and how the API reaches them.
+
+    Backends start, find and stop sandbox hosts. Everything past that - kernels, execution,
+    uploads, stats - goes through the sandbox server's own HTTP API and is shared here.
+    Sandbox ids are host names, or "<host>.<kernel id>" for tenants of a shared host.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        # Hosts started by this process whose startup time is still to be recorded: name -> (profile, started)
+        self.starting = {}
+        self.ready_names = set()
+        self.pending_kernels = {}
+        self.placement_lock = asyncio.Lock()
+
+    @property
+    def available(self):
+        return True
+
+    # Lifecycle, per backend
+
+    @abstractmethod
+    async def create(self, lang, session_id=None, profile=DEFAULT_PROFILE, shared=False):
+        """Start a sandbox host without waiting for it; returns its name"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, name):
+        """The host's record (sandbox_record), or SandboxNotFound"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def base_url(self, name):
+        """http://host:port of the host's sandbox server"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, name):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def files(self, name):
+        """A directory listing of the host's /app, as text"""
+        raise NotImplementedError
+
+    async def delete_many(self, names):
+        await asyncio.gather(*(self.delete(name) for name in names))
+
+    async def oom_killed(self, name, wait=5.0):
+        return False
+
+    async def start(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def labels(self, name, lang, session_id=None, profile=DEFAULT_PROFILE, shared=False):
+        labels = {"app": "sandbox", "sbx": "1", "sbx_lang": lang, "sbx_profile": profile, "pod-name": name}
+        if session_id and LABEL_VALUE.fullmatch(session_id):
+            labels["sbx_session"] = session_id
+        if shared:
+            labels["sbx_shared"] = "1"
+        return labels
+
+    def new_name(self):
+        return f"{SANDBOX_PREFIX}{str(uuid.uuid4())[:8]}"
+
+    @abstractmethod
+    def default_api_url(self):
+        raise NotImplementedError
+
+    def api_url(self):
+        # Where sandboxes reach the API, for artifacts and the package proxy
+        return os.environ.get("SANDBOX_CALLBACK_URL") or self.default_api_url()
+
+    def sandbox_env(self, name, shared=False):
+        """Environment for the sandbox server, the same on every backend"""
+        api_url = self.api_url()
+        env = {
+            "IS_SANDBOX": "1",
+            "PORT": str(SANDBOX_PORT),
+            "SANDBOX_NAME": name,
+            "SANDBOX_TOKEN": sandbox_token(name),
+            "ARTIFACT_STORE_URL": os.environ.get("ARTIFACT_STORE_URL", f"{api_url}/api/artifacts"),
+            # Good for uploads from this host only
+            "ARTIFACT_TOKEN": artifact_token(name) if ARTIFACT_TOKEN else "",
+            "SANDBOX_PRELOAD": os.environ.get("SANDBOX_PRELOAD", "numpy,pandas,matplotlib.pyplot")
+        }
+        # Point pip inside sandboxes at the API's caching package proxy (routers/pypi.py)
+        if os.environ.get("SANDBOX_PIP_PROXY", "1") == "1":
+            env["PIP_INDEX_URL"] = f"{api_url}/pypi/simple/"
+            env["PIP_TRUSTED_HOST"] = httpx.URL(api_url).host
+        # Opt-in kernel state checkpoints ride along in the workspace snapshot
+        env.update({name: os.environ[name] for name in CHECKPOINT_ENV if name in os.environ})
+        # Opt-in result cache for repeated cells (utils/kernel.py)
+        env.update({name: os.environ[name] for name in RESULT_CACHE_ENV if name in os.environ})
+        # Sandbox servers join the API's traces and export to the same place
+        env["OTEL_SERVICE_NAME"] = "caesarion-sandbox"
+        env.update({name: os.environ[name] for name in TRACE_ENV if name in os.environ})
+        if shared:
+            # Multi-tenant host: kernels are started per session through POST /kernels/{id}
+            env.update({
+                "SANDBOX_MODE": "shared",
+                "SANDBOX_MAX_KERNELS": str(SHARED_MAX_KERNELS),
+                "KERNEL_MEMORY_LIMIT": os.environ.get("KERNEL_MEMORY_LIMIT", str(1024 * 1024 * 1024))
+            })
+        return env
+
+    def started(self, name, profile):
+        self.starting[name] = (profile, time.time())
+
+    def mark_ready(self, name):
+        self.ready_names.add(name)
+        if name in self.starting:
+            profile, started = self.starting.pop(name)
+            POD_READY_SECONDS.labels(profile=profile).observe(time.time() - started)
+
+    def forget(self, name):
+        self.starting.pop(name, None)
+        self.ready_names.discard(name)
+
+    def host_key(self, name):
+        """The name a host was started under, which its token is derived from"""
+        return name
+
+    def headers(self, sandbox_id):
+        """Headers for requests to the sandbox server hosting sandbox_id"""
+        return {"X-Sandbox-Token": sandbox_token(self.host_key(split_sandbox_id(sandbox_id)[0]))}
+
+    # Addressing and waiting, over the sandbox server's HTTP API
+
+    async def url(self, sandbox_id, path, scheme="http"):
+        base_url = await self.base_url(split_sandbox_id(sandbox_id)[0])
+        if scheme != "http":
+            base_url = scheme + base_url[len("http"):]
+        return f"{base_url}{kernel_path(sandbox_id, path)}"
+
+    async def server_url(self, name):
+        """Base URL that reaches the server before it reports ready; the same as base_url by default"""
+        return await self.base_url(name)
+
+    async def probe(self, name, path="/health"):
+        try:
+            response = await hx.get(f"{await self.base_url(name)}{path}", timeout=1.0)
+            return response.is_success
+        except (httpx.HTTPError, HTTPException):
+            return False
+
+    @traced("sandbox.wait_server")
+    async def wait_started(self, name, timeout=300):
+        """Wait for the host's HTTP server, without waiting for readiness (kernel preload)"""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            try:
+                base_url = await self.server_url(name)
+                response = await hx.get(f"{base_url}/health", timeout=2.0)
+                if response.is_success:
+                    return base_url
+            except SandboxNotFound:
+                raise
+            except (httpx.HTTPError, HTTPException):
+                pass
+            await asyncio.sleep(1)
+        raise HTTPException(status_code=504, detail="Sandbox server startup timeout")
+
+    @traced("sandbox.wait_ready")
+    async def wait_ready(self, name, timeout=300):
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            if await self.probe(name, "/health/ready"):
+                self.mark_ready(name)
+                return await self.get(name)
+            await asyncio.sleep(1)
+        raise HTTPException(status_code=504, detail="Sandbox startup timeout")
+
+    # Shared hosts
+
+    async def tenants(self, name):
+        """Tenant kernel id -> memory in use, as reported by a shared host"""
+        try:
+            response = await hx.get(await self.url(name, "/kernels"), headers=self.headers(name), timeout=5.0)
+            response.raise_for_status()
+            return {kernel_id: usage["memory_bytes"] for kernel_id, usage in response.json()["kernels"].items()}
+        except (httpx.HTTPError, HTTPException, KeyError, ValueError):
+            return {}
+
+    @traced("sandbox.claim")
+    async def claim(self, lang):
+        """Start a kernel on the fullest shared host with room, creating a host if none has.
+
+        Returns (tenant sandbox id, "warm" | "cold").
+        """
+        kernel_id = f"k{uuid.uuid4().hex[:8]}"
+        start = "warm"
+
+        async with self.placement_lock:
+            live = [
+                record for record in await self.list()
+                if record["shared"] and not record["deleting"] and record["status"] in ("Pending", "Running")
+            ]
+            running = [record["name"] for record in live if record["status"] == "Running"]
+            usage = dict(zip(running, await asyncio.gather(*(self.tenants(name) for name in running))))
+            loads = {record["name"]: list(usage.get(record["name"], {}).values()) for record in live}
+
+            name = pick_pod(loads, self.pending_kernels)
+            if name is None:
+                name = await self.create(lang, shared=True)
+                log.info("Shared sandbox created", extra={"sandbox_id": name, "backend": self.name})
+                start = "cold"
+            self.pending_kernels[name] = self.pending_kernels.get(name, 0) + 1
+
+        try:
+            base_url = await self.wait_started(name)
+            response = await hx.post(f"{base_url}/kernels/{kernel_id}", headers=self.headers(name), timeout=300.0)
+            if not response.is_success:
+                raise SandboxUnavailable(f"Shared sandbox {name} refused a kernel: {response.text}")
+        finally:
+            self.pending_kernels[name] -= 1
+            if not self.pending_kernels[name]:
+                del self.pending_kernels[name]
+
+        return tenant_id(name, kernel_id), start
+
+    async def release(self, sandbox_id):
+        """Stop a tenant's kernel; its shared host stays up for the other tenants"""
+        name, kernel_id = split_sandbox_id(sandbox_id)
+        await hx.delete(await self.url(name, f"/kernels/{kernel_id}"), headers=self.headers(name), timeout=30.0)
+
+    # Execution, uploads and stats
+
+    async def execute_stream(self, sandbox_id, code, execution_id, on_heartbeat=None, allow_stdin=False):
+        """NDJSON output of one execution, as text chunks.
+
+        Prefers the persistent channel; falls back to a plain POST for sandboxes without /ws.
+        input() prompts are only relayed over the channel, and only with allow_stdin.
+        """
+        try:
+            channel = await get_channel(
+                sandbox_id,
+                await self.url(sandbox_id, "/ws", "ws"),
+                on_heartbeat=on_heartbeat,
+                headers=self.headers(sandbox_id)
+            )
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+            log.warning("Channel unavailable, using HTTP", extra={"sandbox_id": sandbox_id, "error": str(e)})
+            channel = None
+
+        if channel is not None:
+            async for data in channel.execute(code, execution_id, allow_stdin):
+                yield data
+            return
+
+        async for text in self.post_stream(sandbox_id, "/execute", {"code": code}):
+            yield text
+
+    async def execute_batch_stream(self, sandbox_id, cells, stop_on_error=True):
+        """NDJSON output of several cells run in order, tagged per cell (see the sandbox's /execute_batch)"""
+        async for text in self.post_stream(sandbox_id, "/execute_batch", {"cells": cells, "stop_on_error": stop_on_error}):
+            yield text
+
+    async def replay_stream(self, sandbox_id, cells, stop_on_error=True):
+        """Like execute_batch_stream, but cells the kernel's last replay ran unchanged are not run again"""
+        async for text in self.post_stream(sandbox_id, "/notebook/replay", {"cells": cells, "stop_on_error": stop_on_error}):
+            yield text
+
+    async def post_stream(self, sandbox_id, path, payload):
+        async with hx.stream("POST", await self.url(sandbox_id, path), json=payload, headers=self.headers(sandbox_id)) as response:
+            if not response.is_success:
+                raise HTTPException(status_code=response.status_code, detail=f"Execution failed with status {response.status_code}")
+            async for text in response.aiter_text():
+                yield text
+
+    async def upload(self, sandbox_id, filename, fileobj, content_type=None):
+        """Send a file to the sandbox server's /upload route, streamed from fileobj"""
+        response = await hx.post(
+            await self.url(sandbox_id, "/upload"),
+            headers=self.headers(sandbox_id),
+            files={"file": (filename, fileobj, content_type or "application/octet-stream")},
+            timeout=300.0
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def stats(self, sandbox_id, timeout=1.0):
+        """The sandbox server's /stats, or None if it does not answer in time"""
+        try:
+            response = await hx.get(await self.url(sandbox_id, "/stats"), headers=self.headers(sandbox_id), timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, HTTPException, ValueError):
+            return None
@@ -0,0 +1,251 @@
+import os
+import asyncio
+
+import docker
+from fastapi import HTTPException
+
+from utils.profiles import PROFILES, DEFAULT_PROFILE, to_bytes, to_cores
+from utils.placement import SHARED_POD_MEMORY
+from .base import (
+    SandboxBackend, SandboxNotFound, SandboxUnavailable, sandbox_record, log, SANDBOX_PORT, SANDBOX_PREFIX, SHARED_CAPABILITIES
+)
+
+IMAGE_NAME = os.environ.get("SANDBOX_DOCKER_IMAGE", "fastapi-jupyter-server:latest")
+# User-defined bridge network the sandboxes join; the API reaches them by container IP on it, so
+# no ports are published. An API running in a container must be attached to this network too.
+DOCKER_NETWORK = os.environ.get("SANDBOX_DOCKER_NETWORK", "caesarion-sandboxes")
+# Containers of the default profile kept started and unclaimed, so a new session skips container start
+# and kernel preload. They are renamed from sandbox-pool-* to sandbox-* when claimed.
+DOCKER_POOL_SIZE = int(os.environ.get("SANDBOX_DOCKER_POOL", "2"))
+POOL_PREFIX = f"{SANDBOX_PREFIX}pool-"
+# Containers stopped and removed at once when the reaper deletes several sandboxes
+REAP_BATCH = int(os.environ.get("SANDBOX_DOCKER_REAP_BATCH", "8"))
+
+STATUSES = {"created": "Pending", "restarting": "Pending", "running": "Running", "paused": "Running"}
+
+def container_ip(container):
+    networks = (container.attrs.get("NetworkSettings") or {}).get("Networks") or {}
+    return (networks.get(DOCKER_NETWORK) or {}).get("IPAddress") or None
+
+def load_client():
+    try:
+        return docker.from_env()
+    except docker.errors.DockerException as e:
+        log.warning("No Docker daemon found; sandbox routes are unavailable", extra={"error": str(e)})
+        return None
+
+class DockerBackend(SandboxBackend):
+    """One container per sandbox on the local Docker daemon, labelled sbx=1.
+
+    The docker SDK is synchronous, so every call runs in a worker thread.
+    """
+
+    name = "docker"
+
+    def __init__(self, client=None):
+        super().__init__()
+        self.client = client
+        # Container name -> base URL; container IPs are fixed for a container's lifetime
+        self.endpoints = {}
+        # Container name -> the name it was started under; claimed pool containers are renamed
+        self.keys = {}
+        self.pool = []
+        self.filling = 0
+        self.network = None
+
+    @property
+    def available(self):
+        return self.client is not None
+
+    def default_api_url(self):
+        return f"http://host.docker.internal:{SANDBOX_PORT}"
+
+    def endpoint(self, container):
+        self.keys[container.name] = container.labels.get("pod-name", container.name)
+        ip = container_ip(container)
+        if ip:
+            self.endpoints[container.name] = f"http://{ip}:{SANDBOX_PORT}"
+        return self.endpoints.get(container.name)
+
+    def host_key(self, name):
+        return self.keys.get(name, name)
+
+    async def container(self, name):
+        try:
+            container = await asyncio.to_thread(self.client.containers.get, name)
+        except docker.errors.NotFound:
+            raise SandboxNotFound(name)
+        except docker.errors.APIError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if "sbx" not in container.labels:
+            raise SandboxNotFound(name)
+        self.endpoint(container)
+        return container
+
+    def record(self, container):
+        state = container.attrs.get("State")
+        status = STATUSES.get(container.status)
+        if status is None:
+            status = "Succeeded" if isinstance(state, dict) and state.get("ExitCode") == 0 else "Failed"
+        return sandbox_record(
+            container.name,
+            status,
+            ready=status == "Running" and container.name in self.ready_names,
+            ip=container_ip(container),
+            labels=container.labels
+        )
+
+    def ensure_network(self):
+        if self.network is None:
+            try:
+                self.network = self.client.networks.get(DOCKER_NETWORK)
+            except docker.errors.NotFound:
+                self.network = self.client.networks.create(DOCKER_NETWORK, driver="bridge", labels={"sbx": "1"})
+        return self.network
+
+    def run(self, name, labels, profile, shared):
+        self.ensure_network()
+        resources = PROFILES[profile]["limits"]
+        # Shared hosts need root to isolate tenant kernels from each other (see SHARED_CAPABILITIES)
+        privileges = {"user": "0", "cap_drop": ["ALL"], "cap_add": list(SHARED_CAPABILITIES)} if shared else {}
+        container = self.client.containers.run(
+            IMAGE_NAME,
+            name=name,
+            labels=labels,
+            detach=True,
+            stdin_open=False,
+            tty=False,
+            command=["python", "-m", "uvicorn", "sandbox_app:app", "--host", "0.0.0.0", "--port", str(SANDBOX_PORT)],
+            environment=self.sandbox_env(name, shared),
+            network=DOCKER_NETWORK,
+            extra_hosts={"host.docker.internal": "host-gateway"},
+            mem_limit=SHARED_POD_MEMORY if shared else to_bytes(resources["memory"]),
+            nano_cpus=int(to_cores(os.environ.get("SHARED_POD_CPU", "4") if shared else resources["cpu"]) * 1e9),
+            **privileges
+        )
+        # The IP is assigned on start; the object returned by run() predates it
+        container.reload()
+        self.endpoint(container)
+        return container
+
+    async def start(self):
+        """Adopt pool containers left by a previous API process and fill the pool"""
+        if self.client is None:
+            return
+        await asyncio.to_thread(self.ensure_network)
+        pooled = await asyncio.to_thread(self.client.containers.list, filters={"label": "sbx_pool=1", "status": "running"})
+        for container in pooled:
+            if container.name.startswith(POOL_PREFIX) and container.name not in self.pool:
+                self.endpoint(container)
+                self.pool.append(container.name)
+        self.refill()
+
+    def refill(self):
+        for _ in range(DOCKER_POOL_SIZE - len(self.pool) - self.filling):
+            self.filling += 1
+            asyncio.create_task(self.add_to_pool())
+
+    async def add_to_pool(self):
+        name = f"{POOL_PREFIX}{self.new_name()[len(SANDBOX_PREFIX):]}"
+        labels = {**self.labels(name, "python", profile=DEFAULT_PROFILE), "sbx_pool": "1"}
+        try:
+            await asyncio.to_thread(self.run, name, labels, DEFAULT_PROFILE, False)
+            await self.wait_ready(name)
+            self.pool.append(name)
+        except Exception as e:
+            log.warning("Starting a pool container failed", extra={"sandbox_id": name, "error": str(e)})
+            await self.delete(name)
+        finally:
+            self.filling -= 1
+
+    async def claim_pooled(self):
+        """Rename a warm pool container into a sandbox; None if the pool is empty"""
+        while self.pool:
+            pooled = self.pool.pop(0)
+            name = self.new_name()
+            try:
+                container = await self.container(pooled)
+                await asyncio.to_thread(container.rename, name)
+            except (HTTPException, docker.errors.APIError) as e:
+                log.warning("Pool container lost", extra={"sandbox_id": pooled, "error": str(e)})
+                continue
+            finally:
+                self.refill()
+            self.endpoints[name] = self.endpoints.pop(pooled, None)
+            self.keys[name] = self.keys.pop(pooled, pooled)
+            if pooled in self.ready_names:
+                self.ready_names.discard(pooled)
+                self.ready_names.add(name)
+            return name
+        return None
+
+    async def create(self, lang, session_id=None, profile=DEFAULT_PROFILE, shared=False):
+        # Pool containers carry no session label (labels are fixed at start); the API tracks the session
+        if not shared and profile == DEFAULT_PROFILE and DOCKER_POOL_SIZE:
+            name = await self.claim_pooled()
+            if name is not None:
+                return name
+
+        name = self.new_name()
+        await asyncio.to_thread(self.run, name, self.labels(name, lang, session_id, profile, shared), profile, shared)
+        self.started(name, "shared" if shared else profile)
+        return name
+
+    async def get(self, name):
+        record = self.record(await self.container(name))
+        if record["status"] == "Running" and not record["ready"] and await self.probe(name, "/health/ready"):
+            self.mark_ready(name)
+            record["ready"] = True
+        return record
+
+    async def list(self):
+        if self.client is None:
+            return []
+        containers = await asyncio.to_thread(self.client.containers.list, all=True, filters={"label": "sbx=1"})
+        records = []
+        for container in containers:
+            # Unclaimed pool containers belong to the backend, not to the reaper
+            if container.name.startswith(POOL_PREFIX):
+                continue
+            self.endpoint(container)
+            records.append(self.record(container))
+        return records
+
+    async def base_url(self, name):
+        base_url = self.endpoints.get(name)
+        if base_url is None:
+            base_url = self.endpoint(await self.container(name))
+            if base_url is None:
+                raise SandboxUnavailable(f"Sandbox has no address on the {DOCKER_NETWORK} network yet")
+        return base_url
+
+    def remove(self, name):
+        try:
+            self.client.containers.get(name).remove(force=True)
+        except docker.errors.NotFound:
+            pass
+
+    async def delete(self, name):
+        self.forget(name)
+        self.endpoints.pop(name, None)
+        self.keys.pop(name, None)
+        # Nothing in the container outlives it, so it is killed rather than stopped gracefully
+        await asyncio.to_thread(self.remove, name)
+
+    async def delete_many(self, names):
+        for start in range(0, len(names), REAP_BATCH):
+            await asyncio.gather(*(self.delete(name) for name in names[start:start + REAP_BATCH]))
+
+    async def oom_killed(self, name, wait=5.0):
+        try:
+            container = await self.container(name)
+        except HTTPException:
+            return False
+        return bool(container.attrs["State"].get("OOMKilled"))
+
+    async def files(self, name):
+        container = await self.container(name)
+        if container.status != "running":
+            raise SandboxUnavailable()
+        result = await asyncio.to_thread(container.exec_run, "ls -la /app")
+        return result.output.decode(errors="replace")
@@ -0,0 +1,147 @@
+import json
+import time
+import threading
+from datetime import datetime
+
+import kubernetes.client.exceptions as k8s_exceptions
+
+from .base import sandbox_record, log
+
+# Seconds per watch request; the watch resumes from the last resourceVersion without a relist
+WATCH_TIMEOUT = 300
+RETRY_SECONDS = 5
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+def compact(pod):
+    """A sandbox record from a raw pod dict, plus what the backend needs from the pod status"""
+    metadata = pod["metadata"]
+    status = pod.get("status") or {}
+    statuses = status.get("containerStatuses") or []
+    record = sandbox_record(
+        metadata["name"],
+        status.get("phase"),
+        ready=bool(statuses) and all(s.get("ready", False) for s in statuses),
+        ip=status.get("podIP"),
+        labels=metadata.get("labels"),
+        deleting=metadata.get("deletionTimestamp") is not None
+    )
+    record["oom_killed"] = any(
+        ((s.get(state) or {}).get("terminated") or {}).get("reason") == "OOMKilled"
+        for s in statuses for state in ("state", "lastState")
+    )
+    ready = next((c for c in status.get("conditions") or [] if c.get("type") == "Ready" and c.get("status") == "True"), None)
+    created = parse_time(metadata.get("creationTimestamp"))
+    ready_at = parse_time(ready.get("lastTransitionTime")) if ready else None
+    record["ready_seconds"] = (ready_at - created).total_seconds() if created and ready_at else None
+    return record
+
+def watch_events(response):
+    """Events of a raw watch response: one JSON object per line, read as the server flushes them"""
+    pending = b""
+    for chunk in response.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+class PodInventory:
+    """Sandbox pods as compact records, kept current by a watch instead of a list per query.
+
+    One list on start (and after the watch expires), then ADDED/MODIFIED/DELETED events. Lists and
+    watches are read as raw JSON (_preload_content=False), so no V1Pod objects are built. The watch
+    runs on its own thread; readers only touch the dict. While it is not synced, callers fall back
+    to the API.
+    """
+
+    def __init__(self, v1, namespace, label_selector):
+        self.v1 = v1
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.records = {}
+        self.synced = False
+        self.stopped = threading.Event()
+        self.thread = None
+        self.response = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="pod-inventory", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        # Unblocks the watch thread, which is waiting for the next event
+        if self.response is not None:
+            self.response.close()
+
+    def get(self, name):
+        return self.records.get(name)
+
+    def list(self):
+        return list(self.records.values())
+
+    def run(self):
+        version = None
+        while not self.stopped.is_set():
+            try:
+                if version is None:
+                    version = self.relist()
+                version = self.watch(version)
+            except Exception as e:
+                if self.stopped.is_set():
+                    return
+                if isinstance(e, k8s_exceptions.ApiException) and e.status == 410:
+                    version = None
+                    continue
+                log.warning("Pod watch failed, reading pods from the API until it recovers", extra={"error": str(e)})
+                self.synced = False
+                version = None
+                time.sleep(RETRY_SECONDS)
+
+    def relist(self):
+        response = self.v1.list_namespaced_pod(
+            namespace=self.namespace, label_selector=self.label_selector, _preload_content=False
+        )
+        body = json.loads(response.data)
+        self.records = {pod["metadata"]["name"]: compact(pod) for pod in body["items"]}
+        self.synced = True
+        log.info("Pod inventory synced", extra={"pods": len(self.records)})
+        return body["metadata"]["resourceVersion"]
+
+    def watch(self, version):
+        """Apply events until the watch times out; returns the version to resume from, None to relist"""
+        self.response = self.v1.list_namespaced_pod(
+            namespace=self.namespace,
+            label_selector=self.label_selector,
+            resource_version=version,
+            timeout_seconds=WATCH_TIMEOUT,
+            allow_watch_bookmarks=True,
+            watch=True,
+            _preload_content=False,
+            _request_timeout=(10, WATCH_TIMEOUT + 30)
+        )
+        try:
+            for event in watch_events(self.response):
+                pod = event["object"]
+                if event["type"] == "ERROR":
+                    if pod.get("code") == 410:
+                        return None
+                    raise k8s_exceptions.ApiException(status=pod.get("code"), reason=pod.get("message"))
+                version = pod["metadata"].get("resourceVersion", version)
+                if event["type"] == "BOOKMARK":
+                    continue
+                name = pod["metadata"]["name"]
+                if event["type"] == "DELETED":
+                    self.records.pop(name, None)
+                else:
+                    self.records[name] = compact(pod)
+                if self.stopped.is_set():
+                    break
+        finally:
+            self.response.release_conn()
+        return version
@@ -0,0 +1,339 @@
+import os
+import time
+import asyncio
+
+from fastapi import HTTPException
+
+from kubernetes import client, config
+import kubernetes.client.exceptions as k8s_exceptions
+from kubernetes.stream import stream
+
+from utils.profiles import PROFILES, DEFAULT_PROFILE
+from utils.placement import SHARED_POD_MEMORY
+from utils.metrics import POD_READY_SECONDS
+from utils.tracing import traced
+from .inventory import PodInventory
+from .base import SandboxBackend, SandboxNotFound, SandboxUnavailable, sandbox_record, log, SANDBOX_PORT, SHARED_CAPABILITIES
+
+IMAGE_NAME = os.environ.get(
+    "SANDBOX_IMAGE",
+    "us-central1-docker.pkg.dev/exalted-crane-459000-g5/backend/backend-api:17"
+)
+# How the API reaches sandbox servers:
+#   pod-ip   - straight to the pod IP (no Service objects at all)
+#   headless - <pod>.<SANDBOX_SUBDOMAIN> DNS via one shared headless Service (k8s/backend/sandboxes-service.yaml)
+#   service  - one ClusterIP Service per sandbox (legacy)
+SANDBOX_ROUTING = os.environ.get("SANDBOX_ROUTING", "pod-ip")
+SANDBOX_SUBDOMAIN = os.environ.get("SANDBOX_SUBDOMAIN", "sandboxes")
+# Serve list/get/reaper queries from a watch-driven pod inventory (backends/inventory.py)
+SANDBOX_INVENTORY = os.environ.get("SANDBOX_INVENTORY", "1") == "1"
+LABEL_SELECTOR = "app=sandbox,sbx=1"
+
+def get_namespace():
+    return os.environ.get("KUBERNETES_NAMESPACE", "app")
+
+def load_client():
+    try:
+        config.load_incluster_config()
+        log.info("Loaded in-cluster Kubernetes config")
+    except config.ConfigException:
+        try:
+            config.load_kube_config()
+            log.info("Loaded kubeconfig")
+        except config.ConfigException:
+            log.warning("No Kubernetes config found; sandbox routes are unavailable")
+            return None
+    return client.CoreV1Api()
+
+class KubernetesBackend(SandboxBackend):
+    """One pod per sandbox (or per shared host), labelled app=sandbox,sbx=1"""
+
+    name = "kubernetes"
+
+    def __init__(self, v1=None):
+        super().__init__()
+        self.v1 = v1
+        self.namespace = get_namespace()
+        self.pod_ips = {}
+        self.inventory = None
+
+    @property
+    def available(self):
+        return self.v1 is not None
+
+    def default_api_url(self):
+        return f"http://api.{self.namespace}.svc.cluster.local:{SANDBOX_PORT}"
+
+    def remember(self, record):
+        if record["ip"]:
+            self.pod_ips[record["name"]] = record["ip"]
+        # Taken from the pod's own timestamps, so it does not matter how late we notice
+        if record["name"] in self.starting and record["ready_seconds"] is not None:
+            profile, _ = self.starting.pop(record["name"])
+            POD_READY_SECONDS.labels(profile=profile).observe(record["ready_seconds"])
+        return record
+
+    def record(self, pod):
+        statuses = pod.status.container_statuses or []
+        record = sandbox_record(
+            pod.metadata.name,
+            pod.status.phase,
+            ready=bool(statuses) and all(status.ready for status in statuses),
+            ip=pod.status.pod_ip,
+            labels=pod.metadata.labels,
+            deleting=pod.metadata.deletion_timestamp is not None
+        )
+        record["oom_killed"] = any(
+            state is not None and state.terminated is not None and state.terminated.reason == "OOMKilled"
+            for status in statuses for state in (status.state, status.last_state)
+        )
+        ready = next(
+            (c for c in pod.status.conditions or [] if c.type == "Ready" and c.status == "True"),
+            None
+        )
+        if ready is None or ready.last_transition_time is None or pod.metadata.creation_timestamp is None:
+            record["ready_seconds"] = None
+        else:
+            record["ready_seconds"] = (ready.last_transition_time - pod.metadata.creation_timestamp).total_seconds()
+        return record
+
+    async def read(self, name):
+        try:
+            pod = await asyncio.to_thread(self.v1.read_namespaced_pod, name=name, namespace=self.namespace)
+        except k8s_exceptions.ApiException as e:
+            if e.status == 404:
+                raise SandboxNotFound(name)
+            raise HTTPException(status_code=500, detail=str(e))
+        if "sbx" not in (pod.metadata.labels or {}):
+            raise SandboxNotFound(name)
+        return self.remember(self.record(pod))
+
+    async def lookup(self, name):
+        """The pod's record from the inventory, or from the API for pods the watch has not shown yet"""
+        if self.inventory is not None and self.inventory.synced:
+            record = self.inventory.get(name)
+            if record is not None:
+                return self.remember(record)
+        return await self.read(name)
+
+    def build_pod_manifest(self, name, labels, shared=False, profile=DEFAULT_PROFILE):
+        pod_manifest = {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "name": name,
+                "namespace": self.namespace,
+                "labels": labels
+            },
+            "spec": {
+                "containers": [{
+                    "name": "jupyter-sandbox",
+                    "image": IMAGE_NAME,
+                    "ports": [{"containerPort": SANDBOX_PORT}],
+                    # Slim sandbox entrypoint instead of the API app (see sandbox_app.py)
+                    "command": [
+                        "python", "-m", "uvicorn", "sandbox_app:app",
+                        "--host", "0.0.0.0", "--port", str(SANDBOX_PORT)
+                    ],
+                    "env": [{"name": key, "value": value} for key, value in self.sandbox_env(name, shared).items()],
+                    "resources": PROFILES[profile],
+                    "volumeMounts": [{ # For resource isolation and mask application code
+                        "name": "uploaded-files",
+                        "mountPath": "/uploaded_files"
+                    }],
+                    "readinessProbe": {
+                        "httpGet": {
+                            "path": "/health/ready",
+                            "port": SANDBOX_PORT
+                        },
+                        "initialDelaySeconds": 5,
+                        "periodSeconds": 3,
+                        "timeoutSeconds": 5
+                    },
+                    "livenessProbe": {
+                        "httpGet": {
+                            "path": "/health",
+                            "port": SANDBOX_PORT
+                        },
+                        "initialDelaySeconds": 15,
+                        "periodSeconds": 10,
+                        "timeoutSeconds": 5
+                    }
+                }],
+                "volumes": [{
+                    "name": "uploaded-files",
+                    "emptyDir": {}
+                }],
+                "restartPolicy": "Never"
+            }
+        }
+
+        if shared:
+            pod_manifest["spec"]["containers"][0]["resources"] = {
+                "limits": {"memory": str(SHARED_POD_MEMORY), "cpu": os.environ.get("SHARED_POD_CPU", "4")},
+                "requests": {"memory": str(SHARED_POD_MEMORY // 2), "cpu": os.environ.get("SHARED_POD_CPU_REQUEST", "1")}
+            }
+            pod_manifest["spec"]["containers"][0]["securityContext"] = {
+                "runAsUser": 0,
+                "runAsNonRoot": False,
+                "allowPrivilegeEscalation": False,
+                "capabilities": {"drop": ["ALL"], "add": list(SHARED_CAPABILITIES)}
+            }
+
+        if SANDBOX_ROUTING == "headless":
+            # Gives the pod the DNS name <pod>.<subdomain>.<namespace>.svc.cluster.local
+            pod_manifest["spec"]["hostname"] = name
+            pod_manifest["spec"]["subdomain"] = SANDBOX_SUBDOMAIN
+        return pod_manifest
+
+    def build_service_manifest(self, name):
+        return {
+            "apiVersion": "v1",
+            "kind": "Service",
+            "metadata": {
+                "name": f"{name}-service",
+                "namespace": self.namespace,
+                "labels": {
+                    "app": "sandbox",
+                    "sbx": "1"
+                }
+            },
+            "spec": {
+                "selector": {
+                    "app": "sandbox",
+                    "sbx": "1",
+                    "pod-name": name
+                },
+                "ports": [{
+                    "port": SANDBOX_PORT,
+                    "targetPort": SANDBOX_PORT,
+                    "protocol": "TCP"
+                }],
+                "type": "ClusterIP"
+            }
+        }
+
+    async def create(self, lang, session_id=None, profile=DEFAULT_PROFILE, shared=False):
+        name = self.new_name()
+        labels = self.labels(name, lang, session_id, profile, shared)
+        await asyncio.to_thread(
+            self.v1.create_namespaced_pod,
+            namespace=self.namespace,
+            body=self.build_pod_manifest(name, labels, shared, profile)
+        )
+        self.started(name, "shared" if shared else profile)
+        if SANDBOX_ROUTING == "service":
+            try:
+                await asyncio.to_thread(
+                    self.v1.create_namespaced_service,
+                    namespace=self.namespace,
+                    body=self.build_service_manifest(name)
+                )
+            except Exception:
+                await self.delete(name)
+                raise
+        return name
+
+    async def get(self, name):
+        return await self.lookup(name)
+
+    async def list(self):
+        if self.v1 is None:
+            return []
+        if self.inventory is not None and self.inventory.synced:
+            return [self.remember(record) for record in self.inventory.list()]
+        try:
+            pods = await asyncio.to_thread(
+                self.v1.list_namespaced_pod,
+                namespace=self.namespace,
+                label_selector=LABEL_SELECTOR
+            )
+        except Exception:
+            return []
+        return [self.remember(self.record(pod)) for pod in pods.items]
+
+    async def start(self):
+        if self.v1 is not None and SANDBOX_INVENTORY:
+            self.inventory = PodInventory(self.v1, self.namespace, LABEL_SELECTOR)
+            self.inventory.start()
+
+    async def shutdown(self):
+        if self.inventory is not None:
+            self.inventory.stop()
+
+    async def base_url(self, name):
+        if SANDBOX_ROUTING == "service":
+            return f"http://{name}-service.{self.namespace}.svc.cluster.local:{SANDBOX_PORT}"
+        if SANDBOX_ROUTING == "headless":
+            return f"http://{name}.{SANDBOX_SUBDOMAIN}.{self.namespace}.svc.cluster.local:{SANDBOX_PORT}"
+        return await self.server_url(name)
+
+    async def server_url(self, name):
+        # Pod IPs are stable for a pod's lifetime (restartPolicy Never), so one lookup is enough.
+        # Also used before the pod is ready, when Services do not route to it yet.
+        host = self.pod_ips.get(name)
+        if host is None:
+            host = (await self.lookup(name))["ip"]
+            if host is None:
+                raise SandboxUnavailable("Sandbox has no IP yet")
+        return f"http://{host}:{SANDBOX_PORT}"
+
+    @traced("sandbox.wait_ready")
+    async def wait_ready(self, name, timeout=300):
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            try:
+                record = await self.lookup(name)
+                if record["status"] == "Running" and record["ready"] and record["ip"]:
+                    self.ready_names.add(name)
+                    return record
+            except SandboxNotFound:
+                raise
+            except HTTPException:
+                pass
+            # Polling the inventory is a dict lookup; polling the API is a pod read
+            await asyncio.sleep(0.5 if self.inventory is not None and self.inventory.synced else 2)
+        raise HTTPException(status_code=504, detail="Pod startup timeout")
+
+    async def delete(self, name):
+        self.pod_ips.pop(name, None)
+        self.forget(name)
+
+        async def delete(method, name):
+            try:
+                await asyncio.to_thread(method, name=name, namespace=self.namespace)
+            except k8s_exceptions.ApiException:
+                pass
+
+        deletes = [delete(self.v1.delete_namespaced_pod, name)]
+        if SANDBOX_ROUTING == "service":
+            deletes.append(delete(self.v1.delete_namespaced_service, f"{name}-service"))
+        await asyncio.gather(*deletes)
+
+    async def oom_killed(self, name, wait=5.0):
+        """Whether the sandbox container was OOM killed; its status can take a moment to show it"""
+        deadline = time.time() + wait
+        while True:
+            try:
+                if (await self.lookup(name))["oom_killed"]:
+                    return True
+            except HTTPException:
+                return False
+            if time.time() >= deadline:
+                return False
+            await asyncio.sleep(1)
+
+    async def files(self, name):
+        if (await self.lookup(name))["status"] != "Running":
+            raise SandboxUnavailable()
+        return await asyncio.to_thread(
+            stream,
+            self.v1.connect_get_namespaced_pod_exec,
+            name,
+            self.namespace,
+            command=["ls", "-la", "/app"],
+            stderr=True,
+            stdin=False,
+            stdout=True,
+            tty=False
+        )
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import tempfile
+import subprocess
+
+from utils.profiles import PROFILES, DEFAULT_PROFILE, to_bytes
+from utils.placement import SHARED_POD_MEMORY
+from .base import SandboxBackend, SandboxNotFound, SandboxUnavailable, sandbox_record, log
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Workspaces (UPLOAD_DIR) of local sandboxes are created under this directory
+LOCAL_ROOT = os.environ.get("SANDBOX_LOCAL_ROOT", tempfile.gettempdir())
+# Data segment (heap) cap per sandbox process; defaults to the profile's memory limit, 0 disables it
+LOCAL_MEMORY_LIMIT = os.environ.get("SANDBOX_LOCAL_MEMORY_LIMIT")
+LOCAL_MAX_FILES = int(os.environ.get("SANDBOX_LOCAL_MAX_FILES", "4096"))
+# The only API variables local sandboxes inherit on top of sandbox_env(); keys and secrets stay here
+LOCAL_ENV = tuple(
+    name.strip()
+    for name in os.environ.get("SANDBOX_LOCAL_ENV", "PATH,HOME,LANG,LC_ALL,TZ,TMPDIR,VIRTUAL_ENV,PYTHONPATH").split(",")
+    if name.strip()
+)
+RLIMIT_EXEC = os.path.join(API_DIR, "backends", "rlimit_exec.py")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class LocalSandbox:
+    def __init__(self, process, port, workspace, labels):
+        self.process = process
+        self.port = port
+        self.workspace = workspace
+        self.labels = labels
+        self.created = time.time()
+
+class LocalBackend(SandboxBackend):
+    """Sandbox servers as child processes of the API on 127.0.0.1, limited with rlimits.
+
+    No container or cluster needed: for development, CI and single-node deployments. Kernels
+    share the host's filesystem and network, so this is not an isolation boundary.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        super().__init__()
+        self.sandboxes = {}
+        self.serving = set()
+
+    def default_api_url(self):
+        return os.environ.get("SANDBOX_API_URL", "http://127.0.0.1:8000")
+
+    def sandbox(self, name):
+        sandbox = self.sandboxes.get(name)
+        if sandbox is None:
+            raise SandboxNotFound(name)
+        return sandbox
+
+    def record(self, name, sandbox):
+        code = sandbox.process.poll()
+        if code is not None:
+            status = "Succeeded" if code == 0 else "Failed"
+        else:
+            status = "Running" if name in self.serving else "Pending"
+        return sandbox_record(
+            name,
+            status,
+            ready=status == "Running" and name in self.ready_names,
+            ip="127.0.0.1",
+            labels=sandbox.labels
+        )
+
+    async def create(self, lang, session_id=None, profile=DEFAULT_PROFILE, shared=False):
+        name = self.new_name()
+        port = free_port()
+        workspace = tempfile.mkdtemp(prefix=f"{name}-", dir=LOCAL_ROOT)
+        if LOCAL_MEMORY_LIMIT is not None:
+            memory = int(LOCAL_MEMORY_LIMIT)
+        else:
+            memory = SHARED_POD_MEMORY if shared else to_bytes(PROFILES[profile]["limits"]["memory"])
+
+        env = {
+            **{key: os.environ[key] for key in LOCAL_ENV if key in os.environ},
+            **self.sandbox_env(name, shared),
+            "PORT": str(port),
+            "UPLOAD_DIR": workspace,
+            "PYTHONUNBUFFERED": "1"
+        }
+        command = [sys.executable, "-m", "uvicorn", "sandbox_app:app", "--host", "127.0.0.1", "--port", str(port)]
+        process = await asyncio.to_thread(
+            subprocess.Popen,
+            [sys.executable, RLIMIT_EXEC, str(memory), str(LOCAL_MAX_FILES), *command],
+            cwd=API_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # Its own process group, so delete takes the kernels down with the server
+            start_new_session=True
+        )
+        self.sandboxes[name] = LocalSandbox(process, port, workspace, self.labels(name, lang, session_id, profile, shared))
+        self.started(name, "shared" if shared else profile)
+        log.info("Local sandbox started", extra={"sandbox_id": name, "pid": process.pid, "port": port})
+        return name
+
+    async def get(self, name):
+        sandbox = self.sandbox(name)
+        if sandbox.process.poll() is None:
+            if name not in self.serving and await self.probe(name):
+                self.serving.add(name)
+            if name in self.serving and name not in self.ready_names and await self.probe(name, "/health/ready"):
+                self.mark_ready(name)
+        return self.record(name, sandbox)
+
+    async def list(self):
+        return [self.record(name, sandbox) for name, sandbox in list(self.sandboxes.items())]
+
+    async def base_url(self, name):
+        return f"http://127.0.0.1:{self.sandbox(name).port}"
+
+    async def wait_started(self, name, timeout=300):
+        base_url = await super().wait_started(name, timeout)
+        self.serving.add(name)
+        return base_url
+
+    async def wait_ready(self, name, timeout=300):
+        if self.sandbox(name).process.poll() is not None:
+            raise SandboxUnavailable("Sandbox process exited")
+        return await super().wait_ready(name, timeout)
+
+    def stop(self, sandbox):
+        try:
+            os.killpg(sandbox.process.pid, signal.SIGTERM)
+            sandbox.process.wait(timeout=10)
+        except ProcessLookupError:
+            pass
+        except subprocess.TimeoutExpired:
+            os.killpg(sandbox.process.pid, signal.SIGKILL)
+            sandbox.process.wait()
+        shutil.rmtree(sandbox.workspace, ignore_errors=True)
+
+    async def delete(self, name):
+        self.forget(name)
+        self.serving.discard(name)
+        sandbox = self.sandboxes.pop(name, None)
+        if sandbox is not None:
+            await asyncio.to_thread(self.stop, sandbox)
+
+    async def files(self, name):
+        sandbox = self.sandbox(name)
+        if sandbox.process.poll() is not None:
+            raise SandboxUnavailable()
+        result = await asyncio.to_thread(subprocess.run, ["ls", "-la", sandbox.workspace], capture_output=True, text=True)
+        return result.stdout + result.stderr
+
+    async def shutdown(self):
+        await asyncio.gather(*(self.delete(name) for name in list(self.sandboxes)))
@@ -0,0 +1,22 @@
+"""Set resource limits, then exec a command: python rlimit_exec.py <data bytes> <open files> <command...>
+
+The local backend starts sandbox servers through this instead of a Popen preexec_fn, which is not safe
+in a process with threads such as the API. Standard library only, and run by path rather than as part
+of the backends package, so it imports nothing else before the exec.
+"""
+import os
+import sys
+import resource
+
+def main(argv):
+    memory, max_files, command = int(argv[0]), int(argv[1]), argv[2:]
+    # RLIMIT_DATA rather than RLIMIT_AS: address space counts reserved but untouched mappings,
+    # which numpy/torch thread pools and allocators make plenty of. Kernels inherit every limit.
+    if memory:
+        resource.setrlimit(resource.RLIMIT_DATA, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max_files, max_files))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    os.execv(command[0], command)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from types import SimpleNamespace
+from datetime import datetime, timezone
+
+from kubernetes.client.exceptions import ApiException
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def now():
+    return datetime.now(timezone.utc)
+
+class FakePod:
+    """One "pod": the manifest's sandbox server command run as a local process on its own loopback IP"""
+
+    def __init__(self, manifest, ip, port):
+        self.name = manifest["metadata"]["name"]
+        self.labels = dict(manifest["metadata"].get("labels") or {})
+        self.ip = ip
+        self.port = port
+        self.created = now()
+        self.phase = "Pending"
+        self.ready_at = None
+        self.exit_code = None
+        self.workspace = tempfile.mkdtemp(prefix=f"{self.name}-")
+
+        container = manifest["spec"]["containers"][0]
+        env = {**os.environ, **{e["name"]: e["value"] for e in container.get("env", []) if "value" in e}}
+        env.update({"IS_SANDBOX": "1", "UPLOAD_DIR": self.workspace, "PYTHONUNBUFFERED": "1"})
+        command = [sys.executable if part == "python" else part for part in container["command"]]
+        command[command.index("--host") + 1] = ip
+        command[command.index("--port") + 1] = str(port)
+        self.process = subprocess.Popen(command, cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def probe(self, path):
+        try:
+            with urllib.request.urlopen(f"http://{self.ip}:{self.port}{path}", timeout=1) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def watch(self):
+        while self.process.poll() is None and self.ready_at is None:
+            if self.phase == "Pending" and self.probe("/health"):
+                self.phase = "Running"
+            if self.phase == "Running" and self.probe("/health/ready"):
+                self.ready_at = now()
+            time.sleep(0.1)
+        self.process.wait()
+        self.exit_code = self.process.returncode
+        self.phase = "Succeeded" if self.exit_code == 0 else "Failed"
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def view(self):
+        ready = self.ready_at is not None and self.exit_code is None
+        terminated = (
+            SimpleNamespace(reason="Error", exit_code=self.exit_code) if self.exit_code is not None else None
+        )
+        return SimpleNamespace(
+            metadata=SimpleNamespace(
+                name=self.name, labels=dict(self.labels), creation_timestamp=self.created, deletion_timestamp=None
+            ),
+            status=SimpleNamespace(
+                phase=self.phase,
+                pod_ip=self.ip,
+                container_statuses=[SimpleNamespace(
+                    ready=ready,
+                    state=SimpleNamespace(terminated=terminated),
+                    last_state=SimpleNamespace(terminated=None)
+                )],
+                conditions=[SimpleNamespace(type="Ready", status="True", last_transition_time=self.ready_at)] if ready else []
+            )
+        )
+
+class FakeCoreV1:
+    """The CoreV1Api subset routers/sandbox.py uses, backed by local sandbox server processes.
+
+    Every pod gets its own 127.0.0.x address so all of them can listen on SANDBOX_PORT, as pods
+    do; Linux routes the whole 127/8 block to loopback.
+    """
+
+    def __init__(self, port=8000, first_ip=2):
+        self.port = port
+        self.pods = {}
+        self.free_ips = [f"127.0.0.{n}" for n in range(first_ip, 255)]
+        self.lock = threading.Lock()
+
+    def create_namespaced_pod(self, namespace, body):
+        with self.lock:
+            pod = FakePod(body, self.free_ips.pop(0), self.port)
+            self.pods[pod.name] = pod
+        return pod.view()
+
+    def read_namespaced_pod(self, name, namespace):
+        pod = self.pods.get(name)
+        if pod is None:
+            raise ApiException(status=404, reason="Not Found")
+        return pod.view()
+
+    def list_namespaced_pod(self, namespace, label_selector=""):
+        wanted = dict(term.split("=", 1) for term in label_selector.split(",") if "=" in term)
+        items = [
+            pod.view() for pod in list(self.pods.values())
+            if all(pod.labels.get(key) == value for key, value in wanted.items())
+        ]
+        return SimpleNamespace(items=items)
+
+    def delete_namespaced_pod(self, name, namespace, **kwargs):
+        with self.lock:
+            pod = self.pods.pop(name, None)
+        if pod is None:
+            raise ApiException(status=404, reason="Not Found")
+        pod.stop()
+        with self.lock:
+            self.free_ips.append(pod.ip)
+
+    def create_namespaced_service(self, namespace, body):
+        return SimpleNamespace(metadata=SimpleNamespace(name=body["metadata"]["name"]))
+
+    def delete_namespaced_service(self, name, namespace, **kwargs):
+        pass
+
+    def shutdown(self):
+        for name in list(self.pods):
+            self.delete_namespaced_pod(name, "")
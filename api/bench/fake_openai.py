@@ -0,0 +1,82 @@
+import json
+import time
+import uuid
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Stand-in for the OpenAI chat completions API with a scripted, deterministic stream.
+# The last user message decides the reply:
+#   "run: <code>"  -> a python_interpreter tool call with that code
+#   anything else  -> a text reply of REPLY_TOKENS tokens
+# Time to first token and tokens/sec are fixed, so changes in measured latency come from our side.
+
+def create_app(first_token_seconds=0.2, tokens_per_second=80.0, reply_tokens=40, chunk_args=16):
+    app = FastAPI()
+
+    def chunk(delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "bench",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    def usage(completion_tokens):
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "bench",
+            "choices": [],
+            "usage": {"prompt_tokens": 100, "completion_tokens": completion_tokens, "total_tokens": 100 + completion_tokens}
+        }
+
+    def last_user_text(body):
+        for message in reversed(body.get("messages", [])):
+            if message.get("role") != "user":
+                continue
+            content = message.get("content")
+            if isinstance(content, list):
+                return "".join(part.get("text", "") for part in content if part.get("type") == "text")
+            return content or ""
+        return ""
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        text = last_user_text(await request.json())
+
+        async def events():
+            await asyncio.sleep(first_token_seconds)
+            if text.startswith("run: "):
+                arguments = json.dumps({"code": text[len("run: "):]})
+                call_id = f"call_{uuid.uuid4().hex[:12]}"
+                # Like the real API: id and name first with empty arguments, then argument fragments
+                yield chunk({"role": "assistant", "tool_calls": [{
+                    "index": 0, "id": call_id, "type": "function",
+                    "function": {"name": "python_interpreter", "arguments": ""}
+                }]})
+                fragments = [arguments[i:i + chunk_args] for i in range(0, len(arguments), chunk_args)]
+                for fragment in fragments:
+                    yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": fragment}}]})
+                    await asyncio.sleep(1 / tokens_per_second)
+                yield chunk({}, "tool_calls")
+                yield usage(len(fragments))
+                return
+
+            for i in range(reply_tokens):
+                yield chunk({"content": f"token{i} "})
+                await asyncio.sleep(1 / tokens_per_second)
+            yield chunk({}, "stop")
+            yield usage(reply_tokens)
+
+        async def sse():
+            async for event in events():
+                yield f"data: {json.dumps(event)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+import subprocess
+
+# Benchmark harness: the real API app and real sandbox servers with Jupyter kernels, wired to local
+# stand-ins for OpenAI (bench/fake_openai.py) and Kubernetes (bench/fake_k8s.py).
+# Run from api/:  python -m bench.run --scenario all --concurrency 8 --out bench-results/latest.json
+# --backend docker|local runs the same scenarios on that sandbox backend instead of the fake cluster,
+# so results files of different backends can be compared with --compare.
+# Linux only: fake pods listen on 127.0.0.2, 127.0.0.3, ... port 8000.
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CODE = "import math; print(sum(math.sqrt(i) for i in range(200000)))"
+
+def percentile(values, q):
+    """Linear interpolation between closest ranks"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 0.50), 4),
+        "p95": round(percentile(values, 0.95), 4),
+        "p99": round(percentile(values, 0.99), 4),
+        "max": round(max(values), 4)
+    }
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=API_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], cwd=API_DIR, capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+class Samples:
+    def __init__(self):
+        self.values = {}
+        self.errors = []
+
+    def add(self, name, value):
+        self.values.setdefault(name, []).append(value)
+
+    def error(self, where, detail):
+        self.errors.append({"where": where, "detail": str(detail)[:500]})
+
+def serve(app, port):
+    """Run an ASGI app on its own thread and event loop; returns the uvicorn server"""
+    import uvicorn
+
+    class ThreadedServer(uvicorn.Server):
+        def install_signal_handlers(self):
+            pass
+
+    server = ThreadedServer(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def chat_turn(client, base_url, session_id, content, samples, kind):
+    """One /api/chat request; times the first frame and the tool call -> tool result gap"""
+    started = time.perf_counter()
+    first = tool_called = None
+    async with client.stream("POST", f"{base_url}/api/chat", json={
+        "messages": [{"role": "user", "content": content}],
+        "session_id": session_id
+    }) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            now = time.perf_counter()
+            if first is None:
+                first = now
+                samples.add("chat.ttft", now - started)
+            if line.startswith("9:"):
+                tool_called = now
+            elif line.startswith("a:") and tool_called is not None:
+                samples.add(f"chat.tool.{kind}", now - tool_called)
+                result = json.loads(line[2:]).get("result") or {}
+                if not result.get("success", False):
+                    samples.error("chat.tool", result.get("outputs"))
+    samples.add(f"chat.turn.{kind}", time.perf_counter() - started)
+
+async def chat_session(client, base_url, args, samples):
+    session_id = f"bench-{uuid.uuid4().hex[:8]}"
+    for turn in range(args.turns):
+        await chat_turn(client, base_url, session_id, f"run: {args.code}", samples, "cold" if turn == 0 else "warm")
+    if args.text_turns:
+        for _ in range(args.text_turns):
+            await chat_turn(client, base_url, session_id, "explain", samples, "text")
+
+async def execute(client, base_url, sandbox_id, code):
+    async with client.stream("POST", f"{base_url}/sandboxes/{sandbox_id}/execute", json={"code": code}) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_lines():
+            pass
+
+async def sandbox_session(client, base_url, args, samples):
+    """Create a sandbox, time the first execution (cold start) and the ones after it (warm)"""
+    started = time.perf_counter()
+    response = await client.post(f"{base_url}/sandboxes", json={"lang": "python"})
+    response.raise_for_status()
+    sandbox_id = response.json()["id"]
+    samples.add("sandbox.create", time.perf_counter() - started)
+    try:
+        await execute(client, base_url, sandbox_id, args.code)
+        samples.add("sandbox.cold_start", time.perf_counter() - started)
+        for _ in range(args.executions):
+            executed = time.perf_counter()
+            await execute(client, base_url, sandbox_id, args.code)
+            samples.add("sandbox.execute.warm", time.perf_counter() - executed)
+    finally:
+        deleted = time.perf_counter()
+        await client.delete(f"{base_url}/sandboxes/{sandbox_id}")
+        samples.add("sandbox.delete", time.perf_counter() - deleted)
+
+async def run_sessions(session, count, concurrency, client, base_url, args, samples):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            try:
+                await session(client, base_url, args, samples)
+            except Exception as e:
+                samples.error(session.__name__, f"{type(e).__name__}: {e}")
+
+    await asyncio.gather(*(one() for _ in range(count)))
+
+def start_stack(args):
+    """Fake OpenAI and the API app, each on its own thread; returns (API base URL, shutdown)"""
+    from bench.fake_openai import create_app
+
+    serve(create_app(args.model_ttft, args.model_tps, args.reply_tokens), args.model_port)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    os.environ.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.model_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "SANDBOX_BACKEND": args.backend,
+        # The fake cluster has no watch API; the backend reads pods directly instead
+        "SANDBOX_INVENTORY": "0",
+        "SANDBOX_API_URL": base_url,
+        "ARTIFACT_STORE_URL": f"{base_url}/api/artifacts",
+        "SANDBOX_PIP_PROXY": "0",
+        "SANDBOX_PRELOAD": args.preload,
+        "SNAPSHOT_DEBOUNCE": "3600",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")
+    })
+
+    import index
+    from routers import sandbox
+
+    if args.backend == "kubernetes":
+        from bench.fake_k8s import FakeCoreV1
+
+        cluster = FakeCoreV1()
+        sandbox.backend.v1 = cluster
+        shutdown = cluster.shutdown
+    else:
+        # Sandboxes the run leaves behind are removed through the backend itself
+        async def remove_all():
+            for record in await sandbox.backend.list():
+                await sandbox.backend.delete(record["name"])
+
+        def shutdown():
+            asyncio.run(remove_all())
+    serve(index.app, args.api_port)
+    return base_url, shutdown
+
+async def run(args):
+    import httpx
+
+    base_url, shutdown = start_stack(args)
+    samples = Samples()
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=10.0)) as client:
+            if args.scenario in ("sandbox", "all"):
+                await run_sessions(sandbox_session, args.sessions, args.concurrency, client, base_url, args, samples)
+            if args.scenario in ("chat", "all"):
+                await run_sessions(chat_session, args.sessions, args.concurrency, client, base_url, args, samples)
+    finally:
+        await asyncio.to_thread(shutdown)
+
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.time(),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "config": vars(args),
+        "metrics": {name: summarize(values) for name, values in sorted(samples.values.items())},
+        "errors": samples.errors
+    }
+
+def compare(current, baseline):
+    """Print p50/p95/p99 of each metric against a previous results file"""
+    print(f"{'metric':<24} {'stat':<4} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, stats in current["metrics"].items():
+        before = baseline.get("metrics", {}).get(name)
+        if not before or not stats.get("count") or not before.get("count"):
+            continue
+        for key in ("p50", "p95", "p99"):
+            change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            print(f"{name:<24} {key:<4} {before[key]:>10.4f} {stats[key]:>10.4f} {change:>+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat and /sandboxes/* against local stand-ins")
+    parser.add_argument("--scenario", choices=("chat", "sandbox", "all"), default="all")
+    parser.add_argument(
+        "--backend", choices=("kubernetes", "docker", "local"), default="kubernetes",
+        help="SANDBOX_BACKEND; kubernetes runs against the fake cluster in bench/fake_k8s.py"
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=8, help="sessions per scenario")
+    parser.add_argument("--turns", type=int, default=3, help="tool-calling chat turns per session")
+    parser.add_argument("--text-turns", type=int, default=1, help="text-only chat turns per session")
+    parser.add_argument("--executions", type=int, default=5, help="warm executions per sandbox session")
+    parser.add_argument("--code", default=DEFAULT_CODE)
+    parser.add_argument("--preload", default="", help="SANDBOX_PRELOAD for the sandboxes")
+    parser.add_argument("--model-ttft", type=float, default=0.2)
+    parser.add_argument("--model-tps", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--api-port", type=int, default=8700)
+    parser.add_argument("--model-port", type=int, default=8701)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+    results = asyncio.run(run(args))
+
+    print(json.dumps(results["metrics"], indent=2))
+    if results["errors"]:
+        print(f"{len(results['errors'])} errors, first: {results['errors'][0]}")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
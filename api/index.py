@@ -1,5 +1,6 @@
 import os
 import json
+import time
 import asyncio
 from typing import List, Optional
 from dotenv import load_dotenv
@@ -12,20 +13,37 @@ from fastapi import FastAPI, Query, File, UploadFile, HTTPException
 from fastapi.responses import StreamingResponse
 
 from utils.prompt import ClientMessage, convert_to_openai_messages
-from utils.tools import get_current_weather, python_interpreter, session_containers, session_pod
+from utils.tools import get_current_weather, python_interpreter, python_batch, session_containers, session_pod, session_workdir
+from utils.stream import DataStreamEncoder, ThreadedStream, STREAM_END
+from utils.metrics import (
+    LLM_FIRST_TOKEN_SECONDS, LLM_TOKENS_PER_SECOND, LLM_TOKENS, TOOL_SECONDS, TOOL_TIMEOUTS, SESSIONS,
+    metrics_response
+)
+from utils.tracing import TraceMiddleware, span, start_span, current_span
+from utils.log import get_logger, annotate
 
-from routers import sandbox
+from routers import sandbox, artifacts, pypi
 from routers.sandbox import upload_file_to_sandbox
 
 load_dotenv(".env.local")
+log = get_logger("api")
 
 app = FastAPI()
+app.add_middleware(TraceMiddleware)
 app.include_router(sandbox.router)
+app.include_router(artifacts.router)
+app.include_router(pypi.router)
 
 client = OpenAI(
     api_key=os.environ.get("OPENAI_API_KEY"),
 )
 
+SESSIONS.set_function(lambda: len(session_containers))
+
+# Optional tool that runs several cells in one call over /sandboxes/{id}/execute_batch
+TOOL_BATCH = os.environ.get("TOOL_BATCH", "0") == "1"
+SANDBOX_TOOLS = ("python_interpreter", "python_batch")
+
 class Request(BaseModel):
     messages: List[ClientMessage]
     session_id: Optional[str] = None
@@ -34,6 +52,32 @@ available_tools = {
     "get_current_weather": get_current_weather,
     "python_interpreter": python_interpreter
 }
+if TOOL_BATCH:
+    available_tools["python_batch"] = python_batch
+
+batch_tool = {
+    "type": "function",
+    "function": {
+        "name": "python_batch",
+        "description": "Execute several python cells in order in one call, e.g. list, inspect, preview and process a file",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "cells": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                    "description": "Code of each cell, run in order in the same kernel."
+                },
+                "stop_on_error": {
+                    "type": "boolean",
+                    "description": "Skip the remaining cells once one fails. Defaults to true."
+                }
+            },
+            "required": ["cells"]
+        }
+    }
+}
 
 def do_stream(messages: List[ChatCompletionMessageParam]):
     try:
@@ -80,12 +124,12 @@ def do_stream(messages: List[ChatCompletionMessageParam]):
                     }
                 }
             }
-            ]
+            ] + ([batch_tool] if TOOL_BATCH else [])
         )
 
         return stream
     except Exception as e:
-        print(f"API Called failed {e}")
+        log.exception("Completion request failed")
         raise HTTPException(status_code=500, detail=f"API Error {str(e)}")
 
 async def stream_text(session_id: str, messages: List[ChatCompletionMessageParam], protocol: str = 'data'):
@@ -105,7 +149,7 @@ async def stream_text(session_id: str, messages: List[ChatCompletionMessageParam
             "**Core Execution Rules:**\n"
             "- Execute Python code using the `python_interpreter` tool.\n"
             "- Always use `print()` statements for outputs—never return silent results.\n"
-            "- For file operations: First check `import os; print(os.listdir('/uploaded_files/'))` before processing.\n"
+            f"- For file operations: First check `import os; print(os.listdir('{session_workdir(session_id)}'))` before processing.\n"
             "- Install missing packages using `!pip install package_name` (try `--upgrade` if installation fails).\n"
             "- Display visualizations directly—do not save them.\n"
             "- Never access the `/app/` directory.\n"
@@ -114,7 +158,11 @@ async def stream_text(session_id: str, messages: List[ChatCompletionMessageParam
             
             "**Available Tools:**\n"
             "- `python_interpreter(code)`: Execute Python code for computations, data analysis, visualizations, and workflow automation.\n"
-            "- `get_current_weather(latitude, longitude)`: Retrieve weather data for location-based queries.\n\n"
+            "- `get_current_weather(latitude, longitude)`: Retrieve weather data for location-based queries.\n"
+            + (
+                "- `python_batch(cells, stop_on_error)`: Execute several dependent cells in one call instead of one `python_interpreter` call each.\n"
+                if TOOL_BATCH else ""
+            ) + "\n"
             
             "**File Workflow:**\n"
             "When users mention files, follow this sequence: List → Inspect → Preview → Process.\n\n"
@@ -144,86 +192,113 @@ async def stream_text(session_id: str, messages: List[ChatCompletionMessageParam
     full_messages = [system_message] + messages
     draft_tool_calls = []
     draft_tool_calls_index = -1
+    encoder = DataStreamEncoder()
+    requested = time.perf_counter()
+    first_token = finished = None
+    llm_span = start_span("llm.stream", model="gpt-4.1", session_id=session_id)
     stream = do_stream(full_messages)
+    chunks = ThreadedStream(stream)
     
     try:
-        for chunk in stream:
+        while True:
+            try:
+                chunk = await chunks.next(timeout=encoder.deadline())
+            except asyncio.TimeoutError:
+                # Held text is due and no chunk arrived to carry it out
+                yield encoder.flush()
+                continue
+            if chunk is STREAM_END:
+                break
+
             for choice in chunk.choices:
+                if first_token is None and (choice.delta.content or choice.delta.tool_calls):
+                    first_token = time.perf_counter()
+                    LLM_FIRST_TOKEN_SECONDS.observe(first_token - requested)
+                    llm_span.set(first_token_ms=round((first_token - requested) * 1000, 3))
+                if choice.finish_reason is not None and finished is None:
+                    # Generation ends here; tool calls below run before the usage chunk arrives
+                    finished = time.perf_counter()
+                    llm_span.set(finish_reason=choice.finish_reason)
+                    llm_span.end()
+
                 if choice.finish_reason == "stop":
                     continue
 
                 elif choice.finish_reason == "tool_calls":
                     
                     for tool_call in draft_tool_calls:
-                        yield '9:{{"toolCallId":"{id}","toolName":"{name}","args":{args}}}\n'.format(
-                            id=tool_call["id"],
-                            name=tool_call["name"],
-                            args=tool_call["arguments"])
+                        yield encoder.tool_call(tool_call["id"], tool_call["name"], tool_call["arguments"])
 
                 
                     for tool_call in draft_tool_calls:
                         tool_function = available_tools[tool_call["name"]]
-                        
-                        try:
-                            if tool_call["name"] == "python_interpreter":
-                                yield '0:{text}\n'.format(text=json.dumps("Executing code..."))
-
-                            # Execute with timeout protection
-                            if asyncio.iscoroutinefunction(tool_function):
-                                if tool_call["name"] == "python_interpreter":
+                        tool_started = time.perf_counter()
+                        outcome = "ok"
+                        with span("tool.call", tool=tool_call["name"]) as tool_span:
+                            try:
+                                if tool_call["name"] in SANDBOX_TOOLS:
+                                    yield encoder.text("Executing code...") + encoder.flush()
+
+                                # Execute with timeout protection
+                                if asyncio.iscoroutinefunction(tool_function):
+                                    if tool_call["name"] in SANDBOX_TOOLS:
                                     
-                                    tool_result = await asyncio.wait_for(
-                                        tool_function(
-                                            session_id=session_id,
-                                            **json.loads(tool_call["arguments"])
-                                        ),
-                                        timeout=300.0 
-                                    )
+                                        tool_result = await asyncio.wait_for(
+                                            tool_function(
+                                                session_id=session_id,
+                                                **json.loads(tool_call["arguments"])
+                                            ),
+                                            timeout=300.0 
+                                        )
+                                    else:
+                                        tool_result = await asyncio.wait_for(
+                                            tool_function(**json.loads(tool_call["arguments"])),
+                                            timeout=60.0 
+                                        )
                                 else:
-                                    tool_result = await asyncio.wait_for(
-                                        tool_function(**json.loads(tool_call["arguments"])),
-                                        timeout=60.0 
-                                    )
-                            else:
-                                tool_result = tool_function(**json.loads(tool_call["arguments"]))
-
-                        except asyncio.TimeoutError:
-                            print(f"Tool execution timeout: {tool_call['name']}")
-
-                            yield '0:{text}\n'.format(text=json.dumps("Execution timed out"))
-
-                            tool_result = {
-                                "code": json.loads(tool_call["arguments"]).get("code", ""),
-                                "outputs": [{
-                                    "output_type": "error",
-                                    "ename": "TimeoutError",
-                                    "evalue": "Execution timed out after 5 minutes",
-                                    "traceback": ["Tool execution exceeded maximum time limit"]
-                                }],
-                                "success": False
-                            }
-                        except Exception as e:
-                            print(f"Tool execution error: {tool_call['name']} - {str(e)}")
-
-                            yield '0:{text}\n'.format(text=json.dumps("Execution Failed"))
-
-                            tool_result = {
-                                "code": json.loads(tool_call["arguments"]).get("code", ""),
-                                "outputs": [{
-                                    "output_type": "error",
-                                    "ename": "ExecutionError",
-                                    "evalue": str(e),
-                                    "traceback": [f"Tool execution failed: {str(e)}"]
-                                }],
-                                "success": False
-                            }
+                                    tool_result = tool_function(**json.loads(tool_call["arguments"]))
+
+                            except asyncio.TimeoutError:
+                                log.warning("Tool call timed out", extra={"tool": tool_call["name"]})
+                                outcome = "timeout"
+                                TOOL_TIMEOUTS.labels(tool=tool_call["name"]).inc()
+
+                                yield encoder.text("Execution timed out") + encoder.flush()
+
+                                tool_result = {
+                                    "code": json.loads(tool_call["arguments"]).get("code", ""),
+                                    "outputs": [{
+                                        "output_type": "error",
+                                        "ename": "TimeoutError",
+                                        "evalue": "Execution timed out after 5 minutes",
+                                        "traceback": ["Tool execution exceeded maximum time limit"]
+                                    }],
+                                    "success": False
+                                }
+                            except Exception as e:
+                                log.exception("Tool call failed", extra={"tool": tool_call["name"]})
+                                outcome = "error"
+
+                                yield encoder.text("Execution Failed") + encoder.flush()
+
+                                tool_result = {
+                                    "code": json.loads(tool_call["arguments"]).get("code", ""),
+                                    "outputs": [{
+                                        "output_type": "error",
+                                        "ename": "ExecutionError",
+                                        "evalue": str(e),
+                                        "traceback": [f"Tool execution failed: {str(e)}"]
+                                    }],
+                                    "success": False
+                                }
+
+                            tool_span.set(outcome=outcome)
+                        TOOL_SECONDS.labels(tool=tool_call["name"], outcome=outcome).observe(time.perf_counter() - tool_started)
 
                         # Always send result
-                        yield 'a:{{"toolCallId":"{id}","toolName":"{name}","args":{args},"result":{result}}}\n'.format(
-                            id=tool_call["id"],
-                            name=tool_call["name"],
-                            args=tool_call["arguments"],
-                            result=json.dumps(tool_result))
+                        yield encoder.tool_result(tool_call["id"], tool_call["name"], tool_call["arguments"], tool_result)
+                        if isinstance(tool_result, dict) and tool_result.get("resized"):
+                            yield encoder.data({"type": "sandbox_resized", **tool_result["resized"]})
 
                 elif choice.delta.tool_calls:
                     for tool_call in choice.delta.tool_calls:
@@ -239,25 +314,39 @@ async def stream_text(session_id: str, messages: List[ChatCompletionMessageParam
                             draft_tool_calls[draft_tool_calls_index]["arguments"] += arguments
 
                 else:
-                    yield '0:{text}\n'.format(text=json.dumps(choice.delta.content))
+                    frame = encoder.text(choice.delta.content)
+                    if frame:
+                        yield frame
 
             if chunk.choices == []:
                 usage = chunk.usage
                 prompt_tokens = usage.prompt_tokens
                 completion_tokens = usage.completion_tokens
-
-                yield 'e:{{"finishReason":"{reason}","usage":{{"promptTokens":{prompt},"completionTokens":{completion}}},"isContinued":false}}\n'.format(
-                    reason="tool-calls" if len(draft_tool_calls) > 0 else "stop",
-                    prompt=prompt_tokens,
-                    completion=completion_tokens
+                LLM_TOKENS.labels(kind="prompt").inc(prompt_tokens)
+                LLM_TOKENS.labels(kind="completion").inc(completion_tokens)
+                if first_token is not None and finished is not None and finished > first_token:
+                    LLM_TOKENS_PER_SECOND.observe(completion_tokens / (finished - first_token))
+
+                yield encoder.finish(
+                    "tool-calls" if len(draft_tool_calls) > 0 else "stop",
+                    prompt_tokens,
+                    completion_tokens
                 )
-                
+
+        llm_span.end()
+
+        # Release whatever text is still held in the coalescing window
+        tail = encoder.flush()
+        if tail:
+            yield tail
+
     except Exception as e:
-        print(f"Streaming error: {str(e)}")
+        log.exception("Streaming error")
+        llm_span.end(error=e)
         # Send error completion
-        yield 'e:{{"finishReason":"error","error":"{error}","isContinued":false}}\n'.format(
-            error=json.dumps(str(e))
-        )
+        yield encoder.error(e)
+    finally:
+        chunks.close()
 
 @app.post("/api/sessions/{session_id}/initialize")
 async def initialize_session(session_id: str):
@@ -286,7 +375,7 @@ async def initialize_session(session_id: str):
         }
         
     except Exception as e:
-        print(f"Session initialization failed: {e}")
+        log.warning("Session initialization failed", extra={"session_id": session_id, "error": str(e)})
         return {
             "status": "failed",
             "session_id": session_id,
@@ -308,6 +397,10 @@ async def handle_chat_data(request: Request, protocol: str = Query('data')):
     # except Exception as e:
     #     print(f"Initial Pod creation failed: {e}")
     
+    if current_span.get() is not None:
+        current_span.get().set(session_id=session_id)
+    annotate(session_id=session_id)
+
     openai_messages = convert_to_openai_messages(messages)
 
     response = StreamingResponse(stream_text(session_id, openai_messages, protocol))
@@ -320,9 +413,8 @@ async def upload_file_by_session(
     session_id: str = Query(...)
 ):
     
-    print(f"Session id: {session_id}")
-    print(f"session_containers: {session_containers}")
-    print(f"File name:{file.filename}")
+    annotate(session_id=session_id)
+    log.debug("Upload by session", extra={"filename": file.filename})
 
     if session_id not in session_containers:
         raise HTTPException(status_code=404, detail="No active sandbox for this session")
@@ -331,6 +423,10 @@ async def upload_file_by_session(
     
     return await upload_file_to_sandbox(sandbox_id, file)
 
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
+
 @app.get("/")
 @app.post("/")
 async def root_health_check():
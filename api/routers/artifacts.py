@@ -0,0 +1,142 @@
+import os
+import re
+import hmac
+import uuid
+import asyncio
+import hashlib
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from utils.artifacts import (
+    artifact_store, artifact_token, ARTIFACT_ID, ARTIFACT_TOKEN, ARTIFACT_MIME_TYPES, ARTIFACT_UPLOAD_MAX_BYTES
+)
+
+CHUNK_SIZE = 64 * 1024
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+# Served inline; anything else is a download, so the origin never renders uploaded HTML or script
+INLINE_TYPES = ("text/plain", "application/json", "application/octet-stream")
+
+router = APIRouter()
+
+def check_artifact_id(artifact_id: str):
+    if not ARTIFACT_ID.fullmatch(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+def parse_range(header: str, size: int):
+    """Parse a single `bytes=` range into inclusive (start, end), or raise 416"""
+    match = RANGE.fullmatch(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def read_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def inline(content_type: str):
+    return content_type in INLINE_TYPES or (content_type.startswith("image/") and content_type != "image/svg+xml")
+
+async def put_artifact(artifact_id: str, request: Request):
+    check_artifact_id(artifact_id)
+    name = request.headers.get("x-sandbox-name", "")
+    token = request.headers.get("x-artifact-token", "")
+    if not name or not hmac.compare_digest(token.encode(), artifact_token(name).encode()):
+        raise HTTPException(status_code=403, detail="Invalid artifact token")
+
+    # Only what sandboxes offload (utils/artifacts.py), so a leaked token cannot host anything else
+    content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip().lower()
+    if content_type not in ARTIFACT_MIME_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported artifact type {content_type}")
+
+    too_large = HTTPException(status_code=413, detail=f"Artifact exceeds {ARTIFACT_UPLOAD_MAX_BYTES} bytes")
+    if int(request.headers.get("content-length") or 0) > ARTIFACT_UPLOAD_MAX_BYTES:
+        raise too_large
+
+    await asyncio.to_thread(artifact_store.load)
+    partial = os.path.join(artifact_store.root, f"{artifact_id}.{uuid.uuid4().hex[:8]}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > ARTIFACT_UPLOAD_MAX_BYTES:
+                    raise too_large
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+
+        if digest.hexdigest() != artifact_id:
+            raise HTTPException(status_code=400, detail="Artifact id does not match content hash")
+        created = await asyncio.to_thread(artifact_store.put_file, artifact_id, partial, content_type)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return Response(status_code=201 if created else 200)
+
+# Uploads come from sandboxes, which are given a token derived from ARTIFACT_TOKEN; without it there is
+# no way to tell them apart from anyone else reaching /api, so the route is not served at all
+if ARTIFACT_TOKEN:
+    router.put("/api/artifacts/{artifact_id}")(put_artifact)
+
+@router.head("/api/artifacts/{artifact_id}")
+@router.get("/api/artifacts/{artifact_id}")
+async def get_artifact(artifact_id: str, request: Request):
+    check_artifact_id(artifact_id)
+
+    artifact = artifact_store.get(artifact_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    path, content_type, size = artifact
+
+    # Content-addressed, so the hash is a strong validator and the body never changes
+    headers = {
+        "ETag": f'"{artifact_id}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff"
+    }
+    if not inline(content_type):
+        headers["Content-Disposition"] = f'attachment; filename="{artifact_id}"'
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if f'"{artifact_id}"' in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == f'"{artifact_id}"'):
+        start, end = parse_range(range_header, size)
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=content_type)
+
+    return StreamingResponse(
+        read_file(path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=content_type
+    )
@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import asyncio
+import time
+import tempfile
+from typing import List
+
+from pydantic import BaseModel
+from fastapi import HTTPException, APIRouter, UploadFile, File, WebSocket, WebSocketDisconnect, Request, Response
+from fastapi.responses import StreamingResponse
+
+from utils.kernel import kernel_session, kernel_pool, SANDBOX_MODE, DEFAULT_KERNEL
+from utils.isolation import isolation_unavailable
+from utils.workspace import build_snapshot, restore_snapshot
+from utils.cgroup import read_stats
+from utils.notebook import run_cells
+from utils.tracing import span
+
+# Routes served inside a sandbox pod by sandbox_app.py. Every kernel route also exists under
+# /kernels/{kernel_id}/... for shared pods; the unprefixed form addresses the pod's only kernel.
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 16 * 1024 * 1024
+STARTED_AT = time.time()
+BATCH_MAX_CELLS = int(os.environ.get("SANDBOX_BATCH_MAX_CELLS", "500"))
+
+router = APIRouter()
+
+class ExecuteRequest(BaseModel):
+    code: str
+
+class BatchRequest(BaseModel):
+    cells: List[str]
+    # Cells after the first failing one are reported as skipped instead of run
+    stop_on_error: bool = True
+
+class SnapshotRequest(BaseModel):
+    manifest: dict = {}
+
+KERNEL_ID = re.compile(r"[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?")
+
+def get_kernel(kernel_id: str):
+    if SANDBOX_MODE != "shared":
+        if kernel_id != DEFAULT_KERNEL:
+            raise HTTPException(status_code=404, detail="Kernel not found")
+        return kernel_session
+
+    kernel = kernel_pool.get(kernel_id)
+    if kernel is None:
+        raise HTTPException(status_code=404, detail="Kernel not found")
+    return kernel
+
+async def execute_code_inside(kernel, code: str):
+    async def stream_results():
+        with span("kernel.execute") as current:
+            try:
+                async for line in kernel.execute(code):
+                    yield line
+            except asyncio.CancelledError:
+                current.set(cancelled=True)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def execute_cells_inside(kernel, cells: List[str], stop_on_error: bool, replay: bool = False):
+    async def stream_results():
+        with span("kernel.execute_batch", cells=len(cells), stop_on_error=stop_on_error, replay=replay) as current:
+            try:
+                async for line in run_cells(kernel, cells, stop_on_error, replay):
+                    yield line
+            except asyncio.CancelledError:
+                current.set(cancelled=True)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def check_cells(cells: List[str]):
+    if not cells or any(not code.strip() for code in cells):
+        raise HTTPException(status_code=400, detail="Every cell needs code")
+    if len(cells) > BATCH_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_CELLS} cells per batch")
+
+@router.post("/kernels/{kernel_id}")
+async def create_kernel(kernel_id: str):
+    """Start a tenant kernel in this shared pod; returns once it is ready"""
+    if SANDBOX_MODE != "shared":
+        raise HTTPException(status_code=409, detail="Sandbox is not a shared pod")
+    if not KERNEL_ID.fullmatch(kernel_id) or kernel_id == DEFAULT_KERNEL:
+        raise HTTPException(status_code=400, detail="Invalid kernel id")
+
+    try:
+        await kernel_pool.create(kernel_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"id": kernel_id, "kernels": len(kernel_pool.kernels)}
+
+@router.delete("/kernels/{kernel_id}")
+async def delete_kernel(kernel_id: str):
+    if SANDBOX_MODE != "shared" or not await kernel_pool.remove(kernel_id):
+        raise HTTPException(status_code=404, detail="Kernel not found")
+    return {"id": kernel_id, "kernels": len(kernel_pool.kernels)}
+
+@router.get("/kernels")
+async def list_kernels():
+    """Per-kernel usage, which the API uses to bin-pack sessions onto shared pods"""
+    return {"mode": SANDBOX_MODE, "max_kernels": kernel_pool.max_kernels, "kernels": kernel_pool.usage()}
+
+@router.post("/execute")
+@router.post("/kernels/{kernel_id}/execute")
+async def execute_code_in_sandbox(request: ExecuteRequest, kernel_id: str = DEFAULT_KERNEL):
+    """Execute Python code in this sandbox container"""
+    if not request.code.strip():
+        raise HTTPException(status_code=400, detail="Missing 'code' field")
+    
+    return await execute_code_inside(get_kernel(kernel_id), request.code)
+
+@router.post("/execute_batch")
+@router.post("/kernels/{kernel_id}/execute_batch")
+async def execute_batch_in_sandbox(request: BatchRequest, kernel_id: str = DEFAULT_KERNEL):
+    """Execute several cells in this sandbox's kernel over one response"""
+    check_cells(request.cells)
+    return await execute_cells_inside(get_kernel(kernel_id), request.cells, request.stop_on_error)
+
+@router.post("/notebook/replay")
+@router.post("/kernels/{kernel_id}/notebook/replay")
+async def replay_notebook(request: BatchRequest, kernel_id: str = DEFAULT_KERNEL):
+    """Execute a notebook's code cells, skipping the unchanged ones this kernel's last replay ran"""
+    check_cells(request.cells)
+    return await execute_cells_inside(get_kernel(kernel_id), request.cells, request.stop_on_error, replay=True)
+
+@router.websocket("/ws")
+@router.websocket("/kernels/{kernel_id}/ws")
+async def kernel_channel(websocket: WebSocket, kernel_id: str = DEFAULT_KERNEL):
+    """Sandbox end of the API's persistent channel (see utils/channel.py)"""
+    try:
+        kernel = get_kernel(kernel_id)
+    except HTTPException:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    tasks = {}
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def run(execution_id, code, allow_stdin, traceparent):
+        async def on_input(prompt, password):
+            await send({"type": "input_request", "id": execution_id, "prompt": prompt, "password": password})
+
+        # Executions share one socket, so each carries its own trace context in the frame
+        with span("kernel.execute", traceparent, kind="server", execution_id=execution_id) as current:
+            try:
+                async for line in kernel.execute(code, execution_id, on_input if allow_stdin else None):
+                    await send({"type": "output", "id": execution_id, "data": line})
+                await send({"type": "done", "id": execution_id})
+            except asyncio.CancelledError:
+                current.set(cancelled=True)
+            except Exception as e:
+                current.set(error=str(e))
+                await send({"type": "error", "id": execution_id, "detail": str(e)})
+            finally:
+                tasks.pop(execution_id, None)
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                if not isinstance(message, dict):
+                    raise ValueError("not a JSON object")
+            except (ValueError, KeyError) as e:
+                # A bad frame fails on its own; the executions sharing the socket carry on
+                await send({"type": "error", "id": None, "detail": f"Invalid frame: {str(e)}"})
+                continue
+            kind = message.get("type")
+            execution_id = message.get("id")
+
+            if kind == "execute":
+                code = message.get("code")
+                if not isinstance(execution_id, str) or not isinstance(code, str) or execution_id in tasks:
+                    await send({"type": "error", "id": execution_id, "detail": "Invalid execute frame"})
+                    continue
+                tasks[execution_id] = asyncio.create_task(
+                    run(execution_id, code, bool(message.get("allow_stdin", False)), message.get("traceparent"))
+                )
+            elif kind == "interrupt":
+                if kernel.current == execution_id:
+                    await kernel.interrupt()
+                elif execution_id in tasks:
+                    tasks[execution_id].cancel()
+            elif kind == "input_reply":
+                if not isinstance(message.get("value"), str):
+                    await send({"type": "error", "id": None, "detail": "Invalid input_reply frame"})
+                    continue
+                kernel.input(message["value"])
+            elif kind == "ping":
+                await send({"type": "pong", "ts": message.get("ts"), "busy": kernel.busy})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in list(tasks.values()):
+            task.cancel()
+
+@router.post("/health")
+@router.get("/health")
+async def health_check():
+    return {"status": "healthy", "timestamp": time.time()}
+
+@router.get("/health/ready")
+async def readiness_check():
+    # Shared pods start kernels on demand, so they are ready as soon as they serve requests,
+    # unless they cannot isolate the kernels they would start
+    unisolated = isolation_unavailable() if SANDBOX_MODE == "shared" else None
+    if unisolated:
+        raise HTTPException(status_code=503, detail=unisolated)
+    if SANDBOX_MODE != "shared" and not kernel_session.ready:
+        raise HTTPException(status_code=503, detail="Kernel is still starting")
+    return {"status": "ready", "preloaded": kernel_session.preload_modules, "timestamp": time.time()}
+
+@router.post("/kernel/checkpoint")
+@router.post("/kernels/{kernel_id}/checkpoint")
+async def checkpoint_kernel(kernel_id: str = DEFAULT_KERNEL):
+    """Pickle kernel globals into the workspace ahead of a snapshot (KERNEL_CHECKPOINT=1 only)"""
+    result = await get_kernel(kernel_id).checkpoint()
+    return {"checkpointed": result is not None, **(result or {})}
+
+@router.get("/stats")
+async def sandbox_stats():
+    """cgroup CPU, memory, PID and IO counters of this sandbox, plus the state of its kernels"""
+    if SANDBOX_MODE == "shared":
+        kernels = {kernel_id: kernel.stats() for kernel_id, kernel in kernel_pool.kernels.items()}
+    else:
+        kernels = {DEFAULT_KERNEL: kernel_session.stats()}
+    return {
+        "mode": SANDBOX_MODE,
+        "uptime_seconds": round(time.time() - STARTED_AT, 3),
+        "cgroup": read_stats(),
+        "kernels": kernels,
+        "timestamp": time.time()
+    }
+
+@router.get("/kernels/{kernel_id}/stats")
+async def kernel_stats(kernel_id: str):
+    return {"kernels": {kernel_id: get_kernel(kernel_id).stats()}, "timestamp": time.time()}
+
+@router.post("/upload")
+@router.post("/kernels/{kernel_id}/upload")
+async def upload_file(file: UploadFile = File(...), kernel_id: str = DEFAULT_KERNEL):
+    """Write an uploaded file into this sandbox's upload directory"""
+    kernel = get_kernel(kernel_id)
+    filename = os.path.basename(file.filename or "")
+    if filename in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+
+    os.makedirs(kernel.workdir, exist_ok=True)
+    path = os.path.join(kernel.workdir, filename)
+    size = 0
+
+    with open(path + ".part", "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await asyncio.to_thread(f.write, chunk)
+            size += len(chunk)
+    os.replace(path + ".part", path)
+    if kernel.isolation is not None:
+        kernel.isolation.adopt(path)
+
+    return {"filename": filename, "size": size, "path": path}
+
+@router.post("/workspace/snapshot")
+@router.post("/kernels/{kernel_id}/workspace/snapshot")
+async def snapshot_workspace(request: SnapshotRequest, kernel_id: str = DEFAULT_KERNEL):
+    """Gzipped tar of workspace files changed since the caller's manifest, or 204 if none changed"""
+    kernel = get_kernel(kernel_id)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    changed = await asyncio.to_thread(build_snapshot, spool, request.manifest, kernel.workdir)
+    if not changed:
+        spool.close()
+        return Response(status_code=204)
+
+    spool.seek(0)
+
+    def read_spool():
+        with spool:
+            while chunk := spool.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+
+    return StreamingResponse(read_spool(), media_type="application/gzip")
+
+@router.post("/workspace/restore")
+@router.post("/kernels/{kernel_id}/workspace/restore")
+async def restore_workspace(request: Request, kernel_id: str = DEFAULT_KERNEL):
+    """Apply one snapshot layer; the API sends layers oldest first"""
+    kernel = get_kernel(kernel_id)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    try:
+        with spool:
+            files = await asyncio.to_thread(restore_snapshot, spool, kernel.workdir)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if kernel.isolation is not None:
+        await asyncio.to_thread(kernel.isolation.adopt, kernel.workdir)
+    return {"files": files}
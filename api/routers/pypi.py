@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import httpx
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from utils.artifacts import ArtifactStore, ARTIFACT_ID
+from utils.log import get_logger
+from routers.artifacts import read_file
+
+# Caching package proxy that sandboxes point pip at (PIP_INDEX_URL=<api>/pypi/simple/).
+# Distribution files are stored by their sha256 from the index, so a hit is served from disk.
+PYPI_INDEX_URL = os.environ.get("PYPI_INDEX_URL", "https://pypi.org/simple").rstrip("/")
+PYPI_FILE_HOSTS = set(os.environ.get("PYPI_FILE_HOSTS", "files.pythonhosted.org").split(","))
+PYPI_CACHE_DIR = os.environ.get("PYPI_CACHE_DIR", "/tmp/pypi-cache")
+PYPI_CACHE_MAX_BYTES = int(os.environ.get("PYPI_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024)))
+PYPI_INDEX_TTL = float(os.environ.get("PYPI_INDEX_TTL", "600"))
+# Project pages kept, least recently used dropped first; expired pages are still served if the index is down
+PYPI_INDEX_CACHE_SIZE = int(os.environ.get("PYPI_INDEX_CACHE_SIZE", "2048"))
+
+FILE_LINK = re.compile(r'href="https?://([^/"]+)/([^"#]+)#sha256=([0-9a-f]{64})"')
+PROJECT_NAME = re.compile(r"[A-Za-z0-9._-]+")
+
+package_store = ArtifactStore(PYPI_CACHE_DIR, PYPI_CACHE_MAX_BYTES)
+pypi_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), follow_redirects=True)
+log = get_logger("pypi")
+index_cache = OrderedDict()
+stats = {"hits": 0, "misses": 0, "passthrough": 0, "bytes_from_cache": 0, "bytes_from_upstream": 0}
+
+router = APIRouter()
+
+def rewrite_links(html: str):
+    return FILE_LINK.sub(lambda m: f'href="/pypi/files/{m.group(3)}/{m.group(1)}/{m.group(2)}#sha256={m.group(3)}"', html)
+
+@router.get("/pypi/simple/{project}/")
+async def project_index(project: str):
+    if not PROJECT_NAME.fullmatch(project):
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    cached = index_cache.get(project)
+    if cached is not None:
+        index_cache.move_to_end(project)
+        if cached[0] > time.monotonic():
+            return Response(content=cached[1], media_type="text/html")
+
+    try:
+        response = await pypi_client.get(f"{PYPI_INDEX_URL}/{project}/", headers={"Accept": "text/html"})
+    except httpx.HTTPError as e:
+        # Serve a stale index rather than failing the install
+        if cached is not None:
+            return Response(content=cached[1], media_type="text/html")
+        raise HTTPException(status_code=502, detail=f"Package index unavailable: {str(e)}")
+
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not response.is_success:
+        raise HTTPException(status_code=502, detail=f"Package index returned {response.status_code}")
+
+    html = rewrite_links(response.text)
+    index_cache[project] = (time.monotonic() + PYPI_INDEX_TTL, html)
+    index_cache.move_to_end(project)
+    if len(index_cache) > PYPI_INDEX_CACHE_SIZE:
+        index_cache.popitem(last=False)
+    return Response(content=html, media_type="text/html")
+
+async def open_upstream(url: str):
+    """Start an upstream download, so a failure becomes an error status instead of a truncated 200"""
+    try:
+        response = await pypi_client.send(pypi_client.build_request("GET", url), stream=True)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Package file unavailable: {str(e)}")
+    if not response.is_success:
+        await response.aclose()
+        raise HTTPException(status_code=response.status_code, detail="Upstream file unavailable")
+    return response
+
+async def passthrough(response: httpx.Response):
+    async for chunk in response.aiter_bytes():
+        yield chunk
+
+async def fetch_and_store(response: httpx.Response, sha256: str):
+    """Stream an upstream file to the client while writing it into the cache"""
+    partial = os.path.join(package_store.root, f"{sha256}.{uuid.uuid4().hex[:8]}.part")
+    digest = hashlib.sha256()
+
+    try:
+        with open(partial, "wb") as f:
+            async for chunk in response.aiter_bytes():
+                await asyncio.to_thread(f.write, chunk)
+                digest.update(chunk)
+                stats["bytes_from_upstream"] += len(chunk)
+                yield chunk
+
+        if digest.hexdigest() == sha256:
+            await asyncio.to_thread(package_store.put_file, sha256, partial, "application/octet-stream")
+        else:
+            log.warning("Hash mismatch, not caching", extra={"url": str(response.url)})
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+@router.get("/pypi/files/{sha256}/{host}/{path:path}")
+async def package_file(sha256: str, host: str, path: str):
+    if host not in PYPI_FILE_HOSTS or not ARTIFACT_ID.fullmatch(sha256):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    url = f"https://{host}/{path}"
+    # PEP 658 metadata sidecars carry their own hash; they are small, so just relay them
+    if path.endswith(".metadata"):
+        stats["passthrough"] += 1
+        response = await open_upstream(url)
+        return StreamingResponse(
+            passthrough(response),
+            media_type="application/octet-stream",
+            background=BackgroundTask(response.aclose)
+        )
+
+    cached = package_store.get(sha256)
+    if cached is not None:
+        file_path, _, size = cached
+        stats["hits"] += 1
+        stats["bytes_from_cache"] += size
+        return StreamingResponse(
+            read_file(file_path, 0, size),
+            media_type="application/octet-stream",
+            headers={"Content-Length": str(size)}
+        )
+
+    stats["misses"] += 1
+    response = await open_upstream(url)
+    return StreamingResponse(
+        fetch_and_store(response, sha256),
+        media_type="application/octet-stream",
+        background=BackgroundTask(response.aclose)
+    )
+
+@router.get("/pypi/stats")
+async def package_cache_stats():
+    lookups = stats["hits"] + stats["misses"]
+    package_store.load()
+    return {
+        **stats,
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        "entries": len(package_store.entries),
+        "size_bytes": package_store.total,
+        "max_bytes": package_store.max_bytes
+    }
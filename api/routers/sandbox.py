@@ -4,621 +4,727 @@ import asyncio
 import time
 import httpx
 import uuid
-import traceback
 import base64
 from io import BytesIO
 
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
+from typing import List, Optional
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException, APIRouter, UploadFile, File
 from fastapi.responses import StreamingResponse
-from jupyter_client.manager import AsyncKernelManager
+import websockets
 
-from kubernetes import client, config
-import kubernetes.client.exceptions as k8s_exceptions
-from kubernetes.stream import stream
+from utils.channel import get_channel, close_channel, ChannelClosed
+from utils.snapshots import snapshot_store
+from utils.reaper import IdleReaper
+from utils.profiles import (
+    PROFILES, DEFAULT_PROFILE, rank, next_profile, profile_for_upload, resize_reason
+)
+from utils.placement import split_sandbox_id
+from utils.notebook import notebook_cells
+from utils.metrics import (
+    SESSION_ASSIGNMENTS, KERNEL_CLAIM_SECONDS, EXECUTE_SECONDS, EXECUTE_OUTPUT_BYTES,
+    EXECUTIONS_IN_FLIGHT, UPLOAD_BYTES, UPLOAD_BYTES_PER_SECOND, SANDBOXES
+)
+from utils.tracing import span, traced
+from utils.log import get_logger, annotate
+from backends import get_backend, hx, kernel_path
 
 load_dotenv(".env.local")
+log = get_logger("sandbox")
 
 # Configuration
-IMAGE_NAME = os.environ.get(
-    "SANDBOX_IMAGE", 
-    "us-central1-docker.pkg.dev/exalted-crane-459000-g5/backend/backend-api:17"
-)
-SANDBOX_PREFIX = "sandbox-"
-SANDBOX_PORT = 8000
-IDLE_TIMEOUT = 3600
-CHECK_INTERVAL = 3600
-
-# k8s client init
-k8s_v1 = None
-k8s_apps = None
+# Sandboxes are deleted this long after their last activity; heartbeats may lease up to SANDBOX_MAX_LEASE
+IDLE_TIMEOUT = float(os.environ.get("SANDBOX_IDLE_TIMEOUT", "3600"))
+MAX_LEASE = float(os.environ.get("SANDBOX_MAX_LEASE", str(4 * 3600)))
+# How often the reaper adopts sandboxes it has no deadline for (e.g. after an API restart)
+RESYNC_INTERVAL = float(os.environ.get("SANDBOX_REAPER_RESYNC", "300"))
+# Workspace snapshots are taken this long after the last upload or execution, and on idle reap
+SNAPSHOT_DEBOUNCE = float(os.environ.get("SNAPSHOT_DEBOUNCE", "60"))
+EXECUTION_TAIL_CHARS = 4096
+# Largest .ipynb accepted for replay; outputs stored in the notebook count too
+NOTEBOOK_MAX_BYTES = int(os.environ.get("NOTEBOOK_MAX_BYTES", str(64 * 1024 * 1024)))
+# GET /sandboxes asks every running sandbox for its /stats; slow ones are reported without
+STATS_TIMEOUT = float(os.environ.get("SANDBOX_STATS_TIMEOUT", "1"))
+# Bin-pack sessions as kernels onto multi-tenant pods instead of one pod per session (utils/placement.py)
+SANDBOX_SHARED = os.environ.get("SANDBOX_SHARED", "0") == "1"
+
+# Pods, containers or local processes, per SANDBOX_BACKEND (backends/)
+backend = get_backend()
+
+sandbox_sessions = {}
+restores = {}
+snapshot_timers = {}
+snapshot_locks = {}
+sandbox_profiles = {}
+session_profiles = {}
+
+async def reap_sandbox(sandbox_id: str):
+    """Save and release an idle sandbox; returns the host to delete, if any"""
+    name, kernel_id = split_sandbox_id(sandbox_id)
+    session_id = sandbox_sessions.get(sandbox_id)
+    try:
+        record = await backend.get(name)
+    except HTTPException:
+        record = None
+
+    if record is not None and kernel_id is None and record["shared"]:
+        # A shared pod is only reaped once its last tenant kernel is gone
+        if await backend.tenants(name):
+            reaper.touch(name)
+            return
+
+    log.info("Terminating idle sandbox", extra={"sandbox_id": sandbox_id})
+    if record is not None:
+        if kernel_id is None:
+            session_id = session_id or record["session_id"]
+        if session_id and record["status"] == "Running":
+            await checkpoint_kernel(sandbox_id)
+            await snapshot_workspace(sandbox_id, session_id)
+    await cleanup_sandbox_resources(sandbox_id, delete=False)
+    return None if kernel_id else name
+
+async def reap_sandboxes(sandbox_ids):
+    results = await asyncio.gather(*(reap_sandbox(sandbox_id) for sandbox_id in sandbox_ids), return_exceptions=True)
+    for sandbox_id, result in zip(sandbox_ids, results):
+        if isinstance(result, Exception):
+            log.error("Reaping failed", extra={"sandbox_id": sandbox_id, "error": str(result)})
+    # Hosts are deleted together, so backends can batch the work (e.g. backends/docker.py)
+    names = [result for result in results if isinstance(result, str)]
+    if names:
+        await backend.delete_many(names)
+
+reaper = IdleReaper(IDLE_TIMEOUT, MAX_LEASE, reap_sandboxes)
+SANDBOXES.set_function(lambda: len(reaper.deadlines))
+
+async def track_sandboxes():
+    """Give every sandbox a deadline, including ones created before this API process started"""
+    if not backend.available:
+        return
 
-print(f"Sandbox chekc: {os.environ.get('IS_SANDBOX')}")
-print(f"Not sandbox check: {not os.environ.get('IS_SANDBOX')}")
+    while True:
+        for record in await backend.list():
+            if record["deleting"]:
+                continue
+            if reaper.expires_at(record["name"]) is None:
+                reaper.touch(record["name"])
+            if record["shared"] and record["status"] == "Running":
+                for kernel_id in await backend.tenants(record["name"]):
+                    if reaper.expires_at(f"{record['name']}.{kernel_id}") is None:
+                        reaper.touch(f"{record['name']}.{kernel_id}")
+        await asyncio.sleep(RESYNC_INTERVAL)
+
+async def sweep_snapshots():
+    """Expire snapshots of sessions that have not had a sandbox for SNAPSHOT_TTL, and cap the store's size"""
+    while True:
+        await asyncio.sleep(RESYNC_INTERVAL)
+        try:
+            deleted = await asyncio.to_thread(snapshot_store.sweep, set(sandbox_sessions.values()))
+        except OSError as e:
+            log.warning("Snapshot sweep failed", extra={"error": str(e)})
+            continue
+        if deleted:
+            log.info("Snapshots expired", extra={"sessions": len(deleted)})
+
+def require_backend():
+    if not backend.available:
+        raise HTTPException(status_code=500, detail=f"Sandbox backend '{backend.name}' not available")
+
+async def sandbox_url(sandbox_id: str, path: str, scheme: str = "http"):
+    return await backend.url(sandbox_id, path, scheme)
+
+def record_heartbeat(sandbox_id: str, busy: bool):
+    # A kernel that is still running a cell counts as activity, without per-chunk bookkeeping
+    if busy:
+        reaper.touch(sandbox_id)
+
+def release_session(sandbox_id: str):
+    # The next request for this session gets a fresh sandbox, restored from its snapshot
+    from utils.tools import session_containers
+
+    session_id = sandbox_sessions.pop(sandbox_id, None)
+    if session_id and session_containers.get(session_id) == sandbox_id:
+        session_containers.pop(session_id, None)
+
+async def cleanup_sandbox_resources(sandbox_id: str, delete: bool = True):
+    reaper.forget(sandbox_id)
+    await close_channel(sandbox_id)
+    release_session(sandbox_id)
+    restores.pop(sandbox_id, None)
+    timer = snapshot_timers.pop(sandbox_id, None)
+    if timer is not None:
+        timer.cancel()
+
+    name, kernel_id = split_sandbox_id(sandbox_id)
+    if kernel_id is not None:
+        # Tenant of a shared pod: stop its kernel; the pod stays for other tenants and is
+        # reaped on its own deadline once empty
+        try:
+            await backend.release(sandbox_id)
+        except (httpx.HTTPError, HTTPException) as e:
+            log.warning("Stopping kernel failed", extra={"sandbox_id": sandbox_id, "error": str(e)})
+        reaper.touch(name)
+        return
 
-# if not os.environ.get("IS_SANDBOX"):
-if os.environ.get("IS_SANDBOX") != "1":
-    print(f"IS_SANDBOX = {os.environ.get('IS_SANDBOX')}")
+    sandbox_profiles.pop(sandbox_id, None)
+    if delete:
+        await backend.delete(sandbox_id)
 
-    config_loaded = False
+async def checkpoint_kernel(sandbox_id: str):
+    """Ask the sandbox to pickle its kernel globals before its workspace is snapshotted"""
     try:
-        config.load_incluster_config()
-        config_loaded = True
-        print("Loaded cluster config")
-    except config.ConfigException:
+        path = "/checkpoint" if split_sandbox_id(sandbox_id)[1] else "/kernel/checkpoint"
+        response = await hx.post(await sandbox_url(sandbox_id, path), headers=backend.headers(sandbox_id), timeout=120.0)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("checkpointed"):
+            log.info("Kernel checkpointed", extra={"sandbox_id": sandbox_id, "variables": len(result.get("saved", [])), "bytes": result.get("bytes", 0)})
+    except (httpx.HTTPError, HTTPException, ValueError) as e:
+        log.warning("Kernel checkpoint failed", extra={"sandbox_id": sandbox_id, "error": str(e)})
+
+async def snapshot_workspace(sandbox_id: str, session_id: str):
+    """Pull an incremental layer of the sandbox workspace into the session's snapshot chain"""
+    async with snapshot_locks.setdefault(session_id, asyncio.Lock()):
         try:
-            config.load_kube_config()
-            config_loaded = True
-            print("Loaded kube config")
-        except config.ConfigException:
-            print("NO config")
-    
-    if config_loaded:
-        k8s_v1 = client.CoreV1Api()
-        k8s_apps = client.AppsV1Api()
-        print("k8s cluster initialized")
-    else:
-        print("k8s config not laoded")
-
-hx = httpx.AsyncClient(timeout=10000.0)
-last_active = {}
-
-async def terminate_idle_sandboxes():
-    if k8s_v1 is None:
+            manifest = await asyncio.to_thread(snapshot_store.manifest, session_id)
+            partial = snapshot_store.new_layer_path(session_id)
+
+            async with hx.stream(
+                "POST",
+                await sandbox_url(sandbox_id, "/workspace/snapshot"),
+                json={"manifest": manifest},
+                headers=backend.headers(sandbox_id),
+                timeout=300.0
+            ) as response:
+                response.raise_for_status()
+                if response.status_code == 204:
+                    return
+                with open(partial, "wb") as f:
+                    async for chunk in response.aiter_bytes():
+                        await asyncio.to_thread(f.write, chunk)
+
+            await asyncio.to_thread(snapshot_store.add_layer, session_id, partial)
+            log.info("Workspace snapshot saved", extra={"sandbox_id": sandbox_id, "session_id": session_id})
+        except (httpx.HTTPError, HTTPException, OSError, ValueError) as e:
+            log.warning("Workspace snapshot failed", extra={"sandbox_id": sandbox_id, "error": str(e)})
+
+def schedule_snapshot(sandbox_id: str):
+    session_id = sandbox_sessions.get(sandbox_id)
+    if not session_id:
         return
 
-    while True:
-        await asyncio.sleep(CHECK_INTERVAL)
-        now = time.time()
-
-        for pod in list_sandboxes():
-            sandbox_id = pod.metadata.name
-            last_time = last_active.get(sandbox_id, None)
-
-            if last_time is None:
-                print(f"Terminating sandbox {sandbox_id}")
-                try:
-                    await cleanup_sandbox_resources(sandbox_id)
-                except k8s_exceptions.ApiException:
-                    pass
-                continue
+    async def snapshot_later():
+        await asyncio.sleep(SNAPSHOT_DEBOUNCE)
+        snapshot_timers.pop(sandbox_id, None)
+        await snapshot_workspace(sandbox_id, session_id)
 
-            if now - last_time > IDLE_TIMEOUT:
-                print(f"Terminating sandbox {sandbox_id}")
-                try:
-                    await cleanup_sandbox_resources(sandbox_id)
-                    last_active.pop(sandbox_id, None)
-                except k8s_exceptions.ApiException:
-                    last_active.pop(sandbox_id, None)
+    timer = snapshot_timers.get(sandbox_id)
+    if timer is not None:
+        timer.cancel()
+    snapshot_timers[sandbox_id] = asyncio.create_task(snapshot_later())
 
-def get_namespace():
-    return os.environ.get("KUBERNETES_NAMESPACE", "app")
+async def restore_workspace(sandbox_id: str, session_id: str):
+    """Replay the session's snapshot layers into a new sandbox while its kernel is still preloading"""
+    layers = await asyncio.to_thread(snapshot_store.layers, session_id)
+    if not layers:
+        return
 
-async def cleanup_sandbox_resources(sandbox_id: str):
-    namespace = get_namespace()
-    
-    try:
-        k8s_v1.delete_namespaced_service(
-            name=f"{sandbox_id}-service",
-            namespace=namespace
-        )
-    except k8s_exceptions.ApiException:
-        pass
+    base_url = await backend.wait_started(split_sandbox_id(sandbox_id)[0])
+    started = time.time()
+    for layer in layers:
+        with open(layer, "rb") as f:
+            response = await hx.post(
+                f"{base_url}{kernel_path(sandbox_id, '/workspace/restore')}",
+                content=f.read(),
+                headers=backend.headers(sandbox_id),
+                timeout=300.0
+            )
+        response.raise_for_status()
+    log.info("Workspace restored", extra={"sandbox_id": sandbox_id, "layers": len(layers), "seconds": round(time.time() - started, 3)})
 
+@traced("sandbox.wait_restore")
+async def wait_for_restore(sandbox_id: str):
+    task = restores.get(sandbox_id)
+    if task is None:
+        return
     try:
-        k8s_v1.delete_namespaced_pod(
-            name=sandbox_id,
-            namespace=namespace
-        )
-    except k8s_exceptions.ApiException:
-        pass
-
-async def wait_for_pod_ready(pod_name: str, namespace: str, timeout: int = 300):
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        try:
-            pod = k8s_v1.read_namespaced_pod(name=pod_name, namespace=namespace)
-            
-            if pod.status.phase == "Running":
-
-                if pod.status.container_statuses:
-                    all_ready = all(
-                        container.ready for container in pod.status.container_statuses
-                    )
-                    if all_ready and pod.status.pod_ip:
-                        return pod
-            
-            await asyncio.sleep(2)
-            
-        except k8s_exceptions.ApiException:
-            await asyncio.sleep(2)
-    
-    raise HTTPException(status_code=504, detail="Pod startup timeout")
+        await task
+    except Exception as e:
+        log.warning("Workspace restore failed", extra={"sandbox_id": sandbox_id, "error": str(e)})
+    restores.pop(sandbox_id, None)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    asyncio.create_task(terminate_idle_sandboxes())
+    tasks = [
+        asyncio.create_task(reaper.run()),
+        asyncio.create_task(track_sandboxes()),
+        asyncio.create_task(sweep_snapshots())
+    ]
+    await backend.start()
     yield
+    for task in tasks:
+        task.cancel()
+    # Local sandboxes are child processes and go down with the API; pods and containers stay
+    await backend.shutdown()
 
 router = APIRouter(lifespan=lifespan)
 
 class CreateSandboxRequest(BaseModel):
     lang: str
+    session_id: Optional[str] = None
+    # small | medium | large (utils/profiles.py); defaults to the session's last profile
+    profile: Optional[str] = None
 
 class ExecuteRequest(BaseModel):
     code: str
-
-def list_sandboxes():
-
-    if k8s_v1 is None:
-        return []
-    
-    try:
-        pods = k8s_v1.list_namespaced_pod(
-            namespace=get_namespace(),
-            label_selector="app=sandbox,sbx=1"
-        )
-        return pods.items
-    except Exception:
-        return []
+    # Relay input() prompts as input_request lines; answer them via .../executions/{id}/input
+    allow_stdin: bool = False
+
+class ExecuteBatchRequest(BaseModel):
+    cells: List[str]
+    stop_on_error: bool = True
+
+class InputReplyRequest(BaseModel):
+    value: str
+
+class HeartbeatRequest(BaseModel):
+    lease: Optional[float] = None
+
+async def fetch_stats(sandbox_id: str):
+    return await backend.stats(sandbox_id, timeout=STATS_TIMEOUT)
+
+def summarize_stats(stats):
+    """Totals across sandboxes, for right-sizing and spotting runaway cells at a glance"""
+    totals = {"memory_bytes": 0, "cpu_seconds": 0.0, "pids": 0, "busy_kernels": 0, "kernels": 0, "reporting": 0}
+    longest = None
+    for sandbox_id, item in stats.items():
+        if item is None:
+            continue
+        totals["reporting"] += 1
+        cgroup = item.get("cgroup") or {}
+        for key in ("memory_bytes", "cpu_seconds", "pids"):
+            totals[key] += cgroup.get(key) or 0
+        for kernel_id, kernel in (item.get("kernels") or {}).items():
+            totals["kernels"] += 1
+            if kernel.get("busy"):
+                totals["busy_kernels"] += 1
+                if longest is None or kernel["busy_seconds"] > longest["busy_seconds"]:
+                    longest = {"sandbox_id": sandbox_id, "kernel": kernel_id, "busy_seconds": kernel["busy_seconds"]}
+    totals["longest_running"] = longest
+    return totals
 
 @router.get("/sandboxes")
-async def get_sandboxes():
+async def get_sandboxes(stats: bool = False):
+    records = await backend.list()
+    # Stats cost one request per running sandbox, so pollers only pay for them with ?stats=1
+    usage = {}
+    if stats:
+        running = [record["name"] for record in records if record["status"] == "Running"]
+        usage = dict(zip(running, await asyncio.gather(*(fetch_stats(name) for name in running))))
+
     sandboxes = [
         {
-            "id": pod.metadata.name, 
-            "name": pod.metadata.name, 
-            "status": pod.status.phase,
-            "ready": pod.status.container_statuses[0].ready if pod.status.container_statuses else False
+            "id": record["name"],
+            "name": record["name"],
+            "status": record["status"],
+            "ready": record["ready"],
+            "expires_at": reaper.expires_at(record["name"]),
+            "shared": record["shared"],
+            "profile": record["profile"],
+            "stats": usage.get(record["name"])
         }
-        for pod in list_sandboxes()
+        for record in records
     ]
-    return {"sandboxes": sandboxes}
+    response = {"sandboxes": sandboxes, "backend": backend.name}
+    if stats:
+        response["totals"] = summarize_stats(usage)
+    return response
 
 @router.post("/sandboxes")
+@traced("sandbox.create")
 async def create_sandbox(request: CreateSandboxRequest):
 
-    print(f"Starting sandbox: {request.lang}")
-
     if request.lang.lower() != "python":
         raise HTTPException(status_code=400, detail="Only Python sandboxes are supported.")
 
-    if k8s_v1 is None:
-        print("k8s client None")
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-
-    pod_name = f"{SANDBOX_PREFIX}{str(uuid.uuid4())[:8]}"
-    namespace = get_namespace()
-    print(f"Creating sandbox with name: {pod_name} in namespace: {namespace}")
-    
-    pod_manifest = {
-        "apiVersion": "v1",
-        "kind": "Pod",
-        "metadata": {
-            "name": pod_name,
-            "namespace": namespace,
-            "labels": {
-                "app": "sandbox",
-                "sbx": "1",
-                "sbx_lang": request.lang.lower(),
-                "pod-name": pod_name
-            }
-        },
-        "spec": {
-            "containers": [{
-                "name": "jupyter-sandbox",
-                "image": IMAGE_NAME,
-                "ports": [{"containerPort": SANDBOX_PORT}],
-                "env": [
-                    {"name": "IS_SANDBOX", "value": "1"},
-                    {"name": "PORT", "value": str(SANDBOX_PORT)},
-                    {"name": "OPENAI_API_KEY", "value": os.environ.get("OPENAI_API_KEY", "")}
-                ],
-                "resources":{
-                    "limits": {"memory": "5Gi", "cpu": "500m"},
-                    "requests": {"memory": "2Gi", "cpu": "100m"}
-                },  
-                "volumeMounts": [{ # For resource isolation and mask application code
-                    "name": "uploaded-files",
-                    "mountPath": "/uploaded_files"                    
-                }],
-                "readinessProbe": {
-                    "httpGet": {
-                        "path": "/health",
-                        "port": SANDBOX_PORT
-                    },
-                    "initialDelaySeconds": 5,
-                    "periodSeconds": 3,
-                    "timeoutSeconds": 5
-                },
-                "livenessProbe": {
-                    "httpGet": {
-                        "path": "/health", 
-                        "port": SANDBOX_PORT
-                    },
-                    "initialDelaySeconds": 15,
-                    "periodSeconds": 10,
-                    "timeoutSeconds": 5
-                }
-            }],
-            "volumes": [{
-                "name": "uploaded-files",
-                "emptyDir": {}
-            }],
-            "restartPolicy": "Never"
-        }
-    }
-    
-    service_manifest = {
-        "apiVersion": "v1",
-        "kind": "Service",
-        "metadata": {
-            "name": f"{pod_name}-service",
-            "namespace": namespace,
-            "labels": {
-                "app": "sandbox",
-                "sbx": "1"
-            }
-        },
-        "spec": {
-            "selector": {
-                "app": "sandbox",
-                "sbx": "1",
-                "pod-name": pod_name
-            },
-            "ports": [{
-                "port": SANDBOX_PORT,
-                "targetPort": SANDBOX_PORT,
-                "protocol": "TCP"
-            }],
-            "type": "ClusterIP"
-        }
-    }
+    require_backend()
+
+    if request.profile is not None and request.profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{request.profile}', expected one of {', '.join(PROFILES)}")
+
+    if SANDBOX_SHARED:
+        return await claim_shared_kernel(request)
+
+    profile = request.profile or session_profiles.get(request.session_id) or DEFAULT_PROFILE
 
-    print(f"Image: {IMAGE_NAME}")
-    print(f"Pod: {pod_name}")
-    
     try:
-        print("Creating pod")
-        # Create pod
-        pod = k8s_v1.create_namespaced_pod(
-            namespace=namespace, 
-            body=pod_manifest
-        )
-        print(f"Pod created: {pod.metadata.name}")
-        
-        print("Creating service")
-        # Create service  
-        service = k8s_v1.create_namespaced_service(
-            namespace=namespace,
-            body=service_manifest
-        )
-        print(f"Service created: {service.metadata.name}")
-        
-        last_active[pod.metadata.name] = time.time()
-        print("Sandbox creation completed successfully")
-        
-        return {
-            "id": pod.metadata.name, 
-            "name": pod.metadata.name, 
-            "status": "creating"
-        }
+        name = await backend.create(request.lang.lower(), request.session_id, profile=profile)
     except Exception as e:
-        print(f"Sandbox cration error: {str(e)}")
-        print(f"Error: {type(e)}")
+        log.exception(
+            "Sandbox creation failed",
+            extra={"backend": backend.name, "status": getattr(e, "status", None), "body": getattr(e, "body", None)}
+        )
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if hasattr(e, 'body'):
-            print(f"ERROR: API response body: {e.body}")
-        if hasattr(e, 'status'):
-            print(f"ERROR: HTTP status: {e.status}")
-        if hasattr(e, 'reason'):
-            print(f"ERROR: Reason: {e.reason}")
+    # Already ready means it came from a warm pool
+    start = "warm" if name in backend.ready_names else "cold"
+    log.info("Sandbox created", extra={"sandbox_id": name, "profile": profile, "session_id": request.session_id, "start": start})
+    reaper.touch(name)
+    sandbox_profiles[name] = profile
+    SESSION_ASSIGNMENTS.labels(start=start).inc()
+
+    if request.session_id:
+        session_profiles[request.session_id] = profile
+        sandbox_sessions[name] = request.session_id
+        if snapshot_store.has_snapshot(request.session_id):
+            restores[name] = asyncio.create_task(restore_workspace(name, request.session_id))
+
+    return {
+        "id": name,
+        "name": name,
+        "status": "creating",
+        "profile": profile
+    }
 
-        import traceback
-        print("Full traceback")
-        traceback.print_exc()
+async def claim_shared_kernel(request: CreateSandboxRequest):
+    """Start a kernel for this session on a shared pod (backends/base.py), creating a pod if none has room"""
+    started = time.perf_counter()
+    sandbox_id, start = await backend.claim(request.lang.lower())
+
+    reaper.touch(sandbox_id)
+    SESSION_ASSIGNMENTS.labels(start=start).inc()
+    KERNEL_CLAIM_SECONDS.labels(start=start).observe(time.perf_counter() - started)
+    if request.session_id:
+        sandbox_sessions[sandbox_id] = request.session_id
+        if snapshot_store.has_snapshot(request.session_id):
+            restores[sandbox_id] = asyncio.create_task(restore_workspace(sandbox_id, request.session_id))
+    log.info("Kernel placed on shared pod", extra={"sandbox_id": sandbox_id, "start": start})
+
+    return {"id": sandbox_id, "name": sandbox_id, "status": "ready", "pod": split_sandbox_id(sandbox_id)[0]}
+
+async def pod_oom_killed(sandbox_id: str, wait: float = 5.0):
+    """Whether the sandbox was OOM killed; tenant kernels are never, their pod would be"""
+    name, kernel_id = split_sandbox_id(sandbox_id)
+    if kernel_id is not None:
+        return False
+    return await backend.oom_killed(name, wait)
+
+@traced("sandbox.resize")
+async def resize_sandbox(sandbox_id: str, reason: str, profile: Optional[str] = None):
+    """Move a session to a larger profile: snapshot, replace the pod, restore into the new one.
+
+    Returns a description of the move, or None if there is nothing larger or no session to carry over.
+    """
+    from utils.tools import session_containers
+
+    session_id = sandbox_sessions.get(sandbox_id)
+    if session_id is None or split_sandbox_id(sandbox_id)[1] is not None:
+        return None
+
+    current = sandbox_profiles.get(sandbox_id, DEFAULT_PROFILE)
+    target = profile or next_profile(current)
+    if target is None or rank(target) <= rank(current):
+        return None
+
+    log.info("Resizing sandbox", extra={"sandbox_id": sandbox_id, "from_profile": current, "to_profile": target, "reason": reason})
+    await checkpoint_kernel(sandbox_id)
+    await snapshot_workspace(sandbox_id, session_id)
+    await cleanup_sandbox_resources(sandbox_id)
+
+    result = await create_sandbox(CreateSandboxRequest(lang="python", session_id=session_id, profile=target))
+    session_containers[session_id] = result["id"]
+    return {"from": current, "to": target, "reason": reason, "sandbox_id": result["id"]}
+
+def preserves_state():
+    """Whether kernel variables survive a move to a new sandbox (checkpoints); files always do"""
+    return os.environ.get("KERNEL_CHECKPOINT") == "1"
+
+def resized_line(resized):
+    return json.dumps({
+        "output_type": "sandbox_resized",
+        **resized,
+        "text": (
+            f"Sandbox moved from the {resized['from']} to the {resized['to']} profile ({resized['reason']}). "
+            "Files were restored; re-run the cell to continue."
+        )
+    }) + "\n"
 
-        try:
-            await cleanup_sandbox_resources(pod_name)
-        except:
-            pass
-        raise HTTPException(status_code=500, detail=str(e))
+def last_metadata(tail: str):
+    for line in reversed(tail.splitlines()):
+        if '"execution_metadata"' in line:
+            try:
+                return json.loads(line)
+            except ValueError:
+                return {}
+    return {}
+
+async def recover_from_oom(sandbox_id: str):
+    """NDJSON lines explaining a dropped execution if the container was OOM killed, else None"""
+    if not await pod_oom_killed(sandbox_id):
+        return None
+    lines = [json.dumps({
+        "output_type": "error",
+        "ename": "MemoryError",
+        "evalue": "The sandbox ran out of memory and was restarted",
+        "traceback": []
+    }) + "\n"]
+    resized = await resize_sandbox(sandbox_id, "out of memory")
+    if resized is not None:
+        lines.append(resized_line(resized))
+    return lines
 
 @router.get("/sandboxes/{sandbox_id}")
 async def get_sandbox(sandbox_id: str):
-    if k8s_v1 is None:
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-        
-    try:
-        pod = k8s_v1.read_namespaced_pod(
-            name=sandbox_id, 
-            namespace=get_namespace()
-        )
-        
-        if "sbx" not in pod.metadata.labels:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
+    require_backend()
+    record = await backend.get(split_sandbox_id(sandbox_id)[0])
+
+    return {
+        "id": sandbox_id,
+        "name": sandbox_id,
+        "pod": record["name"],
+        "status": record["status"],
+        "ip": record["ip"],
+        "stats": await fetch_stats(sandbox_id) if record["status"] == "Running" else None,
+        "ready": record["ready"]
+    }
 
-        return {
-            "id": pod.metadata.name,
-            "name": pod.metadata.name,
-            "status": pod.status.phase,
-            "ip": pod.status.pod_ip,
-            "ready": pod.status.container_statuses[0].ready if pod.status.container_statuses else False
-        }
-    except k8s_exceptions.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        raise HTTPException(status_code=500, detail=str(e))
+async def prepare_execution(sandbox_id: str):
+    """Wait until the sandbox can run code; returns the execution id"""
+    require_backend()
+    record = await backend.get(split_sandbox_id(sandbox_id)[0])
+    if record["status"] != "Running":
+        await backend.wait_ready(record["name"])
+
+    await wait_for_restore(sandbox_id)
+    execution_id = uuid.uuid4().hex
+    annotate(sandbox_id=sandbox_id, execution_id=execution_id)
+    reaper.touch(sandbox_id)
+    return execution_id
+
+async def relay_execution(sandbox_id: str, execution_id: str, chunks):
+    """Pass a sandbox's NDJSON output through, then snapshot and resize as its metadata asks"""
+    # The last lines carry the execution metadata used to decide on a resize
+    tail = ""
+    started = time.perf_counter()
+    output_bytes = 0
+    outcome = "error"
+    EXECUTIONS_IN_FLIGHT.inc()
+    with span("sandbox.relay", sandbox_id=sandbox_id, execution_id=execution_id) as relay:
+        try:
+            with reaper.hold(sandbox_id):
+                async for data in chunks:
+                    tail = (tail + data)[-EXECUTION_TAIL_CHARS:]
+                    output_bytes += len(data)
+                    yield data
+            outcome = "ok"
+            EXECUTE_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+            EXECUTE_OUTPUT_BYTES.observe(output_bytes)
+            log.info(
+                "Execution finished",
+                extra={"seconds": round(time.perf_counter() - started, 3), "output_bytes": output_bytes, "sample": True}
+            )
+            schedule_snapshot(sandbox_id)
+
+            reason = resize_reason(last_metadata(tail), preserves_state=preserves_state())
+            if reason is not None:
+                resized = await resize_sandbox(sandbox_id, reason)
+                if resized is not None:
+                    yield resized_line(resized)
+        except ChannelClosed as e:
+            log.warning("Channel error", extra={"error": str(e)})
+            lines = await recover_from_oom(sandbox_id)
+            if lines is not None:
+                for line in lines:
+                    yield line
+                return
+            raise HTTPException(status_code=502, detail=str(e))
+        except httpx.ConnectError as e:
+            log.warning("Connection error", extra={"error": str(e)})
+            raise HTTPException(status_code=503, detail=f"Cannot connect to sandbox: {str(e)}")
+        except httpx.TimeoutException as e:
+            log.warning("Sandbox request timed out", extra={"error": str(e)})
+            raise HTTPException(status_code=504, detail="Sandbox request timed out")
+        except httpx.RemoteProtocolError as e:
+            log.warning("Sandbox disconnected", extra={"error": str(e)})
+            lines = await recover_from_oom(sandbox_id)
+            if lines is not None:
+                for line in lines:
+                    yield line
+                return
+            raise HTTPException(status_code=502, detail="Sandbox disconnected unexpectedly")
+        except HTTPException:
+            raise
+        except Exception as e:
+            log.exception("Unexpected sandbox execution error")
+            raise HTTPException(status_code=500, detail=f"Sandbox execution error: {str(e)}")
+        finally:
+            EXECUTIONS_IN_FLIGHT.dec()
+            if outcome != "ok":
+                EXECUTE_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+            relay.set(outcome=outcome, output_bytes=output_bytes)
 
 @router.post("/sandboxes/{sandbox_id}/execute")
 async def execute_code(sandbox_id: str, request: ExecuteRequest):
     if not request.code.strip():
         raise HTTPException(status_code=400, detail="Code cannot be empty.")
-    
-    if k8s_v1 is None:
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-    
+
+    execution_id = await prepare_execution(sandbox_id)
+    chunks = backend.execute_stream(
+        sandbox_id, request.code, execution_id, on_heartbeat=record_heartbeat, allow_stdin=request.allow_stdin
+    )
+    return StreamingResponse(
+        relay_execution(sandbox_id, execution_id, chunks),
+        media_type="application/x-ndjson",
+        headers={"X-Execution-Id": execution_id}
+    )
+
+@router.post("/sandboxes/{sandbox_id}/execute_batch")
+async def execute_batch(sandbox_id: str, request: ExecuteBatchRequest):
+    """Run several cells in order over one stream; every output line carries its cell index"""
+    if not request.cells or any(not code.strip() for code in request.cells):
+        raise HTTPException(status_code=400, detail="Every cell needs code.")
+
+    execution_id = await prepare_execution(sandbox_id)
+    chunks = backend.execute_batch_stream(sandbox_id, request.cells, request.stop_on_error)
+    return StreamingResponse(
+        relay_execution(sandbox_id, execution_id, chunks),
+        media_type="application/x-ndjson",
+        headers={"X-Execution-Id": execution_id}
+    )
+
+@router.post("/sandboxes/{sandbox_id}/notebook")
+async def replay_notebook(sandbox_id: str, file: UploadFile = File(...), stop_on_error: bool = True):
+    """Run an uploaded .ipynb's code cells in the session kernel, streaming per-cell progress.
+    Unchanged cells that the kernel's last replay already ran come back cached instead of running."""
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+    if size > NOTEBOOK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Notebook is larger than {NOTEBOOK_MAX_BYTES} bytes")
+    try:
+        cells = notebook_cells(json.loads(await file.read()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid notebook: {str(e)}")
+    if not cells:
+        raise HTTPException(status_code=400, detail="Notebook has no code cells.")
+
+    execution_id = await prepare_execution(sandbox_id)
+    log.info("Replaying notebook", extra={"filename": file.filename, "cells": len(cells)})
+    chunks = backend.replay_stream(sandbox_id, cells, stop_on_error)
+    return StreamingResponse(
+        relay_execution(sandbox_id, execution_id, chunks),
+        media_type="application/x-ndjson",
+        headers={"X-Execution-Id": execution_id}
+    )
+
+async def get_open_channel(sandbox_id: str):
     try:
-        pod = k8s_v1.read_namespaced_pod(
-            name=sandbox_id, 
-            namespace=get_namespace()
+        return await get_channel(
+            sandbox_id,
+            await sandbox_url(sandbox_id, "/ws", "ws"),
+            on_heartbeat=record_heartbeat,
+            headers=backend.headers(sandbox_id)
         )
-        
-        if "sbx" not in pod.metadata.labels:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-
-        if pod.status.phase != "Running":
-            pod = await wait_for_pod_ready(sandbox_id, get_namespace())
-
-        # Use service DNS name for networking
-        namespace = get_namespace()
-        service_url = f"http://{sandbox_id}-service.{namespace}.svc.cluster.local:{SANDBOX_PORT}/execute"
-        
-        print(f"Executing code in sandbox: {service_url}")
-        
-        async def stream_response():
-            try:
-                async with hx.stream("POST", service_url, json=request.dict()) as response:
-                    if not response.is_success:
-                        raise HTTPException(status_code=response.status_code, detail=f"Execution failed with status {response.status_code}")
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
-                        last_active[sandbox_id] = time.time()
-            except httpx.ConnectError as e:
-                print(f"Connection error to sandbox {sandbox_id}: {e}")
-                raise HTTPException(status_code=503, detail=f"Cannot connect to sandbox: {str(e)}")
-            except httpx.TimeoutException as e:
-                print(f"Timeout error to sandbox {sandbox_id}: {e}")
-                raise HTTPException(status_code=504, detail="Sandbox request timed out")
-            except httpx.RemoteProtocolError as e:
-                print(f"Protocol error to sandbox {sandbox_id}: {e}")
-                raise HTTPException(status_code=502, detail="Sandbox disconnected unexpectedly")
-            except Exception as e:
-                print(f"Unexpected error with sandbox {sandbox_id}: {e}")
-                raise HTTPException(status_code=500, detail=f"Sandbox execution error: {str(e)}")
-        
-        return StreamingResponse(stream_response(), media_type="application/x-ndjson")
-    
-    except k8s_exceptions.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        raise HTTPException(status_code=500, detail=str(e))
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+        raise HTTPException(status_code=503, detail=f"Cannot connect to sandbox: {str(e)}")
+
+@router.post("/sandboxes/{sandbox_id}/executions/{execution_id}/interrupt")
+async def interrupt_execution(sandbox_id: str, execution_id: str):
+    channel = await get_open_channel(sandbox_id)
+    await channel.interrupt(execution_id)
+    return {"message": f"Interrupt sent to {execution_id}"}
+
+@router.post("/sandboxes/{sandbox_id}/executions/{execution_id}/input")
+async def reply_to_input(sandbox_id: str, execution_id: str, request: InputReplyRequest):
+    channel = await get_open_channel(sandbox_id)
+    await channel.input_reply(execution_id, request.value)
+    return {"message": f"Input sent to {execution_id}"}
+
+@router.post("/sandboxes/{sandbox_id}/heartbeat")
+async def heartbeat(sandbox_id: str, request: HeartbeatRequest = HeartbeatRequest()):
+    """Activity lease: keeps the sandbox alive for max(idle timeout, lease) seconds, capped at SANDBOX_MAX_LEASE"""
+    if reaper.expires_at(sandbox_id) is None:
+        require_backend()
+        await backend.get(split_sandbox_id(sandbox_id)[0])
+
+    expires_at = reaper.touch(sandbox_id, request.lease)
+    return {"id": sandbox_id, "expires_at": expires_at, "idle_timeout": IDLE_TIMEOUT}
 
-async def execute_code_inside(code: str):
-    km = AsyncKernelManager()
-    await km.start_kernel()
-    kc = km.client()
-    kc.start_channels()
-    await kc.wait_for_ready()
-
-    msg_id = kc.execute(code)
-
-    async def stream_results():
-        outputs = []
-        try:
-            while True:
-                reply = await kc.get_iopub_msg()
-                msg_type = reply["msg_type"]
-                
-                if msg_type == 'stream':
-                    outputs.append({
-                        "output_type": "stream",
-                        "name": reply['content']['name'],  # stdout or stderr
-                        "text": reply['content']['text']
-                    })
-                    yield json.dumps(outputs[-1]) + "\n"
-                    
-                elif msg_type == 'display_data':
-                    data = reply['content']['data']
-                    output = {
-                        "output_type": "display_data",
-                        "data": data,
-                        "metadata": reply['content'].get('metadata', {})
-                    }
-                    outputs.append(output)
-                    yield json.dumps(output) + "\n"
-                    
-                elif msg_type == 'execute_result':
-                    data = reply['content']['data']
-                    output = {
-                        "output_type": "execute_result",
-                        "execution_count": reply['content']['execution_count'],
-                        "data": data,
-                        "metadata": reply['content'].get('metadata', {})
-                    }
-                    outputs.append(output)
-                    yield json.dumps(output) + "\n"
-                    
-                elif msg_type == "error":
-                    output = {
-                        "output_type": "error",
-                        "ename": reply['content']['ename'],
-                        "evalue": reply['content']['evalue'],
-                        "traceback": reply['content']['traceback']
-                    }
-                    outputs.append(output)
-                    yield json.dumps(output) + "\n"
-                    break
-                    
-                elif msg_type == "status" and reply["content"]["execution_state"] == "idle":
-                    break
-        except asyncio.CancelledError:
-            pass
-        finally:
-            kc.stop_channels()
-            await km.shutdown_kernel()
+@router.delete("/sandboxes/{sandbox_id}")
+async def delete_sandbox(sandbox_id: str):
+    require_backend()
+    await backend.get(split_sandbox_id(sandbox_id)[0])
 
-    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    await cleanup_sandbox_resources(sandbox_id)
+    return {"message": f"Sandbox {sandbox_id} deleted"}
 
-@router.post("/execute")
-async def execute_code_in_sandbox(request: ExecuteRequest):
-    """Execute Python code in this sandbox container"""
-    if not request.code.strip():
-        raise HTTPException(status_code=400, detail="Missing 'code' field")
-    
-    return await execute_code_inside(request.code)
+@router.post("/sandboxes/{sandbox_id}/upload")
+async def upload_file_to_sandbox(sandbox_id: str, file: UploadFile = File(...), resize: bool = False):
+
+    log.debug("Upload started", extra={"sandbox_id": sandbox_id, "filename": file.filename})
+
+    require_backend()
+
+    # Large uploads move the session to a profile that can hold the data before it lands. The move
+    # replaces a healthy kernel, so unless its state is checkpointed it only happens with ?resize=1.
+    resized = None
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+    wanted = profile_for_upload(size)
+    movable = sandbox_id in sandbox_sessions and split_sandbox_id(sandbox_id)[1] is None
+    if movable and rank(wanted) > rank(sandbox_profiles.get(sandbox_id, DEFAULT_PROFILE)):
+        if not (resize or preserves_state()):
+            raise HTTPException(
+                status_code=413,
+                detail=(
+                    f"A {size // (1024 * 1024)} MiB upload needs the {wanted} profile. Moving there restarts "
+                    "the kernel and its variables are lost; upload with ?resize=1 to move anyway."
+                )
+            )
+        resized = await resize_sandbox(sandbox_id, f"too small for a {size // (1024 * 1024)} MiB upload", profile=wanted)
+        if resized is not None:
+            sandbox_id = resized["sandbox_id"]
+            await backend.wait_ready(sandbox_id)
 
-@router.post("/health")
-@router.get("/health")
-async def health_check():
-    return {"status": "healthy", "timestamp": time.time()}
+    record = await backend.get(split_sandbox_id(sandbox_id)[0])
+    if record["status"] != "Running":
+        raise HTTPException(status_code=503, detail="Sandbox not ready")
 
-@router.delete("/sandboxes/{sandbox_id}")
-async def delete_sandbox(sandbox_id: str):
-    if k8s_v1 is None:
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-        
+    # Sent straight to the sandbox server's /upload route; any file type, streamed from the spool
     try:
-        pod = k8s_v1.read_namespaced_pod(
-            name=sandbox_id, 
-            namespace=get_namespace()
-        )
-        if "sbx" not in pod.metadata.labels:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-
-        await cleanup_sandbox_resources(sandbox_id)
-        last_active.pop(sandbox_id, None)
-        return {"message": f"Sandbox {sandbox_id} deleted"}
-    except k8s_exceptions.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        raise HTTPException(status_code=500, detail=str(e))
+        await wait_for_restore(sandbox_id)
+        started = time.perf_counter()
+        uploaded = await backend.upload(sandbox_id, file.filename, file.file, file.content_type)
+        UPLOAD_BYTES.observe(size)
+        UPLOAD_BYTES_PER_SECOND.observe(size / max(time.perf_counter() - started, 1e-6))
 
-@router.post("/sandboxes/{sandbox_id}/upload")
-async def upload_file_to_sandbox(sandbox_id: str, file: UploadFile = File(...)):
+        log.info("File uploaded", extra={"sandbox_id": sandbox_id, "filename": uploaded["filename"], "size": uploaded["size"]})
 
-    print(f"Uploading to {sandbox_id}, file={file.filename}")
+        reaper.touch(sandbox_id)
+        schedule_snapshot(sandbox_id)
 
-    if k8s_v1 is None:
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-
-    try: 
-        print(f"Pod info readign: {sandbox_id}")
-        pod = k8s_v1.read_namespaced_pod(
-            name=sandbox_id, 
-            namespace=get_namespace()
-        )
-        print(f"Pod found, labels={pod.metadata.labels}")
-        
-        if "sbx" not in pod.metadata.labels:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-    
-        print(f"Pod phase={pod.status.phase}")
-        
-        if pod.status.phase != "Running":
-            print(f"Pod not running")
-            raise HTTPException(status_code=503, detail="Sandbox not ready")
-        
-        print(f"Reading file content")
-        file_content = await file.read()
-        print(f'File size={len(file_content)} bytes')
-        
-        # Fixed STDIN Terminal length issue, this caused bug taht did not allow file upload.
-        try:
-            print("Starting file upload using simple approach")
-            
-            # For text files
-            if file.filename.endswith(('.csv', '.txt', '.py', '.json', '.md')):
-                exec_command = ['sh', '-c', f'mkdir -p /uploaded_files && cat > /uploaded_files/{file.filename}']
-                
-                resp = stream(
-                    k8s_v1.connect_get_namespaced_pod_exec,
-                    sandbox_id,
-                    get_namespace(),
-                    command=exec_command,
-                    stderr=True,
-                    stdin=True,
-                    stdout=True,
-                    tty=False,
-                    _preload_content=False
-                )
-                
-                # Write file content directly
-                resp.write_stdin(file_content)
-                resp.close()
-            
-            print("File written successfully")
-            
-            last_active[sandbox_id] = time.time()
-            
-            return {
-                "message": f"File '{file.filename}' uploaded to sandbox",
-                "filename": file.filename,
-                "size": len(file_content),
-                "path": f"/uploaded_files/{file.filename}"
-            }
-        except Exception as exec_error:
-            print("Traceback")
-            traceback.print_exc()
-            raise HTTPException(status_code=500, detail=f"File upload failed: {str(exec_error)}")
-        
-    except k8s_exceptions.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        raise HTTPException(status_code=500, detail=str(e))
+        return {
+            "message": f"File '{file.filename}' uploaded to sandbox",
+            "filename": uploaded["filename"],
+            "size": uploaded["size"],
+            "path": uploaded["path"],
+            "sandbox_id": sandbox_id,
+            "resized": resized
+        }
+    except Exception as exec_error:
+        log.exception("Upload failed", extra={"sandbox_id": sandbox_id, "filename": file.filename})
+        raise HTTPException(status_code=500, detail=f"File upload failed: {str(exec_error)}")
 
 @router.get("/sandboxes/{sandbox_id}/files")
 async def list_sandbox_files(sandbox_id: str):
-    if k8s_v1 is None:
-        raise HTTPException(status_code=500, detail="Kubernetes client not available")
-        
+    require_backend()
     try:
-        pod = k8s_v1.read_namespaced_pod(
-            name=sandbox_id, 
-            namespace=get_namespace()
-        )
-        if "sbx" not in pod.metadata.labels:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        
-        if pod.status.phase != "Running":
-            raise HTTPException(status_code=503, detail="Sandbox not ready")
-        
-        exec_command = ['ls', '-la', '/app']
-        
-        try:
-            resp = stream(
-                k8s_v1.connect_get_namespaced_pod_exec,
-                sandbox_id,
-                get_namespace(),
-                command=exec_command,
-                stderr=True,
-                stdin=False,
-                stdout=True,
-                tty=False
-            )
-            
-            return {"files": resp}
-        except Exception as exec_error:
-            raise HTTPException(status_code=500, detail=f"Failed to list files: {str(exec_error)}")
-            
-    except k8s_exceptions.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(status_code=404, detail="Sandbox not found")
-        raise HTTPException(status_code=500, detail=str(e))
+        return {"files": await backend.files(split_sandbox_id(sandbox_id)[0])}
+    except HTTPException:
+        raise
+    except Exception as exec_error:
+        raise HTTPException(status_code=500, detail=f"Failed to list files: {str(exec_error)}")
 
 @router.post("/health")
 @router.get("/health")
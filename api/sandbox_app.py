@@ -0,0 +1,62 @@
+import os
+import hmac
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from starlette.websockets import WebSocketClose
+
+from routers import kernel
+from utils.kernel import kernel_session, kernel_pool, SANDBOX_MODE
+from utils.tracing import TraceMiddleware
+
+# Entrypoint for sandbox pods: kernel and upload routes only, no chat, OpenAI or cluster clients.
+# Run with: python -m uvicorn sandbox_app:app --host 0.0.0.0 --port 8000
+
+# Set by the backend that started this host; only the API knows it
+SANDBOX_TOKEN = os.environ.get("SANDBOX_TOKEN", "")
+# Kubelet and Docker health probes carry no token
+OPEN_PATHS = ("/health", "/health/ready")
+
+# Read at import by the modules above; kernels started from here must not inherit them
+SERVER_SECRETS = ("ARTIFACT_TOKEN", "SANDBOX_TOKEN")
+for secret in SERVER_SECRETS:
+    os.environ.pop(secret, None)
+
+class TokenMiddleware:
+    """Refuses requests without this host's token. Tenant kernels of a shared host reach this server
+    over localhost, and would otherwise drive each other's kernels and workspaces through it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope["path"] in OPEN_PATHS:
+            return await self.app(scope, receive, send)
+
+        token = dict(scope.get("headers") or []).get(b"x-sandbox-token", b"")
+        if SANDBOX_TOKEN and hmac.compare_digest(token, SANDBOX_TOKEN.encode()):
+            return await self.app(scope, receive, send)
+
+        if scope["type"] == "websocket":
+            return await WebSocketClose(code=1008)(scope, receive, send)
+        return await JSONResponse({"detail": "Invalid sandbox token"}, status_code=403)(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SANDBOX_MODE == "shared":
+        # Tenant kernels are started by the API via POST /kernels/{id}
+        yield
+        await kernel_pool.shutdown()
+        return
+
+    # Start and preload the kernel now; /health/ready stays red until it is done
+    asyncio.create_task(kernel_session.start())
+    yield
+    await kernel_session.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(TokenMiddleware)
+app.add_middleware(TraceMiddleware)
+app.include_router(kernel.router)
@@ -0,0 +1,89 @@
+import hashlib
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from utils import artifacts
+from utils.artifacts import ArtifactStore, artifact_token
+from routers import artifacts as artifacts_router
+from routers.artifacts import parse_range, put_artifact
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+PNG_ID = hashlib.sha256(PNG).hexdigest()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path), 1024 * 1024)
+    monkeypatch.setattr(artifacts_router, "artifact_store", store)
+    monkeypatch.setattr(artifacts, "ARTIFACT_TOKEN", "secret")
+
+    app = FastAPI()
+    app.include_router(artifacts_router.router)
+    # Mounted at import only when ARTIFACT_TOKEN is set
+    app.put("/api/artifacts/{artifact_id}")(put_artifact)
+    return TestClient(app)
+
+def upload(client, data=PNG, artifact_id=PNG_ID, name="sandbox-1", token=None, content_type="image/png"):
+    headers = {
+        "Content-Type": content_type,
+        "X-Sandbox-Name": name,
+        "X-Artifact-Token": token if token is not None else artifact_token(name)
+    }
+    return client.put(f"/api/artifacts/{artifact_id}", content=data, headers=headers)
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=1000-", "bytes=20-10", "items=0-1", "bytes=0-1,5-6"])
+def test_parse_range_refuses(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */1000"
+
+def test_upload_then_get(client):
+    assert upload(client).status_code == 201
+    assert upload(client).status_code == 200
+
+    response = client.get(f"/api/artifacts/{PNG_ID}")
+    assert response.status_code == 200
+    assert response.content == PNG
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{PNG_ID}"'
+    assert "content-disposition" not in response.headers
+
+    assert client.get(f"/api/artifacts/{PNG_ID}", headers={"If-None-Match": f'"{PNG_ID}"'}).status_code == 304
+
+def test_range_and_if_range(client):
+    upload(client)
+
+    response = client.get(f"/api/artifacts/{PNG_ID}", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == PNG[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(PNG)}"
+
+    response = client.get(f"/api/artifacts/{PNG_ID}", headers={"Range": "bytes=10-19", "If-Range": f'"{PNG_ID}"'})
+    assert response.status_code == 206
+
+    # A validator for some other body: send the whole thing
+    response = client.get(f"/api/artifacts/{PNG_ID}", headers={"Range": "bytes=10-19", "If-Range": '"other"'})
+    assert response.status_code == 200
+    assert response.content == PNG
+
+def test_upload_needs_the_sandbox_token(client):
+    assert upload(client, token="secret").status_code == 403
+    assert upload(client, token=artifact_token("sandbox-2")).status_code == 403
+    assert upload(client, name="").status_code == 403
+
+def test_upload_checks_type_hash_and_size(client, monkeypatch):
+    assert upload(client, content_type="text/html").status_code == 415
+    assert upload(client, artifact_id="0" * 64).status_code == 400
+
+    monkeypatch.setattr(artifacts_router, "ARTIFACT_UPLOAD_MAX_BYTES", 100)
+    assert upload(client).status_code == 413
+    assert client.get(f"/api/artifacts/{PNG_ID}").status_code == 404
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+import kubernetes.client.exceptions as k8s_exceptions
+
+from backends.inventory import PodInventory, watch_events
+
+def pod(name, version, phase="Running", ready=True):
+    return {
+        "metadata": {
+            "name": name,
+            "resourceVersion": version,
+            "labels": {"sbx": "1", "sbx_profile": "small"},
+            "creationTimestamp": "2026-01-01T00:00:00Z"
+        },
+        "status": {
+            "phase": phase,
+            "podIP": "10.0.0.1",
+            "containerStatuses": [{"ready": ready, "state": {"running": {}}}],
+            "conditions": [{"type": "Ready", "status": "True", "lastTransitionTime": "2026-01-01T00:00:03Z"}]
+        }
+    }
+
+class Response:
+    def __init__(self, events=(), body=None):
+        text = "".join(json.dumps(event) + "\n" for event in events).encode()
+        # Events split across chunks, as a server flushing mid-line would send them
+        self.chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        self.data = json.dumps(body).encode() if body is not None else b""
+        self.released = False
+
+    def stream(self):
+        return iter(self.chunks)
+
+    def release_conn(self):
+        self.released = True
+
+    def close(self):
+        pass
+
+class CoreV1:
+    def __init__(self, items, events):
+        self.items = items
+        self.events = events
+        self.calls = []
+
+    def list_namespaced_pod(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("watch"):
+            return Response(self.events)
+        return Response(body={"metadata": {"resourceVersion": "10"}, "items": self.items})
+
+def test_watch_events_joins_split_lines():
+    events = [{"type": "ADDED", "object": pod("a", "1")}, {"type": "DELETED", "object": pod("a", "2")}]
+    assert list(watch_events(Response(events))) == events
+
+def test_relist_then_apply_events():
+    v1 = CoreV1(
+        [pod("sandbox-a", "5", phase="Pending", ready=False)],
+        [
+            {"type": "MODIFIED", "object": pod("sandbox-a", "11")},
+            {"type": "ADDED", "object": pod("sandbox-b", "12")},
+            {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "13"}}},
+            {"type": "DELETED", "object": pod("sandbox-b", "14")}
+        ]
+    )
+    inventory = PodInventory(v1, "app", "app=sandbox,sbx=1")
+
+    assert inventory.relist() == "10"
+    assert inventory.synced and inventory.get("sandbox-a")["status"] == "Pending"
+
+    assert inventory.watch("10") == "14"
+    assert [record["name"] for record in inventory.list()] == ["sandbox-a"]
+    record = inventory.get("sandbox-a")
+    assert record["status"] == "Running" and record["ready"] and record["ready_seconds"] == 3.0
+    assert v1.calls[-1]["resource_version"] == "10" and v1.calls[-1]["_preload_content"] is False
+
+def test_expired_version_asks_for_a_relist():
+    v1 = CoreV1([], [{"type": "ERROR", "object": {"kind": "Status", "code": 410, "message": "too old"}}])
+    assert PodInventory(v1, "app", "sbx=1").watch("1") is None
+
+def test_watch_errors_are_raised():
+    v1 = CoreV1([], [{"type": "ERROR", "object": {"kind": "Status", "code": 500, "message": "boom"}}])
+    with pytest.raises(k8s_exceptions.ApiException):
+        PodInventory(v1, "app", "sbx=1").watch("1")
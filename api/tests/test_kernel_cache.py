@@ -0,0 +1,103 @@
+import json
+import asyncio
+
+import pytest
+
+from utils import kernel as kernel_module
+from utils.kernel import KernelSession, pure_cell
+from utils.outputs import to_line
+
+@pytest.mark.parametrize("code", [
+    "import os; print(os.listdir('/workspace'))",
+    "print(sorted(os.listdir('.')))",
+    "os.path.exists('data.csv')",
+    "print(f'{len(df)} rows')",
+    "sorted([3, 1, 2])"
+])
+def test_pure_cells(code):
+    assert pure_cell(code)
+
+@pytest.mark.parametrize("code", [
+    "list(it)",
+    "sorted(gen)",
+    "print(*gen)",
+    "[x for x in it]",
+    "df.head()",
+    "it.count()",
+    "print(x, file=handle)",
+    "import subprocess",
+    "import os as o",
+    "x = 1",
+    "!ls",
+    ""
+])
+def test_impure_cells(code):
+    assert not pure_cell(code)
+
+class Client:
+    def __init__(self):
+        self.ran = []
+
+    def execute(self, code, **kwargs):
+        self.ran.append(code)
+        return f"msg-{len(self.ran)}"
+
+class Manager:
+    async def is_alive(self):
+        return True
+
+def session(monkeypatch, tmp_path):
+    async def outputs(kc, msg_id, batcher=None, is_alive=None):
+        code = kc.ran[-1]
+        if "missing" in code:
+            yield to_line({"output_type": "error", "ename": "NameError", "evalue": "missing", "traceback": []})
+        else:
+            yield to_line({"output_type": "stream", "name": "stdout", "text": code + "\n"})
+
+    async def started():
+        pass
+
+    monkeypatch.setattr(kernel_module, "KERNEL_RESULT_CACHE", True)
+    monkeypatch.setattr(kernel_module, "stream_kernel_outputs", outputs)
+    kernel = KernelSession(preload=[], workdir=str(tmp_path))
+    kernel.kc, kernel.km, kernel.restored = Client(), Manager(), True
+    kernel.start = started
+    return kernel
+
+def run(kernel, code):
+    async def collect():
+        return [json.loads(line) async for line in kernel.execute(code)]
+    return asyncio.run(collect())
+
+def test_pure_misses_keep_each_other_cached(monkeypatch, tmp_path):
+    kernel = session(monkeypatch, tmp_path)
+    first, second = "print(len('ab'))", "print(os.listdir('.'))"
+
+    assert run(kernel, first)[-1]["pure"]
+    run(kernel, second)
+    generation = kernel.generation
+    assert len(kernel.results) == 2
+
+    for code in (first, second):
+        lines = run(kernel, code)
+        assert lines[0]["cached"] and lines[-1]["cached"]
+    assert kernel.kc.ran == [first, second] and kernel.generation == generation
+
+def test_other_cells_and_file_changes_invalidate(monkeypatch, tmp_path):
+    kernel = session(monkeypatch, tmp_path)
+    code = "print(os.listdir('.'))"
+    run(kernel, code)
+
+    run(kernel, "x = 1")
+    assert not run(kernel, code)[-1].get("cached")
+
+    (tmp_path / "new.csv").write_text("a\n")
+    assert not run(kernel, code)[-1].get("cached")
+    assert len(kernel.kc.ran) == 4
+
+def test_failed_pure_cell_is_not_cached(monkeypatch, tmp_path):
+    kernel = session(monkeypatch, tmp_path)
+    generation = kernel.generation
+    lines = run(kernel, "print(missing)")
+    assert lines[0]["output_type"] == "error" and not lines[-1].get("pure")
+    assert kernel.generation == generation + 1 and not kernel.results
@@ -0,0 +1,27 @@
+import sys
+import subprocess
+
+from backends.local import RLIMIT_EXEC
+
+def test_rlimit_exec_limits_the_command():
+    probe = (
+        "import resource; "
+        "print(resource.getrlimit(resource.RLIMIT_DATA)[0], resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+    )
+    result = subprocess.run(
+        [sys.executable, RLIMIT_EXEC, str(1024 ** 3), "256", sys.executable, "-c", probe],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert result.stdout.split() == [str(1024 ** 3), "256"]
+
+def test_rlimit_exec_zero_memory_leaves_data_unlimited():
+    probe = "import resource; print(resource.getrlimit(resource.RLIMIT_DATA)[0] == resource.RLIM_INFINITY)"
+    result = subprocess.run(
+        [sys.executable, RLIMIT_EXEC, "0", "256", sys.executable, "-c", probe],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert result.stdout.strip() == "True"
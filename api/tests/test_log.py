@@ -0,0 +1,32 @@
+import logging
+
+from utils import log as log_module
+from utils.log import ContextFilter, bind
+
+def record(level, sample=None, **fields):
+    entry = logging.LogRecord("caesarion.test", level, __file__, 1, "event", (), None)
+    if sample is not None:
+        entry.sample = sample
+    entry.__dict__.update(fields)
+    return entry
+
+def test_sampled_info_is_dropped_at_the_sample_rate(monkeypatch):
+    monkeypatch.setattr(log_module.random, "random", lambda: 0.5)
+    monkeypatch.setattr(log_module, "LOG_SAMPLE_RATE", 0.01)
+
+    assert not ContextFilter().filter(record(logging.INFO, sample=True))
+    kept = record(logging.INFO, sample=0.9)
+    assert ContextFilter().filter(kept)
+    assert kept.sample_rate == 0.9
+
+def test_warnings_are_never_sampled(monkeypatch):
+    monkeypatch.setattr(log_module.random, "random", lambda: 0.99)
+
+    assert ContextFilter().filter(record(logging.WARNING, sample=True))
+    assert ContextFilter().filter(record(logging.ERROR, sample=0.001))
+
+def test_bound_context_is_captured():
+    entry = record(logging.INFO)
+    with bind(session_id="s1"):
+        ContextFilter().filter(entry)
+    assert entry.context == {"session_id": "s1"}
@@ -0,0 +1,95 @@
+import json
+import asyncio
+
+import pytest
+
+from utils.notebook import notebook_cells, cell_hashes, run_cells
+
+class Kernel:
+    """Counts executions the way KernelSession.generation does and echoes each cell"""
+
+    def __init__(self):
+        self.generation = 0
+        self.replay = None
+        self.ran = []
+
+    async def execute(self, code):
+        # Like the result cache's pure cells, print() leaves the generation alone
+        pure = code.startswith("print")
+        if not pure:
+            self.generation += 1
+        self.ran.append(code)
+        if code.startswith("raise"):
+            yield json.dumps({"output_type": "error", "ename": "Error", "evalue": code, "traceback": []})
+        else:
+            yield json.dumps({"output_type": "stream", "name": "stdout", "text": code + "\n"})
+        yield json.dumps({"output_type": "execution_metadata", "cached": False, "pure": pure})
+
+def run(kernel, cells, **kwargs):
+    async def collect():
+        return [json.loads(line) async for line in run_cells(kernel, cells, **kwargs)]
+    return asyncio.run(collect())
+
+def ends(lines):
+    return [line["status"] for line in lines if line["output_type"] == "cell_end"]
+
+def test_notebook_cells_keeps_non_empty_code():
+    notebook = {"cells": [
+        {"cell_type": "markdown", "source": "# title"},
+        {"cell_type": "code", "source": ["import os\n", "x = 1"]},
+        {"cell_type": "code", "source": "  \n"},
+        {"cell_type": "code", "source": "print(x)"}
+    ]}
+    assert notebook_cells(notebook) == ["import os\nx = 1", "print(x)"]
+
+    with pytest.raises(ValueError):
+        notebook_cells({"metadata": {}})
+    with pytest.raises(ValueError):
+        notebook_cells({"cells": [{"cell_type": "code", "source": 3}]})
+
+def test_cell_hashes_chain_upstream_edits():
+    first = cell_hashes(["a", "b", "c"])
+    edited = cell_hashes(["a", "B", "c"])
+    assert first[0] == edited[0]
+    assert first[1] != edited[1] and first[2] != edited[2]
+
+def test_stop_on_error_skips_the_rest():
+    lines = run(Kernel(), ["x = 1", "raise here", "y = 2"])
+    assert ends(lines) == ["ok", "error", "skipped"]
+    assert lines[-1]["failed"] == [1] and lines[-1]["stopped"]
+    assert all(line["cell"] == 1 for line in lines if line["output_type"] == "error")
+
+def test_replay_skips_unchanged_leading_cells():
+    kernel = Kernel()
+    run(kernel, ["a = 1", "b = 2", "c = 3"], replay=True)
+    assert kernel.replay.generation == kernel.generation == 3
+
+    lines = run(kernel, ["a = 1", "b = 2", "c = 4"], replay=True)
+    assert ends(lines) == ["cached", "cached", "ok"]
+    assert kernel.ran[3:] == ["c = 4"]
+    cached = [line for line in lines if line.get("cached") and line["output_type"] == "stream"]
+    assert [line["text"] for line in cached] == ["a = 1\n", "b = 2\n"]
+    assert lines[-1]["cached"] == 2
+
+def test_replay_is_dropped_once_the_kernel_runs_something_else():
+    kernel = Kernel()
+    run(kernel, ["a = 1", "b = 2"], replay=True)
+    async def other():
+        return [line async for line in kernel.execute("a = 5")]
+    asyncio.run(other())
+
+    lines = run(kernel, ["a = 1", "b = 2"], replay=True)
+    assert ends(lines) == ["ok", "ok"]
+
+def test_failed_cell_is_not_recorded():
+    kernel = Kernel()
+    run(kernel, ["a = 1", "raise here"], replay=True)
+    assert kernel.replay.hashes == cell_hashes(["a = 1"])
+
+def test_pure_cells_keep_the_replay():
+    kernel = Kernel()
+    run(kernel, ["a = 1", "print(a)", "b = 2"], replay=True)
+    assert kernel.replay is not None and kernel.replay.generation == kernel.generation == 2
+
+    lines = run(kernel, ["a = 1", "print(a)", "b = 2"], replay=True)
+    assert ends(lines) == ["cached", "cached", "cached"]
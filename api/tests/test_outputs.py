@@ -0,0 +1,61 @@
+import json
+
+from utils.outputs import OutputBatcher, to_output
+
+def stream_output(text, name="stdout"):
+    return {"output_type": "stream", "name": name, "text": text}
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+def test_adjacent_stream_text_is_merged():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=1024)
+
+    assert batcher.add(stream_output("a")) == []
+    assert batcher.add(stream_output("b")) == []
+    assert parse(batcher.flush()) == [stream_output("ab")]
+    assert batcher.flush() == []
+
+def test_switching_stream_flushes_the_other_one():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=1024)
+    batcher.add(stream_output("out"))
+
+    assert parse(batcher.add(stream_output("err", "stderr"))) == [stream_output("out")]
+    assert parse(batcher.flush()) == [stream_output("err", "stderr")]
+
+def test_flush_size_sends_pending_text():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=4)
+
+    assert batcher.add(stream_output("ab")) == []
+    assert parse(batcher.add(stream_output("cd"))) == [stream_output("abcd")]
+
+def test_rich_outputs_flush_pending_text_first():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=1024)
+    batcher.add(stream_output("x"))
+    result = {"output_type": "execute_result", "execution_count": 1, "data": {"text/plain": "2"}, "metadata": {}}
+
+    assert parse(batcher.add(result)) == [stream_output("x"), result]
+
+def test_stream_text_is_cut_at_the_cap():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=1024, max_chars=5)
+    lines = parse(batcher.add(stream_output("abcdefgh")))
+
+    assert lines[0] == stream_output("abcde")
+    assert lines[1]["name"] == "stderr" and "Output truncated" in lines[1]["text"]
+    assert batcher.truncated
+    assert batcher.add(stream_output("more")) == []
+
+def test_rich_output_past_the_cap_is_dropped():
+    batcher = OutputBatcher(flush_interval=60.0, flush_size=1024, max_chars=20)
+    batcher.add(stream_output("abc"))
+    lines = parse(batcher.add({"output_type": "display_data", "data": {"text/plain": "x" * 100}, "metadata": {}}))
+
+    assert lines[0] == stream_output("abc")
+    assert "Output truncated" in lines[1]["text"]
+    assert len(lines) == 2
+
+def test_to_output_maps_kernel_messages():
+    reply = {"msg_type": "error", "content": {"ename": "ValueError", "evalue": "bad", "traceback": ["tb"]}}
+
+    assert to_output(reply) == {"output_type": "error", "ename": "ValueError", "evalue": "bad", "traceback": ["tb"]}
+    assert to_output({"msg_type": "status", "content": {"execution_state": "idle"}}) is None
@@ -0,0 +1,28 @@
+from utils.placement import pick_pod, pod_load, split_sandbox_id, tenant_id, KERNEL_MEMORY_RESERVE
+
+GIB = 1024 * 1024 * 1024
+
+def test_sandbox_ids():
+    assert split_sandbox_id("sandbox-1a2b") == ("sandbox-1a2b", None)
+    assert split_sandbox_id(tenant_id("sandbox-1a2b", "k42")) == ("sandbox-1a2b", "k42")
+
+def test_idle_kernels_are_charged_the_reserve():
+    assert pod_load([0, 2 * GIB]) == KERNEL_MEMORY_RESERVE + 2 * GIB
+    assert pod_load([], pending=2) == 2 * KERNEL_MEMORY_RESERVE
+
+def test_best_fit_prefers_the_fullest_pod_with_room():
+    pods = {"empty": [], "half": [2 * GIB, 2 * GIB], "full": [4 * GIB, 3 * GIB + GIB // 2 + 1]}
+    assert pick_pod(pods, capacity=8 * GIB, max_kernels=8) == "half"
+
+def test_kernel_count_limit():
+    pods = {"crowded": [0] * 4, "quiet": [0]}
+    assert pick_pod(pods, capacity=8 * GIB, max_kernels=4) == "quiet"
+
+def test_pending_kernels_count_against_a_pod():
+    pods = {"a": [0], "b": [0, 0]}
+    assert pick_pod(pods, pending={"a": 3}, capacity=8 * GIB, max_kernels=4) == "b"
+    assert pick_pod(pods, pending={"a": 3, "b": 2}, capacity=8 * GIB, max_kernels=4) is None
+
+def test_no_pod_fits():
+    assert pick_pod({}) is None
+    assert pick_pod({"a": [GIB]}, capacity=GIB, max_kernels=8) is None
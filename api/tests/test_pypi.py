@@ -0,0 +1,69 @@
+import hashlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routers import pypi
+from utils.artifacts import ArtifactStore
+
+WHEEL = b"wheel contents" * 100
+WHEEL_SHA = hashlib.sha256(WHEEL).hexdigest()
+WHEEL_PATH = "packages/ab/cd/demo-1.0-py3-none-any.whl"
+
+def test_rewrite_links_points_files_at_the_proxy():
+    html = (
+        f'<a href="https://files.pythonhosted.org/{WHEEL_PATH}#sha256={WHEEL_SHA}">demo-1.0.whl</a>\n'
+        '<a href="https://files.pythonhosted.org/packages/demo-0.9.tar.gz">no hash</a>'
+    )
+    rewritten = pypi.rewrite_links(html)
+
+    assert f'href="/pypi/files/{WHEEL_SHA}/files.pythonhosted.org/{WHEEL_PATH}#sha256={WHEEL_SHA}"' in rewritten
+    assert 'href="https://files.pythonhosted.org/packages/demo-0.9.tar.gz"' in rewritten
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if request.url.path.startswith("/simple/"):
+            return httpx.Response(200, text=f'<a href="https://files.pythonhosted.org/{WHEEL_PATH}#sha256={WHEEL_SHA}">w</a>')
+        if request.url.path == f"/{WHEEL_PATH}":
+            return httpx.Response(200, content=WHEEL)
+        return httpx.Response(404)
+
+    monkeypatch.setattr(pypi, "pypi_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(pypi, "package_store", ArtifactStore(str(tmp_path), 1024 * 1024))
+    monkeypatch.setattr(pypi, "PYPI_INDEX_URL", "https://pypi.test/simple")
+    monkeypatch.setattr(pypi, "index_cache", pypi.OrderedDict())
+    return requests
+
+@pytest.fixture
+def client(upstream):
+    app = FastAPI()
+    app.include_router(pypi.router)
+    return TestClient(app)
+
+def test_file_is_fetched_once_then_served_from_cache(client, upstream):
+    url = f"/pypi/files/{WHEEL_SHA}/files.pythonhosted.org/{WHEEL_PATH}"
+
+    assert client.get(url).content == WHEEL
+    assert client.get(url).content == WHEEL
+    assert upstream == [f"/{WHEEL_PATH}"]
+
+def test_upstream_failure_is_an_error_status(client):
+    response = client.get(f"/pypi/files/{WHEEL_SHA}/files.pythonhosted.org/packages/missing.whl")
+    assert response.status_code == 404
+
+    response = client.get(f"/pypi/files/{WHEEL_SHA}/files.pythonhosted.org/packages/missing.whl.metadata")
+    assert response.status_code == 404
+
+def test_index_cache_is_bounded(client, upstream, monkeypatch):
+    monkeypatch.setattr(pypi, "PYPI_INDEX_CACHE_SIZE", 1)
+
+    for project in ("demo", "demo", "other", "demo"):
+        assert client.get(f"/pypi/simple/{project}/").status_code == 200
+    assert upstream == ["/simple/demo/", "/simple/other/", "/simple/demo/"]
+    assert list(pypi.index_cache) == ["demo"]
@@ -0,0 +1,67 @@
+from utils import reaper as reaper_module
+from utils.reaper import IdleReaper
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+def make_reaper(monkeypatch, idle_timeout=60, max_lease=600):
+    clock = Clock()
+    monkeypatch.setattr(reaper_module, "time", clock)
+
+    async def on_expire(names):
+        pass
+
+    return IdleReaper(idle_timeout, max_lease, on_expire), clock
+
+def test_sandboxes_expire_in_deadline_order(monkeypatch):
+    reaper, clock = make_reaper(monkeypatch)
+    reaper.touch("a")
+    clock.now += 10
+    reaper.touch("b")
+
+    assert reaper.pop_expired(1059.0) == []
+    assert reaper.pop_expired(1069.0) == ["a"]
+    assert reaper.pop_expired(1070.0) == ["b"]
+    assert reaper.expires_at("b") is None
+
+def test_touch_moves_the_deadline_and_skips_the_stale_entry(monkeypatch):
+    reaper, clock = make_reaper(monkeypatch)
+    reaper.touch("a")
+    clock.now += 30
+    assert reaper.touch("a") == 1090.0
+
+    assert reaper.pop_expired(1060.0) == []
+    assert reaper.expires_at("a") == 1090.0
+    assert reaper.pop_expired(1090.0) == ["a"]
+
+def test_lease_is_capped_and_never_shortens(monkeypatch):
+    reaper, clock = make_reaper(monkeypatch)
+
+    assert reaper.touch("a", lease=3600) == 1600.0
+    assert reaper.touch("a") == 1600.0
+    assert reaper.touch("b", lease=5) == 1060.0
+
+def test_held_sandbox_outlives_its_deadline(monkeypatch):
+    reaper, clock = make_reaper(monkeypatch)
+    reaper.touch("a")
+
+    with reaper.hold("a"):
+        clock.now += 120
+        assert reaper.pop_expired(clock.now) == []
+        assert reaper.expires_at("a") == 1180.0
+    # Released: the idle clock restarts from now
+    assert reaper.expires_at("a") == 1180.0
+    assert reaper.pop_expired(1180.0) == ["a"]
+
+def test_hold_does_not_revive_a_forgotten_sandbox(monkeypatch):
+    reaper, clock = make_reaper(monkeypatch)
+    reaper.touch("a")
+
+    with reaper.hold("a"):
+        reaper.forget("a")
+    assert reaper.expires_at("a") is None
+    assert reaper.pop_expired(clock.now + 3600) == []
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import sandbox_app
+from utils import isolation
+from utils.isolation import KernelIsolation
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(sandbox_app, "SANDBOX_TOKEN", "host-token")
+    # No lifespan: nothing here needs a kernel
+    return TestClient(sandbox_app.app)
+
+def test_probes_need_no_token(client):
+    assert client.get("/health").status_code == 200
+
+def test_routes_need_the_host_token(client):
+    assert client.get("/kernels").status_code == 403
+    assert client.get("/kernels", headers={"X-Sandbox-Token": "other"}).status_code == 403
+    assert client.get("/kernels", headers={"X-Sandbox-Token": "host-token"}).status_code == 200
+
+def test_channel_needs_the_host_token(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws"):
+            pass
+    assert closed.value.code == 1008
+
+def test_no_token_configured_refuses_everything(client, monkeypatch):
+    monkeypatch.setattr(sandbox_app, "SANDBOX_TOKEN", "")
+    assert client.get("/kernels", headers={"X-Sandbox-Token": ""}).status_code == 403
+
+def test_server_secrets_are_not_inherited():
+    for name in sandbox_app.SERVER_SECRETS:
+        assert name not in os.environ
+
+def test_tenant_kernels_get_only_allowed_variables(monkeypatch):
+    monkeypatch.setenv("PATH", "/usr/bin")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(isolation, "KERNEL_ENV", ("PATH",))
+    env = KernelIsolation("k1", 1, "/uploaded_files/k1").env()
+
+    assert env["PATH"] == "/usr/bin"
+    assert env["HOME"] == "/uploaded_files/k1"
+    assert "OPENAI_API_KEY" not in env
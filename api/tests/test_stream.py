@@ -0,0 +1,85 @@
+import json
+import asyncio
+
+import pytest
+
+from utils import stream
+from utils.stream import DataStreamEncoder, ThreadedStream, STREAM_END
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+def frames(wire):
+    return [(line[0], json.loads(line[2:])) for line in wire.splitlines()]
+
+def test_first_delta_is_sent_at_once(monkeypatch):
+    monkeypatch.setattr(stream, "time", Clock())
+    encoder = DataStreamEncoder(flush_interval=1.0, flush_size=100)
+
+    assert frames(encoder.text("Hel")) == [("0", "Hel")]
+    assert encoder.deadline() is None
+
+def test_deltas_are_held_until_the_interval(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(stream, "time", clock)
+    encoder = DataStreamEncoder(flush_interval=1.0, flush_size=100)
+    encoder.text("a")
+
+    assert encoder.text("b") == ""
+    assert encoder.text("c") == ""
+    clock.now += 0.25
+    assert encoder.deadline() == 0.75
+    clock.now += 0.75
+    assert frames(encoder.text("d")) == [("0", "bcd")]
+    assert encoder.deadline() is None
+
+def test_deltas_flush_at_the_size_limit(monkeypatch):
+    monkeypatch.setattr(stream, "time", Clock())
+    encoder = DataStreamEncoder(flush_interval=1.0, flush_size=4)
+    encoder.text("first")
+
+    assert encoder.text("ab") == ""
+    assert frames(encoder.text("cd")) == [("0", "abcd")]
+
+def test_held_text_goes_out_before_other_frames(monkeypatch):
+    monkeypatch.setattr(stream, "time", Clock())
+    encoder = DataStreamEncoder(flush_interval=1.0, flush_size=100)
+    encoder.text("a")
+    encoder.text("b")
+
+    wire = encoder.tool_call("call_1", "python", '{"code": "1 + 1"}')
+    assert frames(wire) == [
+        ("0", "b"),
+        ("9", {"toolCallId": "call_1", "toolName": "python", "args": {"code": "1 + 1"}})
+    ]
+    assert frames(encoder.finish("stop", 3, 4)) == [
+        ("e", {"finishReason": "stop", "usage": {"promptTokens": 3, "completionTokens": 4}, "isContinued": False})
+    ]
+
+def test_unparseable_tool_arguments_are_kept_as_text():
+    encoder = DataStreamEncoder()
+    assert frames(encoder.tool_call("call_1", "python", "{not json"))[0][1]["args"] == "{not json"
+
+def test_threaded_stream_relays_items_then_the_end():
+    async def read():
+        chunks = ThreadedStream(iter(["a", "b"]))
+        return [await chunks.next(timeout=5) for _ in range(3)]
+
+    assert asyncio.run(read()) == ["a", "b", STREAM_END]
+
+def test_threaded_stream_raises_the_iterator_error():
+    def failing():
+        yield "a"
+        raise ValueError("upstream closed")
+
+    async def read():
+        chunks = ThreadedStream(failing())
+        assert await chunks.next(timeout=5) == "a"
+        await chunks.next(timeout=5)
+
+    with pytest.raises(ValueError, match="upstream closed"):
+        asyncio.run(read())
@@ -0,0 +1,56 @@
+import json
+import asyncio
+
+import httpx
+
+from utils import tools as tools_module
+from utils.tools import python_batch, session_containers
+
+def batch_response(lines):
+    def handler(request):
+        assert request.url.path == "/sandboxes/sbx-1/execute_batch"
+        body = "".join(json.dumps(line) + "\n" for line in lines)
+        return httpx.Response(200, text=body, headers={"content-type": "application/x-ndjson"})
+    return handler
+
+def run_batch(monkeypatch, cells, lines):
+    client = httpx.AsyncClient
+
+    def mock_client(**kwargs):
+        kwargs.pop("event_hooks", None)
+        return client(transport=httpx.MockTransport(batch_response(lines)), **kwargs)
+
+    monkeypatch.setenv("SANDBOX_API_URL", "http://api")
+    monkeypatch.setattr(tools_module.httpx, "AsyncClient", mock_client)
+    monkeypatch.setitem(session_containers, "s1", "sbx-1")
+    return asyncio.run(python_batch(cells, session_id="s1"))
+
+def test_empty_batch_is_a_tool_error():
+    result = asyncio.run(python_batch([], session_id="s1"))
+    assert not result["success"]
+    assert result["outputs"][0]["ename"] == "ValueError"
+
+def test_outputs_are_grouped_by_cell(monkeypatch):
+    result = run_batch(monkeypatch, ["print(1)", "1/0"], [
+        {"output_type": "cell_start", "cell": 0},
+        {"output_type": "stream", "name": "stdout", "text": "1\n", "cell": 0},
+        {"output_type": "cell_end", "cell": 0, "status": "ok", "seconds": 0.1},
+        {"output_type": "error", "ename": "ZeroDivisionError", "evalue": "", "traceback": [], "cell": 1},
+        {"output_type": "cell_end", "cell": 1, "status": "error", "seconds": 0.1},
+        {"output_type": "batch_summary", "cells": 2}
+    ])
+    assert [cell["status"] for cell in result["cells"]] == ["ok", "error"]
+    assert result["cells"][0]["outputs"] == [{"output_type": "stream", "name": "stdout", "text": "1\n"}]
+    assert not result["success"] and result["metadata"]["cells"] == 2
+
+def test_stray_outputs_are_kept_at_batch_level(monkeypatch):
+    result = run_batch(monkeypatch, ["x = 1"], [
+        {"output_type": "stream", "name": "stderr", "text": "before any cell\n"},
+        {"output_type": "stream", "name": "stderr", "text": "out of range\n", "cell": 5},
+        {"output_type": "sandbox_resized", "sandbox_id": "sbx-2", "text": "Moved to a larger sandbox"}
+    ])
+    assert result["cells"][0]["outputs"] == [] and result["cells"][0]["status"] == "skipped"
+    assert [output["text"] for output in result["outputs"]] == [
+        "before any cell\n", "out of range\n", "Moved to a larger sandbox\n"
+    ]
+    assert session_containers["s1"] == "sbx-2"
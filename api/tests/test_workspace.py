@@ -0,0 +1,118 @@
+import io
+import os
+import time
+import tarfile
+
+import pytest
+
+from utils.workspace import build_snapshot, restore_snapshot, scan, SNAPSHOT_META
+from utils.snapshots import SnapshotStore
+
+def write(root, path, text):
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+def read_tree(root):
+    tree = {}
+    for path in scan(str(root)):
+        with open(os.path.join(root, path)) as f:
+            tree[path] = f.read()
+    return tree
+
+def snapshot(root, previous):
+    layer = io.BytesIO()
+    if not build_snapshot(layer, previous, str(root)):
+        return None
+    layer.seek(0)
+    return layer
+
+def test_layers_replay_changes_and_deletions(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "target"
+    write(source, "data.csv", "a,b\n1,2\n")
+    write(source, "notes/todo.txt", "plot it")
+    first = snapshot(source, {})
+    manifest = scan(str(source))
+
+    write(source, "notes/todo.txt", "plotted")
+    os.utime(source / "notes/todo.txt", ns=(1, 1))
+    os.remove(source / "data.csv")
+    second = snapshot(source, manifest)
+
+    restore_snapshot(first, str(target))
+    assert read_tree(target) == {"data.csv": "a,b\n1,2\n", "notes/todo.txt": "plot it"}
+    restore_snapshot(second, str(target))
+    assert read_tree(target) == read_tree(source) == {"notes/todo.txt": "plotted"}
+    # Restored files keep their recorded mtimes, so nothing looks changed afterwards
+    assert snapshot(target, scan(str(source))) is None
+
+def test_unchanged_workspace_writes_no_layer(tmp_path):
+    write(tmp_path, "a.txt", "a")
+    assert snapshot(tmp_path, scan(str(tmp_path))) is None
+
+def test_restore_ignores_paths_outside_the_root(tmp_path):
+    layer = io.BytesIO()
+    with tarfile.open(fileobj=layer, mode="w:gz") as tar:
+        meta = b'{"manifest": {}, "deleted": ["../outside.txt"]}'
+        info = tarfile.TarInfo(SNAPSHOT_META)
+        info.size = len(meta)
+        tar.addfile(info, io.BytesIO(meta))
+        info = tarfile.TarInfo("../escaped.txt")
+        info.size = 1
+        tar.addfile(info, io.BytesIO(b"x"))
+    layer.seek(0)
+    write(tmp_path, "outside.txt", "keep")
+
+    restore_snapshot(layer, str(tmp_path / "root"))
+    assert not (tmp_path / "escaped.txt").exists()
+    assert (tmp_path / "outside.txt").read_text() == "keep"
+
+def test_restore_refuses_other_archives(tmp_path):
+    layer = io.BytesIO()
+    with tarfile.open(fileobj=layer, mode="w:gz"):
+        pass
+    layer.seek(0)
+    with pytest.raises(ValueError):
+        restore_snapshot(layer, str(tmp_path))
+
+def test_store_compacts_layers(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "target"
+    store = SnapshotStore(str(tmp_path / "store"), max_layers=2)
+
+    for version in range(3):
+        write(source, "v.txt", f"version {version}")
+        write(source, f"only-{version}.txt", str(version))
+        if version:
+            os.remove(source / f"only-{version - 1}.txt")
+        os.utime(source / "v.txt", ns=(version + 1, version + 1))
+        partial = store.new_layer_path("s1")
+        with open(partial, "wb") as f:
+            assert build_snapshot(f, store.manifest("s1"), str(source))
+        store.add_layer("s1", partial)
+
+    layers = store.layers("s1")
+    assert len(layers) == 1
+    with open(layers[0], "rb") as f:
+        restore_snapshot(f, str(target))
+    assert read_tree(target) == {"v.txt": "version 2", "only-2.txt": "2"}
+
+def test_sweep_drops_expired_sessions_but_keeps_live_ones(tmp_path):
+    store = SnapshotStore(str(tmp_path), max_layers=8, ttl=60, max_bytes=1024 * 1024)
+    for session_id in ("old", "live", "new"):
+        write(tmp_path, f"{session_id}/0000.tar.gz", "layer")
+    past = time.time() - 3600
+    for session_id in ("old", "live"):
+        os.utime(tmp_path / session_id / "0000.tar.gz", (past, past))
+
+    assert store.sweep(keep={"live"}) == ["old"]
+    assert sorted(os.listdir(tmp_path)) == ["live", "new"]
+
+def test_sweep_enforces_the_size_cap_oldest_first(tmp_path):
+    store = SnapshotStore(str(tmp_path), max_layers=8, ttl=3600, max_bytes=10)
+    for age, session_id in enumerate(("c", "b", "a")):
+        write(tmp_path, f"{session_id}/0000.tar.gz", "x" * 6)
+        written = time.time() - age
+        os.utime(tmp_path / session_id / "0000.tar.gz", (written, written))
+
+    assert store.sweep() == ["a", "b"]
@@ -1,2 +1,9 @@
-from .prompt import ClientMessage, convert_to_openai_messages
-from .tools import get_current_weather
+# Submodules are imported on first use so the sandbox server does not load the chat stack
+def __getattr__(name):
+    if name in ("ClientMessage", "convert_to_openai_messages"):
+        from . import prompt
+        return getattr(prompt, name)
+    if name == "get_current_weather":
+        from . import tools
+        return tools.get_current_weather
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,166 @@
+import os
+import re
+import hmac
+import base64
+import binascii
+import hashlib
+from collections import OrderedDict
+
+import httpx
+
+from .tracing import inject_traceparent
+from .log import get_logger
+
+log = get_logger("artifacts")
+
+# API side: content-addressed store for binary display outputs
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", "/tmp/artifacts")
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Largest single upload; bigger payloads stay inline
+ARTIFACT_UPLOAD_MAX_BYTES = int(os.environ.get("ARTIFACT_UPLOAD_MAX_BYTES", str(32 * 1024 * 1024)))
+# On the API, the secret each sandbox's upload token is derived from (artifact_token); in a sandbox,
+# that sandbox's own token. Uploads are refused, and payloads stay inline, without it.
+ARTIFACT_TOKEN = os.environ.get("ARTIFACT_TOKEN", "")
+
+# Sandbox side: where to upload payloads, and which payloads are worth moving out of band
+SANDBOX_NAME = os.environ.get("SANDBOX_NAME", "")
+ARTIFACT_STORE_URL = os.environ.get("ARTIFACT_STORE_URL", "")
+ARTIFACT_MIN_SIZE = int(os.environ.get("ARTIFACT_MIN_SIZE", "4096"))
+ARTIFACT_MIME_TYPES = ("image/png", "image/jpeg", "image/gif", "application/pdf")
+# Artifact ids this sandbox has already uploaded, newest last
+UPLOADED_ARTIFACTS_MAX = int(os.environ.get("UPLOADED_ARTIFACTS_MAX", "4096"))
+
+ARTIFACT_ID = re.compile(r"[0-9a-f]{64}")
+
+def artifact_token(name):
+    """Upload token of one sandbox host, so a token that leaks from a sandbox is good for that host only"""
+    return hmac.new(ARTIFACT_TOKEN.encode(), name.encode(), hashlib.sha256).hexdigest()
+
+class ArtifactStore:
+    """Files named by sha256 under one directory, evicted least-recently-used past max_bytes"""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total = 0
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        os.makedirs(self.root, exist_ok=True)
+
+        found = []
+        for name in os.listdir(self.root):
+            if ARTIFACT_ID.fullmatch(name):
+                stat = os.stat(os.path.join(self.root, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total += size
+        self.loaded = True
+
+    def path(self, artifact_id):
+        return os.path.join(self.root, artifact_id)
+
+    def get(self, artifact_id):
+        """Return (path, content_type, size) or None"""
+        self.load()
+        if artifact_id not in self.entries:
+            return None
+
+        self.entries.move_to_end(artifact_id)
+        try:
+            with open(self.path(artifact_id) + ".type") as f:
+                content_type = f.read().strip()
+        except OSError:
+            content_type = "application/octet-stream"
+        return self.path(artifact_id), content_type, self.entries[artifact_id]
+
+    def put_file(self, artifact_id, source, content_type):
+        """Move an already verified file into the store. Returns False if it was already present."""
+        self.load()
+        if artifact_id in self.entries:
+            self.entries.move_to_end(artifact_id)
+            os.remove(source)
+            return False
+
+        path = self.path(artifact_id)
+        with open(path + ".type", "w") as f:
+            f.write(content_type)
+        os.replace(source, path)
+
+        size = os.path.getsize(path)
+        self.entries[artifact_id] = size
+        self.total += size
+        self.evict()
+        return True
+
+    def evict(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            artifact_id, size = self.entries.popitem(last=False)
+            self.total -= size
+            for suffix in ("", ".type"):
+                try:
+                    os.remove(self.path(artifact_id) + suffix)
+                except OSError:
+                    pass
+
+artifact_store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES)
+
+uploaded_artifacts = OrderedDict()
+artifact_client = None
+
+async def upload_artifact(artifact_id, raw, content_type):
+    global artifact_client
+    if artifact_client is None:
+        artifact_client = httpx.AsyncClient(timeout=30.0, event_hooks={"request": [inject_traceparent]})
+
+    headers = {"Content-Type": content_type, "X-Artifact-Token": ARTIFACT_TOKEN, "X-Sandbox-Name": SANDBOX_NAME}
+
+    response = await artifact_client.put(f"{ARTIFACT_STORE_URL}/{artifact_id}", content=raw, headers=headers)
+    response.raise_for_status()
+
+async def offload_artifacts(output):
+    """Replace large binary payloads in a display output with references to the artifact store.
+
+    Payloads stay inline when no store or token is configured, or the upload fails.
+    """
+    data = output.get("data")
+    if not ARTIFACT_STORE_URL or not ARTIFACT_TOKEN or not SANDBOX_NAME or not data:
+        return output
+
+    for mime in ARTIFACT_MIME_TYPES:
+        payload = data.get(mime)
+        if not isinstance(payload, str) or len(payload) < ARTIFACT_MIN_SIZE:
+            continue
+
+        try:
+            raw = base64.b64decode(payload)
+        except (binascii.Error, ValueError):
+            continue
+        if len(raw) > ARTIFACT_UPLOAD_MAX_BYTES:
+            continue
+
+        artifact_id = hashlib.sha256(raw).hexdigest()
+        if artifact_id in uploaded_artifacts:
+            uploaded_artifacts.move_to_end(artifact_id)
+        else:
+            try:
+                await upload_artifact(artifact_id, raw, mime)
+            except httpx.HTTPError as e:
+                log.warning("Artifact upload failed", extra={"artifact_id": artifact_id, "error": str(e)})
+                continue
+            uploaded_artifacts[artifact_id] = True
+            if len(uploaded_artifacts) > UPLOADED_ARTIFACTS_MAX:
+                uploaded_artifacts.popitem(last=False)
+
+        del data[mime]
+        output.setdefault("artifacts", {})[mime] = {
+            "id": artifact_id,
+            "url": f"/api/artifacts/{artifact_id}",
+            "size": len(raw)
+        }
+
+    return output
@@ -0,0 +1,135 @@
+import os
+
+# Sandbox side: resource counters of the sandbox container (or of one tenant kernel's cgroup).
+# cgroup v2 is read when present, otherwise the v1 memory and cpu controllers.
+CGROUP_DIR = os.environ.get("SANDBOX_CGROUP_DIR", "/sys/fs/cgroup")
+
+def read_value(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def read_keyed(path):
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    values[parts[0]] = int(parts[1])
+    except (OSError, ValueError):
+        pass
+    return values
+
+def read_io_v2(path):
+    """Sum rbytes/wbytes over devices from cgroup v2 io.stat"""
+    read = written = 0
+    try:
+        with open(path) as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition("=")
+                    if key == "rbytes":
+                        read += int(value)
+                    elif key == "wbytes":
+                        written += int(value)
+    except (OSError, ValueError):
+        return None, None
+    return read, written
+
+def read_io_v1(path):
+    read = written = 0
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[1] == "Read":
+                    read += int(parts[2])
+                elif len(parts) == 3 and parts[1] == "Write":
+                    written += int(parts[2])
+    except (OSError, ValueError):
+        return None, None
+    return read, written
+
+def read_stats(root=CGROUP_DIR):
+    """Counters in common units; missing ones are None"""
+    if os.path.exists(os.path.join(root, "cgroup.controllers")):
+        cpu = read_keyed(os.path.join(root, "cpu.stat"))
+        events = read_keyed(os.path.join(root, "memory.events"))
+        io_read, io_write = read_io_v2(os.path.join(root, "io.stat"))
+        return {
+            "memory_bytes": read_value(os.path.join(root, "memory.current")),
+            "memory_peak_bytes": read_value(os.path.join(root, "memory.peak")),
+            "memory_limit_bytes": read_value(os.path.join(root, "memory.max")),
+            "oom_kills": events.get("oom_kill"),
+            "cpu_seconds": cpu["usage_usec"] / 1e6 if "usage_usec" in cpu else None,
+            "cpu_throttled_seconds": cpu["throttled_usec"] / 1e6 if "throttled_usec" in cpu else None,
+            "cpu_throttled_periods": cpu.get("nr_throttled"),
+            "pids": read_value(os.path.join(root, "pids.current")),
+            "pids_limit": read_value(os.path.join(root, "pids.max")),
+            "io_read_bytes": io_read,
+            "io_write_bytes": io_write
+        }
+
+    memory = os.path.join(root, "memory")
+    cpu_dir = next(
+        (os.path.join(root, name) for name in ("cpu,cpuacct", "cpu", "cpuacct") if os.path.isdir(os.path.join(root, name))),
+        root
+    )
+    cpu = read_keyed(os.path.join(cpu_dir, "cpu.stat"))
+    usage = read_value(os.path.join(cpu_dir, "cpuacct.usage"))
+    limit = read_value(os.path.join(memory, "memory.limit_in_bytes"))
+    io_read, io_write = read_io_v1(os.path.join(root, "blkio", "blkio.throttle.io_service_bytes"))
+    return {
+        "memory_bytes": read_value(os.path.join(memory, "memory.usage_in_bytes")),
+        "memory_peak_bytes": read_value(os.path.join(memory, "memory.max_usage_in_bytes")),
+        # v1 reports "no limit" as a huge page-aligned number
+        "memory_limit_bytes": limit if limit is not None and limit < 2 ** 60 else None,
+        "oom_kills": read_keyed(os.path.join(memory, "memory.oom_control")).get("oom_kill"),
+        "cpu_seconds": usage / 1e9 if usage is not None else None,
+        "cpu_throttled_seconds": cpu["throttled_time"] / 1e9 if "throttled_time" in cpu else None,
+        "cpu_throttled_periods": cpu.get("nr_throttled"),
+        "pids": read_value(os.path.join(root, "pids", "pids.current")),
+        "pids_limit": read_value(os.path.join(root, "pids", "pids.max")),
+        "io_read_bytes": io_read,
+        "io_write_bytes": io_write
+    }
+
+def reset_peak_rss(pid):
+    """Restart the process's high-water mark (VmHWM) so it measures the next cell only"""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (OSError, TypeError):
+        return False
+
+def read_peak_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, TypeError):
+        pass
+    return None
+
+def read_rss(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, TypeError):
+        return None
+
+def delta(after, before, key):
+    if after.get(key) is None or before.get(key) is None:
+        return None
+    return after[key] - before[key]
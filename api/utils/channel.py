@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+
+import websockets
+
+from .tracing import traceparent
+from .log import get_logger
+
+log = get_logger("channel")
+
+# Heartbeats double as liveness checks and as activity reports for busy kernels
+HEARTBEAT_INTERVAL = float(os.environ.get("SANDBOX_HEARTBEAT_INTERVAL", "10"))
+HEARTBEAT_MISSES = 3
+CONNECT_TIMEOUT = 10.0
+
+class ChannelClosed(Exception):
+    pass
+
+class SandboxChannel:
+    """Persistent WebSocket to one sandbox server, multiplexing executions by id.
+
+    Frames are JSON objects with a `type`:
+      API -> sandbox: execute, interrupt, input_reply, ping
+      sandbox -> API: output, input_request, done, error, pong
+    """
+
+    def __init__(self, sandbox_id, url, on_heartbeat=None, headers=None):
+        self.sandbox_id = sandbox_id
+        self.url = url
+        self.headers = headers
+        self.on_heartbeat = on_heartbeat
+        self.ws = None
+        self.executions = {}
+        self.tasks = []
+        self.last_pong = 0.0
+        self.closed = False
+
+    async def connect(self):
+        self.ws = await asyncio.wait_for(
+            websockets.connect(self.url, extra_headers=self.headers, max_size=None, ping_interval=None),
+            timeout=CONNECT_TIMEOUT
+        )
+        self.last_pong = time.monotonic()
+        self.tasks = [
+            asyncio.create_task(self.read_loop()),
+            asyncio.create_task(self.heartbeat_loop())
+        ]
+
+    async def send(self, message):
+        if self.closed:
+            raise ChannelClosed(f"Channel to {self.sandbox_id} is closed")
+        await self.ws.send(json.dumps(message))
+
+    async def read_loop(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+
+                if message.get("type") == "pong":
+                    self.last_pong = time.monotonic()
+                    if self.on_heartbeat is not None:
+                        self.on_heartbeat(self.sandbox_id, message.get("busy", False) or bool(self.executions))
+                    continue
+
+                execution = self.executions.get(message.get("id"))
+                if execution is not None:
+                    execution.put_nowait(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.mark_closed("Sandbox disconnected unexpectedly")
+
+    async def heartbeat_loop(self):
+        while not self.closed:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_pong > HEARTBEAT_INTERVAL * HEARTBEAT_MISSES:
+                log.warning("Sandbox missed heartbeats, closing channel", extra={"sandbox_id": self.sandbox_id})
+                await self.close()
+                return
+            try:
+                await self.send({"type": "ping", "ts": time.time()})
+            except (ChannelClosed, websockets.ConnectionClosed):
+                return
+
+    def mark_closed(self, detail):
+        if self.closed:
+            return
+        self.closed = True
+        for execution in self.executions.values():
+            execution.put_nowait({"type": "error", "detail": detail})
+
+    async def execute(self, code, execution_id=None, allow_stdin=False):
+        """Yield NDJSON output lines for one execution"""
+        execution_id = execution_id or uuid.uuid4().hex
+        execution = asyncio.Queue()
+        self.executions[execution_id] = execution
+        finished = False
+
+        try:
+            await self.send({
+                "type": "execute",
+                "id": execution_id,
+                "code": code,
+                "allow_stdin": allow_stdin,
+                "traceparent": traceparent()
+            })
+
+            while True:
+                message = await execution.get()
+                kind = message["type"]
+
+                if kind == "output":
+                    yield message["data"]
+                elif kind == "input_request":
+                    yield json.dumps({
+                        "output_type": "input_request",
+                        "prompt": message["prompt"],
+                        "password": message.get("password", False)
+                    }) + "\n"
+                elif kind == "done":
+                    finished = True
+                    return
+                elif kind == "error":
+                    finished = True
+                    raise ChannelClosed(message.get("detail", "Sandbox execution error"))
+        finally:
+            self.executions.pop(execution_id, None)
+            # The caller stopped listening; do not leave the cell running
+            if not finished and not self.closed:
+                try:
+                    await self.send({"type": "interrupt", "id": execution_id})
+                except (ChannelClosed, websockets.ConnectionClosed):
+                    pass
+
+    async def interrupt(self, execution_id):
+        await self.send({"type": "interrupt", "id": execution_id})
+
+    async def input_reply(self, execution_id, value):
+        await self.send({"type": "input_reply", "id": execution_id, "value": value})
+
+    async def close(self):
+        self.mark_closed("Sandbox channel closed")
+        for task in self.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        if self.ws is not None:
+            await self.ws.close()
+
+channels = {}
+channel_locks = {}
+
+async def get_channel(sandbox_id, url, on_heartbeat=None, headers=None):
+    channel = channels.get(sandbox_id)
+    if channel is not None and not channel.closed:
+        return channel
+
+    async with channel_locks.setdefault(sandbox_id, asyncio.Lock()):
+        channel = channels.get(sandbox_id)
+        if channel is not None and not channel.closed:
+            return channel
+
+        channel = SandboxChannel(sandbox_id, url, on_heartbeat, headers)
+        await channel.connect()
+        channels[sandbox_id] = channel
+        return channel
+
+async def close_channel(sandbox_id):
+    channel = channels.pop(sandbox_id, None)
+    channel_locks.pop(sandbox_id, None)
+    if channel is not None:
+        await channel.close()
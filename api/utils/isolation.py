@@ -0,0 +1,142 @@
+import os
+import shutil
+import resource
+import tempfile
+
+from .cgroup import read_rss
+from .log import get_logger
+
+log = get_logger("isolation")
+
+# Shared sandbox pods: each kernel runs as its own uid, in its own directory, under its own limits.
+# The sandbox server has to run as root for that (backends start shared hosts as root with a reduced
+# capability set); without it tenant kernels are refused rather than started unisolated. Memory and
+# CPU limits use a cgroup v2 subtree when one is writable, else per-kernel rlimits, as /kernels reports.
+KERNEL_UID_BASE = int(os.environ.get("KERNEL_UID_BASE", "20000"))
+KERNEL_MEMORY_LIMIT = int(os.environ.get("KERNEL_MEMORY_LIMIT", str(1024 * 1024 * 1024)))
+KERNEL_CPU_LIMIT = float(os.environ.get("KERNEL_CPU_LIMIT", "0.5"))
+KERNEL_MAX_PROCS = int(os.environ.get("KERNEL_MAX_PROCS", "256"))
+KERNEL_MAX_FILES = int(os.environ.get("KERNEL_MAX_FILES", "1024"))
+KERNEL_CGROUP_ROOT = os.environ.get("KERNEL_CGROUP_ROOT", "/sys/fs/cgroup/kernels")
+# The only server variables tenant kernels see; the rest (tokens, API addresses) stay with the server
+KERNEL_ENV = tuple(
+    name.strip()
+    for name in os.environ.get(
+        "KERNEL_ENV",
+        "PATH,LANG,LANGUAGE,LC_ALL,TZ,CONDA_DIR,VIRTUAL_ENV,PYTHONPATH,PIP_INDEX_URL,PIP_TRUSTED_HOST,MPLBACKEND"
+    ).split(",")
+    if name.strip()
+)
+CPU_PERIOD = 100000
+
+class IsolationUnavailable(RuntimeError):
+    pass
+
+def isolation_unavailable():
+    """Why tenant kernels cannot be isolated here, or None"""
+    if os.geteuid() != 0:
+        return "Shared sandbox is not running as root, so kernels cannot get their own uid"
+    return None
+
+def write_file(path, value):
+    with open(path, "w") as f:
+        f.write(value)
+
+class KernelIsolation:
+    """Launch settings for one tenant kernel in a shared pod"""
+
+    def __init__(self, kernel_id, slot, workdir):
+        self.kernel_id = kernel_id
+        self.uid = KERNEL_UID_BASE + slot
+        self.workdir = workdir
+        self.runtime_dir = os.path.join(tempfile.gettempdir(), "kernels", kernel_id)
+        self.connection_file = os.path.join(self.runtime_dir, "connection.json")
+        self.cgroup = None
+
+    @property
+    def limits(self):
+        return "cgroup" if self.cgroup is not None else "rlimit"
+
+    def prepare(self):
+        reason = isolation_unavailable()
+        if reason is not None:
+            raise IsolationUnavailable(reason)
+
+        os.makedirs(self.workdir, exist_ok=True)
+        os.makedirs(self.runtime_dir, mode=0o700, exist_ok=True)
+        for path in (self.workdir, self.runtime_dir):
+            os.chown(path, self.uid, self.uid)
+        os.chmod(self.workdir, 0o700)
+
+        try:
+            cgroup = os.path.join(KERNEL_CGROUP_ROOT, self.kernel_id)
+            os.makedirs(cgroup, exist_ok=True)
+            write_file(os.path.join(cgroup, "memory.max"), str(KERNEL_MEMORY_LIMIT))
+            write_file(os.path.join(cgroup, "cpu.max"), f"{int(KERNEL_CPU_LIMIT * CPU_PERIOD)} {CPU_PERIOD}")
+            self.cgroup = cgroup
+        except OSError as e:
+            log.warning("No cgroup for kernel, falling back to rlimits", extra={"kernel_id": self.kernel_id, "error": str(e)})
+            self.cgroup = None
+
+    def env(self):
+        scratch = os.path.join(self.runtime_dir, "home")
+        return {
+            **{name: os.environ[name] for name in KERNEL_ENV if name in os.environ},
+            "HOME": self.workdir,
+            "IPYTHONDIR": os.path.join(scratch, "ipython"),
+            "MPLCONFIGDIR": os.path.join(scratch, "matplotlib")
+        }
+
+    def launch_kwargs(self):
+        """Extra arguments for AsyncKernelManager.start_kernel, passed through to Popen"""
+        cgroup = self.cgroup
+        uid = self.uid
+        connection_file = self.connection_file
+
+        def enter_sandbox():
+            # Runs in the forked child, before exec
+            if cgroup is not None:
+                try:
+                    write_file(os.path.join(cgroup, "cgroup.procs"), str(os.getpid()))
+                except OSError:
+                    pass
+            else:
+                # Heap and anonymous mappings only; an address space cap would break large library imports
+                resource.setrlimit(resource.RLIMIT_DATA, (KERNEL_MEMORY_LIMIT, KERNEL_MEMORY_LIMIT))
+            resource.setrlimit(resource.RLIMIT_NOFILE, (KERNEL_MAX_FILES, KERNEL_MAX_FILES))
+            resource.setrlimit(resource.RLIMIT_NPROC, (KERNEL_MAX_PROCS, KERNEL_MAX_PROCS))
+            os.chown(connection_file, uid, uid)
+            os.setgroups([])
+            os.setgid(uid)
+            os.setuid(uid)
+
+        return {"cwd": self.workdir, "env": self.env(), "preexec_fn": enter_sandbox}
+
+    def adopt(self, path):
+        """Hand files written by the sandbox server (uploads, restores) to the kernel's user"""
+        if os.path.isfile(path):
+            os.chown(path, self.uid, self.uid)
+            return
+        for directory, dirs, files in os.walk(path):
+            os.chown(directory, self.uid, self.uid)
+            for name in files:
+                os.chown(os.path.join(directory, name), self.uid, self.uid)
+
+    def memory_usage(self, pid=None):
+        """Bytes in use by the kernel: its cgroup if it has one, else the kernel process RSS"""
+        try:
+            if self.cgroup is not None:
+                with open(os.path.join(self.cgroup, "memory.current")) as f:
+                    return int(f.read())
+        except (OSError, ValueError):
+            pass
+        return read_rss(pid) or 0
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        shutil.rmtree(self.runtime_dir, ignore_errors=True)
+        if self.cgroup is not None:
+            try:
+                os.rmdir(self.cgroup)
+            except OSError:
+                pass
@@ -0,0 +1,581 @@
+import os
+import ast
+import json
+import asyncio
+import queue
+import time
+import hashlib
+
+from .outputs import OutputBatcher, stream_kernel_outputs, to_line
+from .cgroup import CGROUP_DIR, read_stats, delta, reset_peak_rss, read_peak_rss, read_rss
+from .workspace import WORKSPACE_DIR, scan
+from .isolation import KernelIsolation, IsolationUnavailable, isolation_unavailable
+from .log import get_logger
+
+log = get_logger("kernel")
+
+KERNEL_DRAIN_TIMEOUT = 10.0
+# Imported into the kernel before the sandbox reports ready, so the first cell does not pay for them
+SANDBOX_PRELOAD = [
+    name.strip()
+    for name in os.environ.get("SANDBOX_PRELOAD", "numpy,pandas,matplotlib.pyplot").split(",")
+    if name.strip()
+]
+
+# Opt-in: pickle the kernel's globals into the workspace so they come back with its snapshot
+KERNEL_CHECKPOINT = os.environ.get("KERNEL_CHECKPOINT", "0") == "1"
+KERNEL_CHECKPOINT_MAX_BYTES = int(os.environ.get("KERNEL_CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))
+KERNEL_CHECKPOINT_IDLE = float(os.environ.get("KERNEL_CHECKPOINT_IDLE", "300"))
+# Variable names or type names that are never pickled (handles, connections, plots)
+KERNEL_CHECKPOINT_SKIP = [
+    name.strip()
+    for name in os.environ.get(
+        "KERNEL_CHECKPOINT_SKIP",
+        "Figure,Axes,Thread,Lock,socket,TextIOWrapper,BufferedReader,BufferedWriter,Connection,Cursor,Engine,Session"
+    ).split(",")
+    if name.strip()
+]
+
+# Opt-in: a cell run again with kernel state and workspace files unchanged since its last run is
+# answered from that run's output, without the kernel
+KERNEL_RESULT_CACHE = os.environ.get("KERNEL_RESULT_CACHE", "0") == "1"
+KERNEL_RESULT_CACHE_SIZE = int(os.environ.get("KERNEL_RESULT_CACHE_SIZE", "32"))
+KERNEL_RESULT_CACHE_MAX_CHARS = int(os.environ.get("KERNEL_RESULT_CACHE_MAX_CHARS", str(1024 * 1024)))
+# Only cells that read state are cached: expressions whose calls all go to these functions. Bare names
+# are builtins; dotted names are module functions, and their modules may be imported in the cell.
+# Methods of user objects (df.head(), it.count()) are never trusted: they can mutate or consume.
+KERNEL_RESULT_CACHE_CALLS = frozenset(
+    name.strip()
+    for name in os.environ.get(
+        "KERNEL_RESULT_CACHE_CALLS",
+        "print,len,repr,str,type,round,abs,isinstance,"
+        "os.listdir,os.getcwd,os.path.exists,os.path.isfile,os.path.isdir,os.path.getsize,"
+        "os.path.join,os.path.basename,os.path.dirname,os.path.splitext"
+    ).split(",")
+    if name.strip()
+)
+# Builtins that iterate their arguments, allowed only over literals and allowlisted calls so they
+# cannot drain a user's iterator or generator
+ITERATING_CALLS = frozenset(("sorted", "list", "tuple", "set", "min", "max", "sum", "any", "all"))
+PURE_NODES = (
+    ast.Module, ast.Expr, ast.Name, ast.Attribute, ast.Subscript, ast.Slice, ast.Constant, ast.keyword,
+    ast.Tuple, ast.List, ast.Set, ast.Dict, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.JoinedStr, ast.FormattedValue, ast.alias,
+    ast.expr_context, ast.operator, ast.unaryop, ast.boolop, ast.cmpop
+)
+LITERAL_NODES = (ast.Constant, ast.Tuple, ast.List, ast.Set, ast.Dict, ast.Call)
+
+def call_name(func):
+    """Dotted name of a called function (os.path.exists), or None if it is not a plain name chain"""
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    parts.append(func.id)
+    return ".".join(reversed(parts))
+
+def pure_cell(code):
+    """Whether a cell only reads state: imports of the modules of KERNEL_RESULT_CACHE_CALLS and expression
+    statements, with calls limited to KERNEL_RESULT_CACHE_CALLS. Anything that assigns, defines, loops,
+    calls a method of a user object or is not plain Python (magics, shell escapes) is not."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    if not tree.body:
+        return False
+    modules = {name.rsplit(".", 1)[0] for name in KERNEL_RESULT_CACHE_CALLS if "." in name}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            # Binding a module to its own name again changes nothing
+            if any(alias.name not in modules or alias.asname is not None for alias in node.names):
+                return False
+        elif isinstance(node, ast.Call):
+            name = call_name(node.func)
+            if name in ITERATING_CALLS:
+                if not all(isinstance(arg, LITERAL_NODES) for arg in node.args):
+                    return False
+            elif name not in KERNEL_RESULT_CACHE_CALLS:
+                return False
+            # print(..., file=handle) writes; keyword values are limited to constants
+            if not all(isinstance(keyword.value, ast.Constant) for keyword in node.keywords):
+                return False
+        elif not isinstance(node, PURE_NODES):
+            return False
+    return True
+
+# dedicated: one kernel per pod (kernel_session). shared: up to SANDBOX_MAX_KERNELS tenant kernels (kernel_pool).
+SANDBOX_MODE = os.environ.get("SANDBOX_MODE", "dedicated")
+SANDBOX_MAX_KERNELS = int(os.environ.get("SANDBOX_MAX_KERNELS", "8"))
+DEFAULT_KERNEL = "default"
+
+def preload_code(modules):
+    code = (
+        "import importlib as _importlib\n"
+        f"for _name in {modules!r}:\n"
+        "    try:\n"
+        "        _importlib.import_module(_name)\n"
+        "    except Exception as _error:\n"
+        "        print(f'Preload of {_name} failed: {_error}')\n"
+        "del _importlib, _name\n"
+    )
+    if any(name.startswith("matplotlib") for name in modules):
+        code += "%matplotlib inline\n"
+    return code
+
+def checkpoint_code(path, max_bytes, skip):
+    # Modules are recorded by name and re-imported; everything else must pickle on its own.
+    # Functions and classes defined in cells cannot be unpickled in a fresh kernel, so they are skipped.
+    return (
+        "def _checkpoint(path, max_bytes, skip):\n"
+        "    import os, json, types, pickle\n"
+        "    ip = get_ipython()\n"
+        "    modules, values, skipped, total = {}, {}, [], 0\n"
+        "    for name, value in list(ip.user_ns.items()):\n"
+        "        if name.startswith('_') or name in ip.user_ns_hidden or name in skip or type(value).__name__ in skip:\n"
+        "            continue\n"
+        "        if isinstance(value, types.ModuleType):\n"
+        "            modules[name] = value.__name__\n"
+        "            continue\n"
+        "        if getattr(value, '__module__', None) == '__main__' and isinstance(value, (type, types.FunctionType)):\n"
+        "            skipped.append(name)\n"
+        "            continue\n"
+        "        try:\n"
+        "            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)\n"
+        "        except Exception:\n"
+        "            skipped.append(name)\n"
+        "            continue\n"
+        "        if total + len(data) > max_bytes:\n"
+        "            skipped.append(name)\n"
+        "            continue\n"
+        "        values[name] = data\n"
+        "        total += len(data)\n"
+        "    os.makedirs(os.path.dirname(path), exist_ok=True)\n"
+        "    with open(path + '.part', 'wb') as f:\n"
+        "        pickle.dump({'modules': modules, 'values': values}, f, protocol=pickle.HIGHEST_PROTOCOL)\n"
+        "    os.replace(path + '.part', path)\n"
+        "    print(json.dumps({'saved': sorted(values), 'modules': sorted(modules), 'skipped': skipped, 'bytes': total}))\n"
+        f"_checkpoint({path!r}, {max_bytes!r}, {set(skip)!r})\n"
+        "del _checkpoint\n"
+    )
+
+def restore_code(path):
+    return (
+        "def _restore(path):\n"
+        "    import json, pickle, importlib\n"
+        "    ns = get_ipython().user_ns\n"
+        "    with open(path, 'rb') as f:\n"
+        "        state = pickle.load(f)\n"
+        "    restored, failed = [], []\n"
+        "    for name, module in state['modules'].items():\n"
+        "        try:\n"
+        "            ns[name] = importlib.import_module(module)\n"
+        "        except Exception:\n"
+        "            failed.append(name)\n"
+        "    for name, data in state['values'].items():\n"
+        "        try:\n"
+        "            ns[name] = pickle.loads(data)\n"
+        "            restored.append(name)\n"
+        "        except Exception:\n"
+        "            failed.append(name)\n"
+        "    print(json.dumps({'restored': restored, 'failed': failed}))\n"
+        f"_restore({path!r})\n"
+        "del _restore\n"
+    )
+
+class KernelSession:
+    """The sandbox's long-lived kernel. Executions run one at a time, in arrival order."""
+
+    def __init__(self, preload=SANDBOX_PRELOAD, workdir=WORKSPACE_DIR, isolation=None):
+        self.preload_modules = preload
+        self.workdir = workdir
+        self.isolation = isolation
+        self.km = None
+        self.kc = None
+        self.start_lock = asyncio.Lock()
+        self.lock = asyncio.Lock()
+        self.current = None
+        self.current_started = None
+        self.executions = 0
+        # Changes whenever kernel state may have: on every execution the kernel runs but a pure_cell, on every (re)start
+        # and, with the result cache, when workspace files change
+        self.generation = 0
+        # Result cache: (generation, source hash) -> output lines, and the workspace files last seen
+        self.results = {}
+        self.result_hits = 0
+        self.files = None
+        # Cells the last notebook replay ran (utils/notebook.py), to skip on the next one
+        self.replay = None
+        self.ready = False
+        # Checkpoint state: restore once per kernel, checkpoint only after new executions
+        self.restored = False
+        self.dirty = False
+        self.checkpoint_timer = None
+
+    @property
+    def busy(self):
+        return self.current is not None
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.workdir, ".caesarion", "kernel.pkl")
+
+    @property
+    def pid(self):
+        process = getattr(getattr(self.km, "provisioner", None), "process", None)
+        return getattr(process, "pid", None)
+
+    def memory_usage(self):
+        if self.isolation is not None:
+            return self.isolation.memory_usage(self.pid)
+        return read_rss(self.pid) or 0
+
+    @property
+    def cgroup(self):
+        if self.isolation is not None and self.isolation.cgroup is not None:
+            return self.isolation.cgroup
+        return CGROUP_DIR
+
+    def execution_metadata(self, before, started, died, peak_reset):
+        """Final NDJSON line of every execution: resource use of the cell, and whether it was OOM killed"""
+        after = read_stats(self.cgroup)
+        oom_kills = delta(after, before, "oom_kills")
+        return {
+            "output_type": "execution_metadata",
+            "wall_seconds": round(time.monotonic() - started, 3),
+            "cpu_seconds": delta(after, before, "cpu_seconds"),
+            "cpu_throttled_seconds": delta(after, before, "cpu_throttled_seconds"),
+            # Kernel process high-water mark for this cell; None if it could not be reset beforehand
+            "peak_rss_bytes": read_peak_rss(self.pid) if peak_reset and not died else None,
+            "memory_bytes": after["memory_bytes"],
+            "io_read_bytes": delta(after, before, "io_read_bytes"),
+            "io_write_bytes": delta(after, before, "io_write_bytes"),
+            "kernel_died": died,
+            "oom_killed": bool(oom_kills) if oom_kills is not None else None
+        }
+
+    def stats(self):
+        """Kernel state plus counters of its cgroup, for the sandbox's /stats endpoint"""
+        return {
+            "ready": self.ready,
+            "busy": self.busy,
+            "execution_id": self.current,
+            "busy_seconds": round(time.monotonic() - self.current_started, 3) if self.busy else None,
+            "executions": self.executions,
+            "generation": self.generation,
+            "cached_results": len(self.results),
+            "cache_hits": self.result_hits,
+            "rss_bytes": self.memory_usage() or None,
+            "cgroup": read_stats(self.cgroup)
+        }
+
+    async def start(self):
+        async with self.start_lock:
+            if self.km is not None and await self.km.is_alive():
+                return
+
+            self.ready = False
+            if self.kc is not None:
+                self.kc.stop_channels()
+            from jupyter_client.manager import AsyncKernelManager
+            self.km = AsyncKernelManager()
+            if self.isolation is not None:
+                self.isolation.prepare()
+                self.km.connection_file = self.isolation.connection_file
+                await self.km.start_kernel(**self.isolation.launch_kwargs())
+            else:
+                # Run cells in the workspace so files they write survive snapshots
+                await self.km.start_kernel(cwd=self.workdir if os.path.isdir(self.workdir) else None)
+            self.kc = self.km.client()
+            self.kc.start_channels()
+            await self.kc.wait_for_ready()
+            await self.preload()
+            self.restored = False
+            self.generation += 1
+            self.ready = True
+
+    async def preload(self):
+        if not self.preload_modules:
+            return
+
+        started = time.monotonic()
+        msg_id = self.kc.execute(preload_code(self.preload_modules), silent=True, store_history=False, allow_stdin=False)
+        async for line in stream_kernel_outputs(self.kc, msg_id):
+            log.info("Preload output", extra={"line": line.strip()})
+        log.info("Preloaded modules", extra={"modules": self.preload_modules, "seconds": round(time.monotonic() - started, 3)})
+
+    async def execute(self, code, execution_id=None, on_input=None):
+        """Run code and yield NDJSON output lines. on_input(prompt, password) enables stdin."""
+        await self.start()
+
+        async with self.lock:
+            if not self.restored:
+                await self.restore_checkpoint()
+
+            key = None
+            if KERNEL_RESULT_CACHE and on_input is None and pure_cell(code):
+                # Other cells bump the generation when they run; files can change under any of them
+                if await self.files_changed():
+                    self.generation += 1
+                key = (self.generation, hashlib.sha256(code.encode()).hexdigest())
+                cached = self.results.get(key)
+                if cached is not None:
+                    self.result_hits += 1
+                    for line in cached:
+                        yield line
+                    yield to_line({
+                        "output_type": "execution_metadata",
+                        "cached": True,
+                        "wall_seconds": 0.0,
+                        "kernel_died": False,
+                        "oom_killed": False
+                    })
+                    return
+
+            before = read_stats(self.cgroup)
+            peak_reset = reset_peak_rss(self.pid)
+            started = time.monotonic()
+            msg_id = self.kc.execute(code, allow_stdin=on_input is not None)
+            self.current = execution_id or msg_id
+            self.current_started = started
+            self.executions += 1
+            if key is None:
+                self.generation += 1
+            stdin_task = asyncio.create_task(self.relay_stdin(msg_id, on_input)) if on_input else None
+            batcher = OutputBatcher()
+            finished = False
+            lines = [] if key is not None else None
+            chars = 0
+            failed = False
+            kept = False
+
+            try:
+                async for line in stream_kernel_outputs(self.kc, msg_id, batcher, self.km.is_alive):
+                    if lines is not None:
+                        chars += len(line)
+                        failed = failed or json.loads(line).get("output_type") == "error"
+                        lines.append(line)
+                    yield line
+                finished = not batcher.truncated
+                metadata = self.execution_metadata(before, started, batcher.kernel_died, peak_reset)
+                if key is not None and finished and not failed and not batcher.kernel_died:
+                    # A pure cell left the state as it was: the generation stays, and with it every
+                    # other result cached under it. Tells notebook replay nothing changed either.
+                    kept = True
+                    metadata["pure"] = True
+                    if chars <= KERNEL_RESULT_CACHE_MAX_CHARS:
+                        self.remember(key, lines)
+                if batcher.kernel_died:
+                    # Nothing left to interrupt and its state is gone; the next execution starts a fresh kernel
+                    self.generation += 1
+                    reason = "it ran out of memory" if metadata["oom_killed"] else "its process exited"
+                    yield to_line({
+                        "output_type": "error",
+                        "ename": "KernelDied",
+                        "evalue": f"The kernel died because {reason}",
+                        "traceback": []
+                    })
+                yield to_line(metadata)
+            finally:
+                if stdin_task is not None:
+                    stdin_task.cancel()
+                # Output cap hit or consumer went away: stop the cell so the next one starts clean
+                if not finished:
+                    await self.interrupt()
+                    await self.drain(msg_id)
+                if key is not None and not kept:
+                    # A cell taken for pure failed or was cut off, so assume it changed something
+                    self.generation += 1
+                self.current = None
+                self.dirty = True
+                self.schedule_checkpoint()
+
+    async def files_changed(self):
+        """Whether workspace files changed since the last look; the checkpoint file does not count"""
+        files = await asyncio.to_thread(scan, self.workdir)
+        files = {path: entry for path, entry in files.items() if not path.startswith(".caesarion")}
+        changed = self.files is not None and files != self.files
+        self.files = files
+        return changed
+
+    def remember(self, key, lines):
+        # Entries from earlier generations can never be hit again
+        self.results = {cached: value for cached, value in self.results.items() if cached[0] == key[0]}
+        while len(self.results) >= KERNEL_RESULT_CACHE_SIZE:
+            self.results.pop(next(iter(self.results)))
+        marked = []
+        for line in lines:
+            output = json.loads(line)
+            output["cached"] = True
+            marked.append(to_line(output))
+        self.results[key] = marked
+
+    async def run_silent(self, code):
+        """Run bookkeeping code outside the user's history; returns the JSON it printed"""
+        msg_id = self.kc.execute(code, silent=True, store_history=False, allow_stdin=False)
+        result = None
+        async for line in stream_kernel_outputs(self.kc, msg_id, is_alive=self.km.is_alive):
+            output = json.loads(line)
+            if output["output_type"] == "stream" and output["name"] == "stdout":
+                try:
+                    result = json.loads(output["text"].strip().splitlines()[-1])
+                except (ValueError, IndexError):
+                    pass
+            else:
+                log.debug("Kernel bookkeeping output", extra={"line": line.strip()})
+        return result
+
+    async def restore_checkpoint(self):
+        # Lazily on first use, so the workspace restore has landed before we look for the file
+        self.restored = True
+        if not KERNEL_CHECKPOINT or not os.path.isfile(self.checkpoint_path):
+            return None
+
+        started = time.monotonic()
+        result = await self.run_silent(restore_code(self.checkpoint_path))
+        log.info("Restored kernel checkpoint", extra={"seconds": round(time.monotonic() - started, 3), "result": result})
+        return result
+
+    async def checkpoint(self):
+        """Pickle the kernel's globals into the workspace. No-op unless enabled and something ran."""
+        if not KERNEL_CHECKPOINT or self.kc is None or not self.dirty or not await self.km.is_alive():
+            return None
+
+        async with self.lock:
+            if not self.restored:
+                # Never overwrite a checkpoint that has not been loaded into this kernel yet
+                return None
+            started = time.monotonic()
+            result = await self.run_silent(
+                checkpoint_code(self.checkpoint_path, KERNEL_CHECKPOINT_MAX_BYTES, KERNEL_CHECKPOINT_SKIP)
+            )
+            self.dirty = False
+            log.info("Checkpointed kernel", extra={"seconds": round(time.monotonic() - started, 3), "result": result})
+            return result
+
+    def schedule_checkpoint(self):
+        if not KERNEL_CHECKPOINT:
+            return
+        if self.checkpoint_timer is not None:
+            self.checkpoint_timer.cancel()
+
+        async def checkpoint_when_idle():
+            await asyncio.sleep(KERNEL_CHECKPOINT_IDLE)
+            self.checkpoint_timer = None
+            await self.checkpoint()
+
+        self.checkpoint_timer = asyncio.create_task(checkpoint_when_idle())
+
+    async def relay_stdin(self, msg_id, on_input):
+        while True:
+            msg = await self.kc.get_stdin_msg()
+            if msg["msg_type"] == "input_request" and msg["parent_header"].get("msg_id") == msg_id:
+                await on_input(msg["content"]["prompt"], msg["content"].get("password", False))
+
+    def input(self, value):
+        if self.kc is not None:
+            self.kc.input(value)
+
+    async def interrupt(self):
+        if self.km is not None:
+            await self.km.interrupt_kernel()
+
+    async def drain(self, msg_id):
+        """Discard output until msg_id goes idle, restarting the kernel if it never does"""
+        deadline = time.monotonic() + KERNEL_DRAIN_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.warning("Kernel did not go idle after interrupt, restarting")
+                await self.km.restart_kernel(now=True)
+                await self.kc.wait_for_ready()
+                await self.preload()
+                self.restored = False
+                self.generation += 1
+                return
+            try:
+                reply = await self.kc.get_iopub_msg(timeout=remaining)
+            except queue.Empty:
+                continue
+            if (reply["parent_header"].get("msg_id") == msg_id
+                    and reply["msg_type"] == "status"
+                    and reply["content"]["execution_state"] == "idle"):
+                return
+
+    async def shutdown(self):
+        if self.checkpoint_timer is not None:
+            self.checkpoint_timer.cancel()
+        if self.kc is not None:
+            self.kc.stop_channels()
+        if self.km is not None:
+            await self.km.shutdown_kernel()
+        self.km = None
+        self.kc = None
+        self.ready = False
+
+class KernelPool:
+    """Tenant kernels of a shared pod, each in <workspace>/<kernel id> under its own uid and limits"""
+
+    def __init__(self, root=WORKSPACE_DIR, max_kernels=SANDBOX_MAX_KERNELS):
+        self.root = root
+        self.max_kernels = max_kernels
+        self.kernels = {}
+        self.slots = {}
+        self.lock = asyncio.Lock()
+
+    def get(self, kernel_id):
+        return self.kernels.get(kernel_id)
+
+    async def create(self, kernel_id):
+        reason = isolation_unavailable()
+        if reason is not None:
+            raise IsolationUnavailable(reason)
+
+        async with self.lock:
+            kernel = self.kernels.get(kernel_id)
+            if kernel is None:
+                if len(self.kernels) >= self.max_kernels:
+                    raise RuntimeError(f"Pod is full ({self.max_kernels} kernels)")
+                slot = min(set(range(self.max_kernels)) - set(self.slots.values()))
+                workdir = os.path.join(self.root, kernel_id)
+                kernel = KernelSession(workdir=workdir, isolation=KernelIsolation(kernel_id, slot, workdir))
+                self.kernels[kernel_id] = kernel
+                self.slots[kernel_id] = slot
+
+        try:
+            await kernel.start()
+        except Exception:
+            await self.remove(kernel_id)
+            raise
+        return kernel
+
+    async def remove(self, kernel_id):
+        async with self.lock:
+            kernel = self.kernels.pop(kernel_id, None)
+            self.slots.pop(kernel_id, None)
+        if kernel is None:
+            return False
+
+        await kernel.shutdown()
+        kernel.isolation.cleanup()
+        return True
+
+    def usage(self):
+        return {
+            kernel_id: {
+                "busy": kernel.busy,
+                "ready": kernel.ready,
+                "memory_bytes": kernel.memory_usage(),
+                "limits": kernel.isolation.limits
+            }
+            for kernel_id, kernel in self.kernels.items()
+        }
+
+    async def shutdown(self):
+        for kernel_id in list(self.kernels):
+            await self.remove(kernel_id)
+
+kernel_session = KernelSession()
+kernel_pool = KernelPool()
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+from .tracing import trace_id
+
+# One JSON object per line on stdout. Records are formatted and written by a listener thread,
+# so a log call on a hot path costs a level check and a queue put.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Default keep rate for high-volume events logged with sample=True; warnings and errors are never sampled
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+# Request-scoped fields (session_id, sandbox_id, ...) added to every record logged under bind()
+log_context = contextvars.ContextVar("log_context", default={})
+
+RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context", "trace_id", "sample"}
+
+@contextmanager
+def bind(**fields):
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        try:
+            log_context.reset(token)
+        except ValueError:
+            pass
+
+def annotate(**fields):
+    """Add fields for the rest of the current task, e.g. a request and the response it streams"""
+    log_context.set({**log_context.get(), **fields})
+
+class ContextFilter(logging.Filter):
+    """Runs in the calling thread: captures the context before the record crosses the queue, and samples"""
+
+    def filter(self, record):
+        sample = getattr(record, "sample", None)
+        if sample and record.levelno < logging.WARNING:
+            rate = LOG_SAMPLE_RATE if sample is True else sample
+            if random.random() >= rate:
+                return False
+            record.sample_rate = rate
+        record.context = log_context.get()
+        record.trace_id = trace_id()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **getattr(record, "context", {})
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        for key, value in vars(record).items():
+            if key not in RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup():
+    root = logging.getLogger("caesarion")
+    if root.handlers:
+        return root
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    # QueueHandler.prepare would format in the caller's thread; the listener formats instead
+    handler.prepare = lambda record: record
+    handler.addFilter(ContextFilter())
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    return root
+
+def get_logger(name):
+    setup()
+    return logging.getLogger(f"caesarion.{name}")
@@ -0,0 +1,70 @@
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from fastapi import Response
+
+# API-side Prometheus metrics, served at GET /metrics. Durations are in seconds, sizes in bytes.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STARTUP_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+SIZE_BUCKETS = (256, 4096, 65536, 1024 ** 2, 16 * 1024 ** 2, 128 * 1024 ** 2, 1024 ** 3)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+THROUGHPUT_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+
+POD_READY_SECONDS = Histogram(
+    "caesarion_pod_ready_seconds",
+    "Time from sandbox pod creation to its Ready condition",
+    ["profile"], buckets=STARTUP_BUCKETS
+)
+SESSION_ASSIGNMENTS = Counter(
+    "caesarion_session_assignments_total",
+    "Sandboxes handed to sessions: warm on an already running pod, cold on a new one",
+    ["start"]
+)
+KERNEL_CLAIM_SECONDS = Histogram(
+    "caesarion_kernel_claim_seconds",
+    "Time to place and start a tenant kernel on a shared pod",
+    ["start"], buckets=STARTUP_BUCKETS
+)
+
+EXECUTE_SECONDS = Histogram(
+    "caesarion_execute_seconds",
+    "Wall time of sandbox executions, as streamed through the API",
+    ["outcome"], buckets=LATENCY_BUCKETS
+)
+EXECUTE_OUTPUT_BYTES = Histogram(
+    "caesarion_execute_output_bytes",
+    "Bytes of NDJSON output streamed back per execution",
+    buckets=SIZE_BUCKETS
+)
+EXECUTIONS_IN_FLIGHT = Gauge("caesarion_executions_in_flight", "Executions currently streaming")
+
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "caesarion_llm_time_to_first_token_seconds",
+    "Time from sending a completion request to its first content or tool call delta",
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "caesarion_llm_tokens_per_second",
+    "Completion tokens per second after the first token",
+    buckets=RATE_BUCKETS
+)
+LLM_TOKENS = Counter("caesarion_llm_tokens_total", "Tokens reported by the model", ["kind"])
+
+TOOL_SECONDS = Histogram(
+    "caesarion_tool_call_seconds",
+    "Tool call durations",
+    ["tool", "outcome"], buckets=LATENCY_BUCKETS
+)
+TOOL_TIMEOUTS = Counter("caesarion_tool_timeouts_total", "Tool calls cut off by their timeout", ["tool"])
+
+UPLOAD_BYTES = Histogram("caesarion_upload_bytes", "Size of files uploaded to sandboxes", buckets=SIZE_BUCKETS)
+UPLOAD_BYTES_PER_SECOND = Histogram(
+    "caesarion_upload_bytes_per_second",
+    "Upload throughput from the API to the sandbox server",
+    buckets=THROUGHPUT_BUCKETS
+)
+
+# Set from the modules that own the state (routers/sandbox.py, index.py) through set_function
+SANDBOXES = Gauge("caesarion_sandboxes", "Sandboxes with a reaper deadline (pods and tenant kernels)")
+SESSIONS = Gauge("caesarion_sessions", "Chat sessions with a sandbox assigned")
+
+def metrics_response():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import hashlib
+
+from .outputs import to_line
+
+# Outputs of a replayed notebook kept per kernel, so cells skipped on the next replay can show them
+REPLAY_MAX_OUTPUT_CHARS = int(os.environ.get("NOTEBOOK_REPLAY_MAX_OUTPUT_CHARS", str(4 * 1024 * 1024)))
+
+def notebook_cells(notebook):
+    """Sources of the non-empty code cells of a parsed .ipynb (nbformat 4), in order"""
+    if not isinstance(notebook, dict) or not isinstance(notebook.get("cells"), list):
+        raise ValueError("Not a notebook: no cell list")
+    cells = []
+    for cell in notebook["cells"]:
+        if not isinstance(cell, dict) or cell.get("cell_type") != "code":
+            continue
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        if not isinstance(source, str):
+            raise ValueError("Cell source is not text")
+        if source.strip():
+            cells.append(source)
+    return cells
+
+def cell_hashes(cells):
+    """Each hash covers a cell's source and every cell before it, so an edit changes all hashes after it"""
+    hashes = []
+    upstream = ""
+    for code in cells:
+        upstream = hashlib.sha256(f"{upstream}\0{code}".encode()).hexdigest()
+        hashes.append(upstream)
+    return hashes
+
+class ReplayRecord:
+    """The cells a replay ran on a kernel, valid while nothing else has run there since"""
+
+    def __init__(self):
+        self.generation = None
+        self.hashes = []
+        self.outputs = []
+        self.chars = 0
+
+    def add(self, cell_hash, outputs):
+        self.hashes.append(cell_hash)
+        chars = sum(len(line) for line in outputs)
+        if self.chars + chars > REPLAY_MAX_OUTPUT_CHARS:
+            outputs = [to_line({"output_type": "stream", "name": "stderr", "text": "(output not kept for replay)\n"})]
+            chars = len(outputs[0])
+        self.outputs.append(outputs)
+        self.chars += chars
+
+async def run_cells(kernel, cells, stop_on_error=True, replay=False):
+    """Run cells in order as one NDJSON stream. Every output line carries its cell index; each cell
+    is framed by cell_start and cell_end (status, seconds) lines and a batch_summary line ends it.
+
+    With replay, the leading cells that the kernel's last replay already ran - same sources, nothing
+    run on the kernel since - are not run again; their recorded outputs are sent, marked cached.
+    Cells from the first change on run on top of the current state, as re-running them in Jupyter would.
+    """
+    started = time.monotonic()
+    failed = []
+    cached = 0
+    hashes = cell_hashes(cells) if replay else None
+    previous = kernel.replay if replay else None
+    matching = previous is not None and previous.generation == kernel.generation
+    record = ReplayRecord() if replay else None
+    recording = replay
+    expected = kernel.generation
+
+    for index, code in enumerate(cells):
+        if failed and stop_on_error:
+            yield to_line({"output_type": "cell_end", "cell": index, "status": "skipped", "seconds": 0.0})
+            continue
+
+        matching = (
+            matching and index < len(previous.hashes) and previous.hashes[index] == hashes[index]
+            and kernel.generation == expected
+        )
+        if matching:
+            cached += 1
+            yield to_line({"output_type": "cell_start", "cell": index, "cached": True})
+            for line in previous.outputs[index]:
+                yield line
+            record.add(hashes[index], previous.outputs[index])
+            yield to_line({"output_type": "cell_end", "cell": index, "status": "cached", "seconds": 0.0})
+            continue
+
+        yield to_line({"output_type": "cell_start", "cell": index})
+        cell_started = time.monotonic()
+        status = "ok"
+        outputs = []
+        unchanged = False
+        async for line in kernel.execute(code):
+            output = json.loads(line)
+            if output.get("output_type") == "error":
+                status = "error"
+            elif output.get("output_type") == "execution_metadata":
+                # Answered by the kernel's result cache, or a pure cell it ran: the kernel state did not change
+                unchanged = bool(output.get("cached") or output.get("pure"))
+            output["cell"] = index
+            line = to_line(output)
+            if recording and output.get("output_type") != "execution_metadata":
+                outputs.append(to_line({**output, "cached": True}))
+            yield line
+        if not unchanged:
+            expected += 1
+
+        if status == "error":
+            failed.append(index)
+        # The record has to describe every execution on the kernel, in order
+        recording = recording and status == "ok" and kernel.generation == expected
+        if recording:
+            record.add(hashes[index], outputs)
+        yield to_line({
+            "output_type": "cell_end",
+            "cell": index,
+            "status": status,
+            "seconds": round(time.monotonic() - cell_started, 3)
+        })
+
+    if replay:
+        if kernel.generation == expected and record.hashes:
+            record.generation = expected
+            kernel.replay = record
+        else:
+            kernel.replay = None
+
+    yield to_line({
+        "output_type": "batch_summary",
+        "cells": len(cells),
+        "cached": cached,
+        "failed": failed,
+        "stopped": bool(failed) and stop_on_error,
+        "seconds": round(time.monotonic() - started, 3)
+    })
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import queue
+
+from .artifacts import offload_artifacts
+
+# Adjacent stdout/stderr text is merged until one of these limits is reached
+OUTPUT_FLUSH_INTERVAL = float(os.environ.get("OUTPUT_FLUSH_INTERVAL", "0.05"))
+OUTPUT_FLUSH_SIZE = int(os.environ.get("OUTPUT_FLUSH_SIZE", "65536"))
+# Hard cap on characters sent back for a single execution
+OUTPUT_MAX_CHARS = int(os.environ.get("OUTPUT_MAX_CHARS", str(10 * 1024 * 1024)))
+# How often a quiet execution checks that the kernel process is still there
+KERNEL_LIVENESS_INTERVAL = float(os.environ.get("KERNEL_LIVENESS_INTERVAL", "2"))
+
+def to_line(output):
+    return json.dumps(output) + "\n"
+
+class OutputBatcher:
+    """Turns kernel outputs into NDJSON lines, merging stream text and enforcing the output cap"""
+
+    def __init__(self, flush_interval=OUTPUT_FLUSH_INTERVAL, flush_size=OUTPUT_FLUSH_SIZE, max_chars=OUTPUT_MAX_CHARS):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_chars = max_chars
+        self.name = None
+        self.parts = []
+        self.size = 0
+        self.since = 0.0
+        self.total = 0
+        self.truncated = False
+        self.kernel_died = False
+
+    def add(self, output):
+        if self.truncated:
+            return []
+
+        if output["output_type"] != "stream":
+            lines = self.flush()
+            line = to_line(output)
+            if self.total + len(line) > self.max_chars:
+                return lines + self.truncate()
+            self.total += len(line)
+            lines.append(line)
+            return lines
+
+        lines = []
+        if self.parts and output["name"] != self.name:
+            lines += self.flush()
+
+        text = output["text"]
+        remaining = self.max_chars - self.total
+        overflow = len(text) > remaining
+        if overflow:
+            text = text[:max(remaining, 0)]
+
+        if text:
+            if not self.parts:
+                self.name = output["name"]
+                self.since = time.monotonic()
+            self.parts.append(text)
+            self.size += len(text)
+            self.total += len(text)
+
+        if overflow:
+            return lines + self.truncate()
+        if self.size >= self.flush_size:
+            lines += self.flush()
+        return lines
+
+    def timeout(self):
+        """Seconds until pending text must be flushed, or None if nothing is pending"""
+        if not self.parts:
+            return None
+        return max(0.0, self.since + self.flush_interval - time.monotonic())
+
+    def flush(self):
+        if not self.parts:
+            return []
+
+        output = {"output_type": "stream", "name": self.name, "text": "".join(self.parts)}
+        self.parts.clear()
+        self.size = 0
+        return [to_line(output)]
+
+    def truncate(self):
+        self.truncated = True
+        marker = {
+            "output_type": "stream",
+            "name": "stderr",
+            "text": f"\n[Output truncated: exceeded {self.max_chars} characters]\n"
+        }
+        return self.flush() + [to_line(marker)]
+
+def to_output(reply):
+    msg_type = reply["msg_type"]
+    content = reply["content"]
+
+    if msg_type == "stream":
+        return {
+            "output_type": "stream",
+            "name": content["name"],  # stdout or stderr
+            "text": content["text"]
+        }
+    if msg_type == "display_data":
+        return {
+            "output_type": "display_data",
+            "data": content["data"],
+            "metadata": content.get("metadata", {})
+        }
+    if msg_type == "execute_result":
+        return {
+            "output_type": "execute_result",
+            "execution_count": content["execution_count"],
+            "data": content["data"],
+            "metadata": content.get("metadata", {})
+        }
+    if msg_type == "error":
+        return {
+            "output_type": "error",
+            "ename": content["ename"],
+            "evalue": content["evalue"],
+            "traceback": content["traceback"]
+        }
+    return None
+
+async def stream_kernel_outputs(kc, msg_id, batcher=None, is_alive=None):
+    """Yield batched NDJSON lines for one execution until the kernel goes idle.
+
+    Stops reading once the output cap is hit, or once is_alive() reports the kernel
+    gone (batcher.kernel_died); the caller owns the kernel and decides what to do.
+    """
+    batcher = batcher or OutputBatcher()
+
+    while True:
+        timeout = batcher.timeout()
+        if is_alive is not None:
+            timeout = KERNEL_LIVENESS_INTERVAL if timeout is None else min(timeout, KERNEL_LIVENESS_INTERVAL)
+        try:
+            reply = await kc.get_iopub_msg(timeout=timeout)
+        except queue.Empty:
+            for line in batcher.flush():
+                yield line
+            if is_alive is not None and not await is_alive():
+                batcher.kernel_died = True
+                return
+            continue
+
+        if reply.get("parent_header", {}).get("msg_id") != msg_id:
+            continue
+
+        msg_type = reply["msg_type"]
+        output = to_output(reply)
+        if output is not None:
+            if "data" in output:
+                output = await offload_artifacts(output)
+            for line in batcher.add(output):
+                yield line
+            if batcher.truncated:
+                return
+
+        if msg_type == "error" or (msg_type == "status" and reply["content"]["execution_state"] == "idle"):
+            break
+
+    for line in batcher.flush():
+        yield line
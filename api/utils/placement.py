@@ -0,0 +1,36 @@
+import os
+
+# Shared pods (SANDBOX_SHARED=1): sessions get a kernel inside a multi-tenant pod instead of a pod.
+# A tenant sandbox id is "<pod name>.<kernel id>"; plain pod names are dedicated sandboxes.
+SHARED_MAX_KERNELS = int(os.environ.get("SANDBOX_MAX_KERNELS", "8"))
+SHARED_POD_MEMORY = int(os.environ.get("SHARED_POD_MEMORY", str(8 * 1024 * 1024 * 1024)))
+# Floor charged per kernel when packing, so idle kernels still reserve room to grow
+KERNEL_MEMORY_RESERVE = int(os.environ.get("KERNEL_MEMORY_RESERVE", str(512 * 1024 * 1024)))
+
+def split_sandbox_id(sandbox_id):
+    """Return (pod name, kernel id or None)"""
+    pod_name, _, kernel_id = sandbox_id.partition(".")
+    return pod_name, kernel_id or None
+
+def tenant_id(pod_name, kernel_id):
+    return f"{pod_name}.{kernel_id}"
+
+def pod_load(kernels, pending=0):
+    """Memory charged to a pod: each kernel at max(its usage, the reserve), plus kernels being started"""
+    return sum(max(usage, KERNEL_MEMORY_RESERVE) for usage in kernels) + pending * KERNEL_MEMORY_RESERVE
+
+def pick_pod(pods, pending=None, capacity=SHARED_POD_MEMORY, max_kernels=SHARED_MAX_KERNELS):
+    """Best fit: the most loaded pod that still has room for one more kernel, or None.
+
+    pods maps pod name -> list of per-kernel memory usage in bytes.
+    """
+    pending = pending or {}
+    best, best_load = None, -1
+    for name, kernels in pods.items():
+        count = len(kernels) + pending.get(name, 0)
+        load = pod_load(kernels, pending.get(name, 0))
+        if count >= max_kernels or load + KERNEL_MEMORY_RESERVE > capacity:
+            continue
+        if load > best_load:
+            best, best_load = name, load
+    return best
@@ -0,0 +1,68 @@
+import os
+
+# Named pod sizes for dedicated sandboxes, smallest first. A session starts on SANDBOX_PROFILE,
+# or larger when its uploads call for it, and is moved up a size after an OOM kill or heavy throttling.
+PROFILES = {
+    "small": {
+        "requests": {"memory": "1Gi", "cpu": "50m"},
+        "limits": {"memory": "2Gi", "cpu": "250m"}
+    },
+    "medium": {
+        "requests": {"memory": "2Gi", "cpu": "100m"},
+        "limits": {"memory": "5Gi", "cpu": "500m"}
+    },
+    "large": {
+        "requests": {"memory": "6Gi", "cpu": "1"},
+        "limits": {"memory": "14Gi", "cpu": "4"}
+    }
+}
+PROFILE_ORDER = list(PROFILES)
+DEFAULT_PROFILE = os.environ.get("SANDBOX_PROFILE", "medium")
+
+# Uploads are assumed to take this many times their file size in memory once loaded (e.g. a CSV in pandas)
+UPLOAD_MEMORY_FACTOR = float(os.environ.get("UPLOAD_MEMORY_FACTOR", "5"))
+# Fraction of an execution's wall time spent throttled that triggers a move to a larger profile
+CPU_THROTTLE_RESIZE = float(os.environ.get("CPU_THROTTLE_RESIZE", "0.5"))
+CPU_THROTTLE_MIN_SECONDS = float(os.environ.get("CPU_THROTTLE_MIN_SECONDS", "30"))
+
+UNITS = {"Ki": 1024, "Mi": 1024 ** 2, "Gi": 1024 ** 3, "Ti": 1024 ** 4}
+
+def to_bytes(quantity):
+    for suffix, factor in UNITS.items():
+        if quantity.endswith(suffix):
+            return int(float(quantity[:-len(suffix)]) * factor)
+    return int(quantity)
+
+def to_cores(quantity):
+    return int(quantity[:-1]) / 1000 if quantity.endswith("m") else float(quantity)
+
+def rank(profile):
+    return PROFILE_ORDER.index(profile) if profile in PROFILES else PROFILE_ORDER.index(DEFAULT_PROFILE)
+
+def next_profile(profile):
+    index = rank(profile) + 1
+    return PROFILE_ORDER[index] if index < len(PROFILE_ORDER) else None
+
+def profile_for_upload(size):
+    """Smallest profile whose memory limit fits the upload once loaded"""
+    needed = size * UPLOAD_MEMORY_FACTOR
+    for profile in PROFILE_ORDER:
+        if to_bytes(PROFILES[profile]["limits"]["memory"]) >= needed:
+            return profile
+    return PROFILE_ORDER[-1]
+
+def resize_reason(metadata, preserves_state=False):
+    """Why an execution calls for a larger profile, or None.
+
+    Throttling alone only justifies a move when kernel state survives it (KERNEL_CHECKPOINT=1);
+    after an OOM kill the kernel state is gone anyway.
+    """
+    if metadata.get("oom_killed"):
+        return "out of memory"
+    if not preserves_state:
+        return None
+    wall = metadata.get("wall_seconds") or 0
+    throttled = metadata.get("cpu_throttled_seconds") or 0
+    if wall >= CPU_THROTTLE_MIN_SECONDS and throttled / wall >= CPU_THROTTLE_RESIZE:
+        return "CPU throttled"
+    return None
@@ -0,0 +1,89 @@
+import time
+import heapq
+import asyncio
+from contextlib import contextmanager
+
+class IdleReaper:
+    """Expires sandboxes at their own deadline instead of polling on a fixed interval.
+
+    Deadlines sit in a heap; touching a sandbox pushes a new entry and the stale one is
+    skipped when it reaches the top. Sandboxes with an execution in flight never expire.
+    """
+
+    def __init__(self, idle_timeout, max_lease, on_expire):
+        self.idle_timeout = idle_timeout
+        self.max_lease = max_lease
+        self.on_expire = on_expire
+        self.heap = []
+        self.deadlines = {}
+        self.busy = {}
+        self.tasks = set()
+        self.wakeup = asyncio.Event()
+
+    def touch(self, sandbox_id, lease=None):
+        """Record activity. A lease keeps the sandbox alive for longer than the idle timeout."""
+        seconds = min(max(lease or 0.0, self.idle_timeout), max(self.max_lease, self.idle_timeout))
+        deadline = max(time.time() + seconds, self.deadlines.get(sandbox_id, 0.0))
+        if deadline == self.deadlines.get(sandbox_id):
+            return deadline
+
+        self.deadlines[sandbox_id] = deadline
+        heapq.heappush(self.heap, (deadline, sandbox_id))
+        if self.heap[0][1] == sandbox_id:
+            self.wakeup.set()
+        return deadline
+
+    def expires_at(self, sandbox_id):
+        return self.deadlines.get(sandbox_id)
+
+    def forget(self, sandbox_id):
+        self.deadlines.pop(sandbox_id, None)
+        self.busy.pop(sandbox_id, None)
+
+    @contextmanager
+    def hold(self, sandbox_id):
+        """Keep a sandbox alive while work runs in it, then restart its idle clock"""
+        self.busy[sandbox_id] = self.busy.get(sandbox_id, 0) + 1
+        try:
+            yield
+        finally:
+            count = self.busy.get(sandbox_id)
+            # A missing count means the sandbox was deleted meanwhile; do not revive it
+            if count is not None:
+                if count > 1:
+                    self.busy[sandbox_id] = count - 1
+                else:
+                    del self.busy[sandbox_id]
+                self.touch(sandbox_id)
+
+    def pop_expired(self, now):
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, sandbox_id = heapq.heappop(self.heap)
+            if self.deadlines.get(sandbox_id) != deadline:
+                continue
+            if self.busy.get(sandbox_id):
+                del self.deadlines[sandbox_id]
+                self.touch(sandbox_id)
+                continue
+            del self.deadlines[sandbox_id]
+            expired.append(sandbox_id)
+        return expired
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+
+            expired = self.pop_expired(now)
+            if expired:
+                # Reaping can take a while (snapshots); keep timing the others meanwhile
+                task = asyncio.create_task(self.on_expire(expired))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
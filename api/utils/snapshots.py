@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import time
+import shutil
+import tarfile
+
+from .workspace import SNAPSHOT_META, add_meta, read_meta
+
+# API side: per-session chain of incremental workspace layers
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "/tmp/snapshots")
+SNAPSHOT_MAX_LAYERS = int(os.environ.get("SNAPSHOT_MAX_LAYERS", "8"))
+# Sessions untouched this long are dropped, then the oldest ones until the store fits its size cap
+SNAPSHOT_TTL = float(os.environ.get("SNAPSHOT_TTL", str(7 * 24 * 3600)))
+SNAPSHOT_STORE_MAX_BYTES = int(os.environ.get("SNAPSHOT_STORE_MAX_BYTES", str(20 * 1024 * 1024 * 1024)))
+
+SESSION_ID = re.compile(r"[A-Za-z0-9._-]{1,128}")
+
+class SnapshotStore:
+    """Layers live in <root>/<session>/NNNN.tar.gz next to manifest.json, the merged file list"""
+
+    def __init__(self, root, max_layers, ttl=SNAPSHOT_TTL, max_bytes=SNAPSHOT_STORE_MAX_BYTES):
+        self.root = root
+        self.max_layers = max_layers
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def session_dir(self, session_id):
+        if not SESSION_ID.fullmatch(session_id) or session_id in (".", ".."):
+            raise ValueError(f"Invalid session id: {session_id}")
+        return os.path.join(self.root, session_id)
+
+    def layers(self, session_id):
+        directory = self.session_dir(session_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".tar.gz")
+        )
+
+    def has_snapshot(self, session_id):
+        try:
+            return bool(self.layers(session_id))
+        except ValueError:
+            return False
+
+    def manifest(self, session_id):
+        try:
+            with open(os.path.join(self.session_dir(session_id), "manifest.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, session_id, manifest):
+        path = os.path.join(self.session_dir(session_id), "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def new_layer_path(self, session_id):
+        directory = self.session_dir(session_id)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, "incoming.part")
+
+    def add_layer(self, session_id, source):
+        """Append a layer written by the sandbox and update the merged manifest"""
+        with tarfile.open(source, "r:gz") as tar:
+            meta = read_meta(tar)
+
+        layers = self.layers(session_id)
+        index = int(os.path.basename(layers[-1]).split(".")[0]) + 1 if layers else 0
+        os.replace(source, os.path.join(self.session_dir(session_id), f"{index:04d}.tar.gz"))
+        self.write_manifest(session_id, meta["manifest"])
+
+        if len(layers) + 1 > self.max_layers:
+            self.compact(session_id)
+
+    def compact(self, session_id):
+        """Fold all layers into one holding only the newest copy of each live file"""
+        layers = self.layers(session_id)
+        manifest = self.manifest(session_id)
+        merged = os.path.join(self.session_dir(session_id), "merged.part")
+        seen = set()
+
+        with tarfile.open(merged, "w:gz") as out:
+            add_meta(out, manifest, [])
+            for layer in reversed(layers):
+                with tarfile.open(layer, "r:gz") as tar:
+                    for member in tar:
+                        if member.name == SNAPSHOT_META or member.name in seen or member.name not in manifest:
+                            continue
+                        seen.add(member.name)
+                        out.addfile(member, tar.extractfile(member))
+
+        for layer in layers:
+            os.remove(layer)
+        os.replace(merged, os.path.join(self.session_dir(session_id), "0000.tar.gz"))
+
+    def delete(self, session_id):
+        shutil.rmtree(self.session_dir(session_id), ignore_errors=True)
+
+    def sweep(self, keep=()):
+        """Delete sessions past the TTL, then the least recently written until under max_bytes.
+
+        Sessions in keep (those with a live sandbox) are never deleted. Returns the deleted session ids.
+        """
+        if not os.path.isdir(self.root):
+            return []
+
+        sessions = []
+        for session_id in os.listdir(self.root):
+            directory = os.path.join(self.root, session_id)
+            if session_id in keep or not SESSION_ID.fullmatch(session_id) or not os.path.isdir(directory):
+                continue
+            size = written = 0
+            for name in os.listdir(directory):
+                stat = os.stat(os.path.join(directory, name))
+                size += stat.st_size
+                written = max(written, stat.st_mtime)
+            sessions.append((written, session_id, size))
+
+        sessions.sort()
+        total = sum(size for _, _, size in sessions)
+        cutoff = time.time() - self.ttl
+        deleted = []
+        for written, session_id, size in sessions:
+            if written >= cutoff and total <= self.max_bytes:
+                break
+            self.delete(session_id)
+            total -= size
+            deleted.append(session_id)
+        return deleted
+
+snapshot_store = SnapshotStore(SNAPSHOT_DIR, SNAPSHOT_MAX_LAYERS)
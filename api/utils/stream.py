@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import asyncio
+
+try:
+    import orjson
+
+    def dumps(value):
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    def dumps(value):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+# Token deltas after the first are held back until either limit is hit, then sent as one `0:` frame
+STREAM_FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "0.03"))
+STREAM_FLUSH_SIZE = int(os.environ.get("STREAM_FLUSH_SIZE", "256"))
+
+def parse_args(arguments):
+    """Tool arguments arrive as a JSON string from the model; embed them as JSON, never raw"""
+    if not isinstance(arguments, str):
+        return arguments
+    try:
+        return json.loads(arguments) if arguments else {}
+    except json.JSONDecodeError:
+        return arguments
+
+class DataStreamEncoder:
+    """Encoder for the Vercel AI data-stream protocol (x-vercel-ai-data-stream: v1).
+
+    Every method returns the wire text to yield, possibly empty. Pending text
+    is always flushed ahead of any other frame so ordering is preserved. The first
+    delta goes out at once; the caller flushes held text when deadline() runs out.
+    """
+
+    def __init__(self, flush_interval=STREAM_FLUSH_INTERVAL, flush_size=STREAM_FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = []
+        self.pending_size = 0
+        self.pending_since = 0.0
+        self.started = False
+
+    def text(self, delta):
+        if not delta:
+            return ""
+
+        if not self.started:
+            # Nothing to coalesce with yet, and time to first token is what the user waits on
+            self.started = True
+            return f"0:{dumps(delta)}\n"
+
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append(delta)
+        self.pending_size += len(delta)
+
+        if self.pending_size >= self.flush_size or time.monotonic() - self.pending_since >= self.flush_interval:
+            return self.flush()
+        return ""
+
+    def deadline(self):
+        """Seconds until held text is due, or None if nothing is held"""
+        if not self.pending:
+            return None
+        return max(0.0, self.pending_since + self.flush_interval - time.monotonic())
+
+    def flush(self):
+        if not self.pending:
+            return ""
+
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.pending_size = 0
+        return f"0:{dumps(text)}\n"
+
+    def tool_call(self, tool_call_id, tool_name, args):
+        frame = dumps({"toolCallId": tool_call_id, "toolName": tool_name, "args": parse_args(args)})
+        return f"{self.flush()}9:{frame}\n"
+
+    def tool_result(self, tool_call_id, tool_name, args, result):
+        frame = dumps({
+            "toolCallId": tool_call_id,
+            "toolName": tool_name,
+            "args": parse_args(args),
+            "result": result
+        })
+        return f"{self.flush()}a:{frame}\n"
+
+    def data(self, payload):
+        """Custom data part (2:), surfaced to the client as useChat's `data`"""
+        return f"{self.flush()}2:{dumps([payload])}\n"
+
+    def finish(self, reason, prompt_tokens=0, completion_tokens=0):
+        frame = dumps({
+            "finishReason": reason,
+            "usage": {"promptTokens": prompt_tokens, "completionTokens": completion_tokens},
+            "isContinued": False
+        })
+        return f"{self.flush()}e:{frame}\n"
+
+    def error(self, message):
+        frame = dumps({"finishReason": "error", "error": str(message), "isContinued": False})
+        return f"{self.flush()}e:{frame}\n"
+
+STREAM_END = object()
+
+class ThreadedStream:
+    """A blocking iterator (the sync OpenAI stream) read on a worker thread, so the event loop
+    can do other work - such as sending held text - while it waits for the next chunk"""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.queue = asyncio.Queue()
+        self.stopped = False
+        self.loop = asyncio.get_running_loop()
+        self.loop.run_in_executor(None, self.pump)
+
+    def pump(self):
+        result = (STREAM_END, None)
+        try:
+            for item in self.iterable:
+                if self.stopped:
+                    break
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, (item, None))
+        except Exception as e:
+            result = (STREAM_END, e)
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, result)
+        except RuntimeError:
+            # The loop closed while the stream was still being read
+            pass
+
+    async def next(self, timeout=None):
+        """The next item, or STREAM_END; raises asyncio.TimeoutError if none arrives within timeout"""
+        item, error = await asyncio.wait_for(self.queue.get(), timeout)
+        if error is not None:
+            raise error
+        return item
+
+    def close(self):
+        self.stopped = True
@@ -1,30 +1,119 @@
-import requests
 import json 
 import httpx
 import json
 import asyncio
 import os
+import time
 
+from .tracing import inject_traceparent
+from .log import get_logger, annotate
+from .placement import split_sandbox_id
 
-def get_current_weather(latitude, longitude):
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
+log = get_logger("tools")
 
-    try:
-        response = requests.get(url)
+# Weather lookups are bucketed to ~1km so nearby requests share a cache entry
+WEATHER_URL = os.environ.get("WEATHER_URL", "https://api.open-meteo.com/v1/forecast")
+WEATHER_TIMEOUT = float(os.environ.get("WEATHER_TIMEOUT", "5"))
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", "1024"))
+WEATHER_PRECISION = 2
+
+weather_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(WEATHER_TIMEOUT),
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+)
+weather_cache = {}
+weather_inflight = {}
+
+def weather_cache_key(latitude, longitude):
+    return (round(float(latitude), WEATHER_PRECISION), round(float(longitude), WEATHER_PRECISION))
 
-        response.raise_for_status()
+def stub_weather(latitude, longitude):
+    """Local stand-in with the same shape as the Open-Meteo response (WEATHER_STUB=1)"""
+    day = time.strftime("%Y-%m-%d", time.gmtime())
+    hours = [f"{day}T{hour:02d}:00" for hour in range(24)]
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "generationtime_ms": 0.0,
+        "utc_offset_seconds": 0,
+        "timezone": "GMT",
+        "timezone_abbreviation": "GMT",
+        "elevation": 0,
+        "current_units": {"time": "iso8601", "interval": "seconds", "temperature_2m": "°C"},
+        "current": {"time": time.strftime("%Y-%m-%dT%H:00", time.gmtime()), "interval": 900, "temperature_2m": 20.0},
+        "hourly_units": {"time": "iso8601", "temperature_2m": "°C"},
+        "hourly": {"time": hours, "temperature_2m": [20.0] * len(hours)},
+        "daily_units": {"time": "iso8601", "sunrise": "iso8601", "sunset": "iso8601"},
+        "daily": {"time": [day], "sunrise": [f"{day}T06:00"], "sunset": [f"{day}T18:00"]}
+    }
 
-        return response.json()
+async def fetch_weather(latitude, longitude):
+    if os.environ.get("WEATHER_STUB") == "1":
+        return stub_weather(latitude, longitude)
 
-    except requests.RequestException as e:
+    # Two forecast days is enough for the 24h hourly strip and today's sunrise/sunset
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "current": "temperature_2m",
+        "hourly": "temperature_2m",
+        "daily": "sunrise,sunset",
+        "forecast_days": 2,
+        "timezone": "auto"
+    }
+    response = await weather_client.get(WEATHER_URL, params=params)
+    response.raise_for_status()
+    return response.json()
 
-        print(f"Error fetching weather data: {e}")
+async def load_weather(key):
+    try:
+        data = await fetch_weather(*key)
+    except httpx.HTTPError as e:
+        log.warning("Weather lookup failed", extra={"error": str(e)})
         return None
 
+    if len(weather_cache) >= WEATHER_CACHE_SIZE:
+        weather_cache.pop(next(iter(weather_cache)))
+    weather_cache[key] = (time.monotonic() + WEATHER_CACHE_TTL, data)
+    return data
+
+async def get_current_weather(latitude, longitude):
+    key = weather_cache_key(latitude, longitude)
+
+    cached = weather_cache.get(key)
+    if cached is not None:
+        if cached[0] > time.monotonic():
+            return cached[1]
+        weather_cache.pop(key, None)
+
+    # Coalesce concurrent lookups for the same bucket onto one upstream request
+    task = weather_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(load_weather(key))
+        weather_inflight[key] = task
+        task.add_done_callback(lambda _: weather_inflight.pop(key, None))
+
+    # Shield so a caller timing out does not cancel the lookup for everyone else
+    return await asyncio.shield(task)
+
 session_containers = {}
 
+# UPLOAD_DIR of sandbox servers; tenant kernels of shared hosts each work in <dir>/<kernel id>
+SANDBOX_UPLOAD_DIR = os.environ.get("SANDBOX_UPLOAD_DIR", "/uploaded_files")
+
+def session_workdir(session_id):
+    """Where the session's kernel finds uploaded files"""
+    sandbox_id = session_containers.get(session_id)
+    kernel_id = split_sandbox_id(sandbox_id)[1] if sandbox_id else None
+    return f"{SANDBOX_UPLOAD_DIR}/{kernel_id}/" if kernel_id else f"{SANDBOX_UPLOAD_DIR}/"
+
 def get_sandbox_base_url():
 
+    # Explicit override, e.g. the benchmark harness running the API on another port
+    if os.environ.get("SANDBOX_API_URL"):
+        return os.environ["SANDBOX_API_URL"]
+
     if os.environ.get("IS_SANDBOX"):
         return "http://localhost:8000"
     
@@ -40,48 +129,76 @@ def get_sandbox_base_url():
     return "http://localhost:8000"
 
 
+async def session_sandbox(client, base_url, session_id):
+    """The session's sandbox id, creating the sandbox on first use"""
+    # Checking container for this session
+    if session_id not in session_containers:
+        log.info("Creating sandbox for new session", extra={"session_id": session_id})
+        # Create Container
+        sandbox_response = await client.post(
+            f"{base_url}/sandboxes",
+            json={"lang": "python", "session_id": session_id},
+            headers={'Content-Type': 'application/json'}
+        )
+        sandbox_response.raise_for_status()
+
+        # Get container ID
+        sandbox_data = sandbox_response.json()
+        session_containers[session_id] = sandbox_data.get('id')
+
+        await asyncio.sleep(2)
+
+    sandbox_id = session_containers[session_id]
+    annotate(session_id=session_id, sandbox_id=sandbox_id)
+    return sandbox_id
+
+def session_error(code):
+    return {
+        "code": code,
+        "outputs": [{
+            "output_type": "error", 
+            "ename": "SessionError",
+            "evalue": "No session ID provided",
+            "traceback": ["Error: Session ID required for code execution"]
+        }],
+        "success": False
+    }
+
+def batch_error(code, message):
+    return {
+        "code": code,
+        "cells": [],
+        "outputs": [{
+            "output_type": "error",
+            "ename": "ValueError",
+            "evalue": message,
+            "traceback": [f"Error: {message}"]
+        }],
+        "success": False
+    }
+
+def connection_error(code, e):
+    return {
+        "code": code,
+        "outputs": [{
+            "output_type": "error",
+            "ename": "ConnectionError" if "peer closed connection" in str(e) or "incomplete chunked read" in str(e) else "ExecutionError",
+            "evalue": str(e),
+            "traceback": [f"Sandbox connection error: {str(e)}"]
+        }],
+        "success": False
+    }
+
 async def python_interpreter(code, session_id=None):
 
-    print(f'Using Interpreter: {session_id}')
-    print(f"Num containers: {session_containers}")
-    
     if not session_id:
-        return {
-            "code": code,
-            "outputs": [{
-                "output_type": "error", 
-                "ename": "SessionError",
-                "evalue": "No session ID provided",
-                "traceback": ["Error: Session ID required for code execution"]
-            }],
-            "success": False
-        }
+        return session_error(code)
 
     try:
         base_url = get_sandbox_base_url()
-        print(f"Base Url: {base_url}")
-        async with httpx.AsyncClient(timeout=10000.0) as client:
+        async with httpx.AsyncClient(timeout=10000.0, event_hooks={"request": [inject_traceparent]}) as client:
             
-            # Checking container for this session
-            if session_id not in session_containers:
-                print(f"New Session ID: {session_id}")
-                # Create Container
-                sandbox_response = await client.post(
-                    f"{base_url}/sandboxes",
-                    json={"lang": "python"},
-                    headers={'Content-Type': 'application/json'}
-                )
-                sandbox_response.raise_for_status()
-
-                # Get container ID
-                sandbox_data = sandbox_response.json()
-                session_containers[session_id] = sandbox_data.get('id')
-
-                await asyncio.sleep(2)
-
-            sandbox_id = session_containers[session_id]
-            print(f"Executing in sandbox: {sandbox_id}")
-
+            sandbox_id = await session_sandbox(client, base_url, session_id)
             if not sandbox_id:
                 return {"error": "Failed to create sandbox"}
 
@@ -102,33 +219,113 @@ async def python_interpreter(code, session_id=None):
                 # print(result_text)
 
                 outputs = []
+                metadata = None
+                resized = None
                 for line in result_text.strip().split('\n'):
                     if line.strip():
                         try:
                             output = json.loads(line)
-                            outputs.append(output)
                         except json.JSONDecodeError as e:
-                            print(f"Error: {e}")
+                            log.warning("Undecodable output line", extra={"error": str(e)})
                             continue
+
+                        if output.get("output_type") == "execution_metadata":
+                            metadata = output
+                        elif output.get("output_type") == "sandbox_resized":
+                            # The API already moved the session; later calls go to the new sandbox
+                            resized = output
+                            session_containers[session_id] = output["sandbox_id"]
+                            outputs.append({"output_type": "stream", "name": "stderr", "text": output["text"] + "\n"})
+                        else:
+                            outputs.append(output)
                 
-                return {
+                result = {
                     "code": code, 
                     "outputs": outputs,
                     "success": True
                 }
+                if metadata is not None:
+                    result["metadata"] = metadata
+                if resized is not None:
+                    result["resized"] = resized
+                return result
             else:
                 return execute_response.json()
     except Exception as e:
-        return {
-            "code": code,
-            "outputs": [{
-                "output_type": "error",
-                "ename": "ConnectionError" if "peer closed connection" in str(e) or "incomplete chunked read" in str(e) else "ExecutionError",
-                "evalue": str(e),
-                "traceback": [f"Sandbox connection error: {str(e)}"]
-            }],
-            "success": False
-        }
+        return connection_error(code, e)
+
+async def python_batch(cells, stop_on_error=True, session_id=None):
+    """Several cells in one round trip (TOOL_BATCH=1); one result per cell, in order"""
+    if not isinstance(cells, list) or not all(isinstance(cell, str) for cell in cells):
+        return batch_error("", "cells must be a list of code strings")
+    code = "\n\n".join(cells)
+    if not cells:
+        return batch_error(code, "No cells to run")
+    if not session_id:
+        return session_error(code)
+
+    try:
+        base_url = get_sandbox_base_url()
+        async with httpx.AsyncClient(timeout=10000.0, event_hooks={"request": [inject_traceparent]}) as client:
+            sandbox_id = await session_sandbox(client, base_url, session_id)
+            if not sandbox_id:
+                return {"error": "Failed to create sandbox"}
+
+            execute_response = await client.post(
+                f"{base_url}/sandboxes/{sandbox_id}/execute_batch",
+                json={"cells": cells, "stop_on_error": stop_on_error},
+                headers={'Content-Type': 'application/json'}
+            )
+            execute_response.raise_for_status()
+
+            results = [{"cell": index, "code": cell, "outputs": [], "status": "skipped"} for index, cell in enumerate(cells)]
+            # Outputs not tied to a cell, e.g. the API's out-of-memory or resize notices
+            extra = []
+            summary = None
+            resized = None
+            for line in execute_response.text.strip().split('\n'):
+                if not line.strip():
+                    continue
+                try:
+                    output = json.loads(line)
+                except json.JSONDecodeError as e:
+                    log.warning("Undecodable output line", extra={"error": str(e)})
+                    continue
+
+                kind = output.get("output_type")
+                if kind == "batch_summary":
+                    summary = output
+                elif kind == "sandbox_resized":
+                    resized = output
+                    session_containers[session_id] = output["sandbox_id"]
+                elif not isinstance(output.get("cell"), int) or not 0 <= output["cell"] < len(results):
+                    output.pop("cell", None)
+                    extra.append(output)
+                else:
+                    result = results[output.pop("cell")]
+                    if kind == "cell_end":
+                        result["status"] = output["status"]
+                        result["seconds"] = output["seconds"]
+                    elif kind == "execution_metadata":
+                        result["metadata"] = output
+                    elif kind != "cell_start":
+                        result["outputs"].append(output)
+
+            if resized is not None:
+                extra.append({"output_type": "stream", "name": "stderr", "text": resized["text"] + "\n"})
+            result = {
+                "code": code,
+                "cells": results,
+                "outputs": [output for cell in results for output in cell["outputs"]] + extra,
+                "success": all(cell["status"] == "ok" for cell in results)
+            }
+            if summary is not None:
+                result["metadata"] = summary
+            if resized is not None:
+                result["resized"] = resized
+            return result
+    except Exception as e:
+        return connection_error(code, e)
 
 async def session_pod(session_id: str):
     if not session_id:
@@ -140,7 +337,7 @@ async def session_pod(session_id: str):
     from routers.sandbox import create_sandbox, CreateSandboxRequest
     
     try:
-        result = await create_sandbox(CreateSandboxRequest(lang="python"))
+        result = await create_sandbox(CreateSandboxRequest(lang="python", session_id=session_id))
         sandbox_id = result["id"]
         session_containers[session_id] = sandbox_id
         
@@ -148,5 +345,5 @@ async def session_pod(session_id: str):
         
         return sandbox_id
     except Exception as e:
-        print(f"Session pod creation failed: {e}")
+        log.warning("Session pod creation failed", extra={"session_id": session_id, "error": str(e)})
         raise e
\ No newline at end of file
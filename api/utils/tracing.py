@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import queue
+import random
+import logging
+import secrets
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import httpx
+
+# W3C trace context across chat -> tool -> API -> sandbox -> kernel. Spans are always created so
+# the context propagates; they are only exported when TRACE_EXPORT is set:
+#   file - one JSON span per line in TRACE_FILE
+#   otlp - OTLP/HTTP JSON to a local collector at OTEL_EXPORTER_OTLP_ENDPOINT
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+TRACE_FILE = os.environ.get("TRACE_FILE", "/tmp/caesarion-traces.jsonl")
+TRACE_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+# Fraction of new traces that are exported; continued traces follow the caller's sampled flag
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1"))
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "caesarion-api")
+EXPORT_BATCH = 512
+EXPORT_INTERVAL = 1.0
+
+TRACEPARENT = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+# Not utils.log.get_logger: utils.log imports this module for trace ids
+log = logging.getLogger("caesarion.tracing")
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "kind", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind="internal", attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.sampled and TRACE_EXPORT:
+            exporter.put(self)
+
+    def record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": SERVICE_NAME,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+def parse_traceparent(value):
+    """(trace id, parent span id, sampled) from a traceparent header, or None if malformed"""
+    match = TRACEPARENT.fullmatch((value or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+def start_span(name, traceparent=None, kind="internal", **attributes):
+    """A child of the given traceparent, else of the current span, else the root of a new trace"""
+    parent = parse_traceparent(traceparent) if traceparent else None
+    if parent is None and current_span.get() is not None:
+        current = current_span.get()
+        parent = current.trace_id, current.span_id, current.sampled
+    if parent is None:
+        parent = secrets.token_hex(16), None, random.random() < TRACE_SAMPLE_RATE
+    trace_id, parent_id, sampled = parent
+    return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+@contextmanager
+def span(name, traceparent=None, kind="internal", **attributes):
+    current = start_span(name, traceparent, kind, **attributes)
+    token = current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    finally:
+        current.end()
+        try:
+            current_span.reset(token)
+        except ValueError:
+            # Async generators can be finalized from another context
+            pass
+
+def traced(name):
+    """Run an async function inside its own span"""
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def traceparent():
+    current = current_span.get()
+    return current.traceparent if current is not None else None
+
+def trace_id():
+    current = current_span.get()
+    return current.trace_id if current is not None else None
+
+async def inject_traceparent(request):
+    """httpx request hook: carry the current trace to the next hop"""
+    value = traceparent()
+    if value is not None:
+        request.headers["traceparent"] = value
+
+class TraceMiddleware:
+    """ASGI middleware opening a server span per request, continuing the caller's traceparent.
+
+    Wraps the whole ASGI call, so the span covers streamed response bodies too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"traceparent", b"").decode("latin-1") or None
+        method = scope.get("method", "WS")
+
+        with span(f"{method} {scope['path']}", incoming, kind="server", path=scope["path"]) as current:
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    current.set(status=message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"traceparent", current.traceparent.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+def otlp_payload(spans):
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "caesarion"},
+            "spans": [
+                {
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                    "name": span.name,
+                    "kind": OTLP_KINDS.get(span.kind, 1),
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items()],
+                    "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+                }
+                for span in spans
+            ]
+        }]
+    }]}
+
+class SpanExporter:
+    """Ships finished spans from a background thread, in batches, so tracing stays off the event loop"""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, span):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="span-exporter", daemon=True)
+                    self.thread.start()
+        self.queue.put(span)
+
+    def run(self):
+        client = httpx.Client(timeout=5.0) if TRACE_EXPORT == "otlp" else None
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch, client)
+            except Exception as e:
+                log.warning("Exporting spans failed", extra={"spans": len(batch), "error": str(e)})
+
+    def export(self, batch, client):
+        if client is not None:
+            client.post(f"{TRACE_ENDPOINT.rstrip('/')}/v1/traces", json=otlp_payload(batch)).raise_for_status()
+            return
+        with open(TRACE_FILE, "a") as f:
+            f.write("".join(json.dumps(span.record()) + "\n" for span in batch))
+
+exporter = SpanExporter()
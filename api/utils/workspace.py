@@ -0,0 +1,77 @@
+import os
+import io
+import json
+import tarfile
+
+# The sandbox directory that is snapshotted and restored across sandbox lifetimes
+WORKSPACE_DIR = os.environ.get("UPLOAD_DIR", "/uploaded_files")
+SNAPSHOT_MAX_FILE_BYTES = int(os.environ.get("SNAPSHOT_MAX_FILE_BYTES", str(512 * 1024 * 1024)))
+# First member of every snapshot layer: {"manifest": {...}, "deleted": [...]}
+SNAPSHOT_META = ".snapshot.json"
+
+def scan(root=WORKSPACE_DIR):
+    """Map relative path -> [size, mtime_ns] for every regular file under root"""
+    manifest = {}
+    if not os.path.isdir(root):
+        return manifest
+
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            if name.endswith(".part") or os.path.islink(path):
+                continue
+            stat = os.stat(path)
+            if stat.st_size > SNAPSHOT_MAX_FILE_BYTES:
+                continue
+            manifest[os.path.relpath(path, root)] = [stat.st_size, stat.st_mtime_ns]
+    return manifest
+
+def add_meta(tar, manifest, deleted):
+    meta = json.dumps({"manifest": manifest, "deleted": deleted}).encode()
+    info = tarfile.TarInfo(SNAPSHOT_META)
+    info.size = len(meta)
+    tar.addfile(info, io.BytesIO(meta))
+
+def build_snapshot(fileobj, previous, root=WORKSPACE_DIR):
+    """Write a gzipped tar of files that changed since `previous`. Returns False if nothing changed."""
+    manifest = scan(root)
+    changed = [path for path, entry in manifest.items() if previous.get(path) != entry]
+    deleted = [path for path in previous if path not in manifest]
+    if not changed and not deleted:
+        return False
+
+    with tarfile.open(fileobj=fileobj, mode="w:gz") as tar:
+        add_meta(tar, manifest, deleted)
+        for path in changed:
+            tar.add(os.path.join(root, path), arcname=path, recursive=False)
+    return True
+
+def read_meta(tar):
+    member = tar.next()
+    if member is None or member.name != SNAPSHOT_META:
+        raise ValueError("Not a workspace snapshot")
+    return json.loads(tar.extractfile(member).read())
+
+def restore_snapshot(fileobj, root=WORKSPACE_DIR):
+    """Apply one snapshot layer on top of root. Layers must be applied oldest first."""
+    os.makedirs(root, exist_ok=True)
+    real_root = os.path.realpath(root)
+
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        meta = read_meta(tar)
+        for path in meta["deleted"]:
+            target = os.path.realpath(os.path.join(root, path))
+            if target.startswith(real_root + os.sep) and os.path.isfile(target):
+                os.remove(target)
+
+        for member in tar:
+            target = os.path.realpath(os.path.join(root, member.name))
+            if member.name == SNAPSHOT_META or not member.isfile() or not target.startswith(real_root + os.sep):
+                continue
+            # The data filter refuses links, devices and anything resolving outside root on its own
+            tar.extract(member, root, set_attrs=False, filter="data")
+            # Keep the recorded mtime so the next snapshot does not see every restored file as changed
+            mtime_ns = meta["manifest"].get(member.name, [0, int(member.mtime) * 10**9])[1]
+            os.utime(target, ns=(mtime_ns, mtime_ns))
+
+    return len(meta["manifest"])
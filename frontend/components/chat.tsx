@@ -71,6 +71,7 @@ export function Chat() {
     append,
     isLoading,
     stop,
+    data,
   } = useChat({
     maxSteps: 4,
     body: {
@@ -100,6 +101,16 @@ export function Chat() {
 
   });
 
+  // The API moves a session to a larger sandbox after an OOM kill; tell the user once per move
+  const [seenResizes, setSeenResizes] = useState(0);
+  useEffect(() => {
+    const resizes = (data ?? []).filter((item: any) => item?.type === "sandbox_resized");
+    if (resizes.length > seenResizes) {
+      resizes.slice(seenResizes).forEach((item: any) => toast.info(item.text ?? `Sandbox resized to ${item.to}`));
+      setSeenResizes(resizes.length);
+    }
+  }, [data, seenResizes]);
+
   const forceStop = () => {
     stop();
     setMessages(prev => prev.filter(msg => 
@@ -41,6 +41,33 @@ const ExecuteResultOutput: React.FC<OutputComponentProps> = ({ output }) => {
     );
   }
   
+  // Large binary payloads are served out of band from the artifact store
+  const artifacts = output.artifacts || {};
+  const artifactImage = ['image/png', 'image/jpeg', 'image/gif'].find((mime) => artifacts[mime]);
+  if (artifactImage) {
+    return (
+      <div className="flex justify-center p-3 bg-blue-50 rounded-lg border border-blue-200 shadow-sm overflow-x-auto">
+        <img
+          src={artifacts[artifactImage].url}
+          alt="Python output"
+          loading="lazy"
+          className="max-w-none h-auto rounded-lg"
+          style={{ maxWidth: 'none' }}
+        />
+      </div>
+    );
+  }
+
+  if (artifacts['application/pdf']) {
+    return (
+      <div className="p-3 bg-blue-50 rounded-lg border border-blue-200 shadow-sm text-sm text-gray-900">
+        <a href={artifacts['application/pdf'].url} target="_blank" rel="noreferrer" className="underline">
+          Open PDF output
+        </a>
+      </div>
+    );
+  }
+
   if (data['image/png']) {
     return (
       <div className="flex justify-center p-3 bg-blue-50 rounded-lg border border-blue-200 shadow-sm overflow-x-auto">